@@ -27,11 +27,12 @@ from .scheme import Scheme                   # noqa: E402
 from .elements import *                      # noqa: E402
 from .geometry import Geometry               # noqa: E402
 from . import viewer                         # noqa: E402
-from .hdf5 import H5File                     # noqa: E402
+from .hdf5 import H5File, H5OutputQueue      # noqa: E402
 from .options import options                 # noqa: E402
 from . import monitoring                     # noqa: E402
 from .analysis import EquivalentEquation, Stability  # noqa: E402
 from .utils import progress_bar              # noqa: E402
+from .autotune import autotune               # noqa: E402
 
 numeric_level = getattr(logging, options().loglevel, None)
 
@@ -5,4 +5,6 @@
 # License: BSD 3 clause
 
 from .base import BaseAlgorithm
-from .pull import PullAlgorithm
\ No newline at end of file
+from .pull import PullAlgorithm
+from .inplace import InPlaceAlgorithm, AAPatternAlgorithm, EsotericTwistAlgorithm
+from .sparse import SparsePullAlgorithm
@@ -63,18 +63,38 @@ Therefore, for our example we have
 
 """
 
+import sys
+import logging
+import numpy as np
 import sympy as sp
 from sympy import Eq
 
-from ..generator import For, If
-from ..symbolic import ix, iy, iz, nx, ny, nz, nv, indexed, space_idx, alltogether, recursive_sub
+from ..generator import For, If, MatrixProduct
+from ..symbolic import ix, iy, iz, iv_, nx, ny, nz, nv, indexed, space_idx, tile_idx, alltogether, recursive_sub
+from ..symbolic import nb, batch_idx, SymbolicVector
+from ..symbolic import ixmin, ixmax, iymin, iymax, izmin, izmax
 from ..symbolic import rel_ux, rel_uy, rel_uz
 from .transform import parse_expr
 from .ode import euler
-from ..monitoring import monitor
+from ..monitoring import Monitor, monitor
+from ..options import options
+
+log = logging.getLogger(__name__) #pylint: disable=invalid-name
 
 
 class BaseAlgorithm:
+    #: True if the algorithm streams in place with a single array
+    in_place = False
+    #: number of different time steps before the storage comes back
+    #: to its initial layout
+    nphases = 1
+    #: True if the time step can be computed on a box of the domain
+    #: (setting 'overlap')
+    box_time_step = True
+    #: True if the distribution functions are only stored on a list
+    #: of points given by compact_points (see CompactArray)
+    compact = False
+
     def __init__(self, scheme, sorder, generator, settings=None):
         xx, yy, zz = sp.symbols('xx, yy, zz')
         self.symb_coord_local = [xx, yy, zz]
@@ -111,6 +131,7 @@ class BaseAlgorithm:
         subs_moments = list(zip(scheme.consm.keys(), [self.mv[int(i), 0] for i in scheme.consm.values()]))
         to_subs = subs_coords + list(scheme.param.items())
         to_subs_full = to_subs + subs_moments
+        self.to_subs_full = to_subs_full
 
         self.eq = recursive_sub(scheme.EQ, to_subs_full)
         self.s = recursive_sub(scheme.s, to_subs_full)
@@ -136,6 +157,12 @@ class BaseAlgorithm:
         self.vmax[:scheme.dim] = scheme.stencil.vmax
         self.local_vars = self.symb_coord_local[:self.dim]
         self.settings = settings if settings else {}
+        self.batch = batch_idx() if self.settings.get('ensemble', False) else None
+        self.reductions = []
+        self.kernels = {}
+        self._restricted_f2m = {}
+        self._collision = None
+        self._residual_module = None
 
     def _get_space_idx_full(self):
         """
@@ -167,6 +194,60 @@ class BaseAlgorithm:
                           (self.vmax[2], nz-self.vmax[2])],
                          priority=self.sorder[1:])
 
+    def _get_space_idx_box(self):
+        """
+        Return a list of SymPy Idx ordered with sorder
+        and with the dimensions.
+
+            ix -> [ixmin, ixmax[
+            iy -> [iymin, iymax[
+            iz -> [izmin, izmax[
+
+        where the bounds are arguments of the generated code.
+        The length of the list is the dimension of the problem.
+        """
+        return space_idx([(ixmin, ixmax), (iymin, iymax), (izmin, izmax)],
+                         priority=self.sorder[1:])
+
+    def _get_loop_idx(self, space_index):
+        """
+        Return the list of the loop indices: the space indices
+        preceded by the index of the members if the simulation
+        is an ensemble.
+
+        Parameters
+        ----------
+
+        space_index : list
+            list of SymPy Idx corresponding to space variables
+
+        """
+        if self.batch is None:
+            return space_index
+        return [self.batch] + space_index
+
+    def _get_tiled_loop(self, space_index, body):
+        """
+        Return the loop over the space indices split in tiles if the
+        setting 'tiles' gives the size of the tiles in each direction
+        (only for the Cython and Numba generators).
+
+        Parameters
+        ----------
+
+        space_index : list
+            list of SymPy Idx corresponding to space variables
+
+        body : list
+            the statements of the loop
+
+        """
+        tiles = self.settings.get('tiles', None)
+        if not tiles or self.generator.backend not in ['CYTHON', 'NUMBA']:
+            return For(self._get_loop_idx(space_index), body)
+        loop_index, subs = tile_idx(space_index, tiles)
+        return For(self._get_loop_idx(loop_index), [e.xreplace(subs) for e in body])
+
     def _get_indexed_on_range(self, name, space_index):
         """
         Return a SymPy matrix of indexed objects
@@ -190,7 +271,8 @@ class BaseAlgorithm:
         """
         return indexed(name, [self.ns, nx, ny, nz],
                        [nv] + space_index,
-                       velocities_index=range(self.ns), priority=self.sorder)
+                       velocities_index=range(self.ns), priority=self.sorder,
+                       batch=self.batch, block=self._block(name))
 
     def _get_indexed_on_velocities(self, name, space_index, velocities):
         """
@@ -217,7 +299,18 @@ class BaseAlgorithm:
         """
         return indexed(name, [self.ns, nx, ny, nz],
                        [nv] + space_index,
-                       velocities=velocities, priority=self.sorder)
+                       velocities=velocities, priority=self.sorder,
+                       batch=self.batch, block=self._block(name))
+
+    def _block(self, name):
+        """
+        Return the size of the blocks of the AoSoA storage of the array name
+        given by the setting 'aosoa' (only the distribution functions are
+        stored by blocks) or None.
+        """
+        if name in ['f', 'fnew']:
+            return self.settings.get('aosoa', None)
+        return None
 
     def relative_velocity(self, m):
         rel_vel = sp.Matrix(self.rel_vel).subs(list(zip(self.mv, m)))
@@ -262,7 +355,72 @@ class BaseAlgorithm:
         space_index = self._get_space_idx_inner()
         f = self._get_indexed_on_velocities('f', space_index, -self.all_velocities)
         fnew = self._get_indexed_on_range('fnew', space_index)
-        return {'code': For(space_index, self.transport_local(f, fnew))}
+        return {'code': For(self._get_loop_idx(space_index), self.transport_local(f, fnew))}
+
+    def _velocity_slice(self, vector):
+        """
+        Return the indexed object which gathers all the components of
+        vector along the velocity axis and the index of this axis
+        (None if the components are not all the velocities of the same
+        points).
+
+        Parameters
+        ----------
+
+        vector : SymPy Matrix
+            indexed objects for each velocity
+
+        """
+        first = vector[0]
+        if not all(isinstance(v, sp.Indexed) and v.base == first.base for v in vector):
+            return None
+        axes = {i for v in vector for i, (a, b) in enumerate(zip(v.indices, first.indices)) if a != b}
+        if len(axes) != 1:
+            return None
+        axis = axes.pop()
+        if [v.indices[axis] for v in vector] != list(range(self.ns)):
+            return None
+        # the other axes must be ranges to get a view of the array
+        if not all(isinstance(i, sp.Idx) for a, i in enumerate(first.indices) if a != axis):
+            return None
+        k = sp.Idx(iv_, (0, self.ns))
+        indices = list(first.indices)
+        indices[axis] = k
+        return first.base[indices], k
+
+    def _matrix_product(self, name, matrix, lhs, rhs):
+        """
+        Return the symbolic expression of lhs = matrix*rhs as one product
+        over the velocity axis if the setting 'matrix_product' is True
+        (only for the NumPy generator) and None otherwise.
+
+        The numerical matrix is an argument of the routine called name.
+
+        Parameters
+        ----------
+
+        name : string
+            name of the argument for the matrix
+
+        matrix : SymPy Matrix
+            the matrix (must be numerical)
+
+        lhs : SymPy Matrix
+            indexed objects for the result
+
+        rhs : SymPy Matrix
+            indexed objects for the input
+
+        """
+        if not self.settings.get('matrix_product', False) or self.generator.backend != 'NUMPY':
+            return None
+        if matrix.free_symbols:
+            return None
+        lhs_slice, rhs_slice = self._velocity_slice(lhs), self._velocity_slice(rhs)
+        if lhs_slice is None or rhs_slice is None:
+            return None
+        out, k = lhs_slice
+        return Eq(out, MatrixProduct(sp.Symbol(name), rhs_slice[0], k))
 
     def f2m_local(self, f, m, with_rel_velocity=False):
         """
@@ -298,7 +456,8 @@ class BaseAlgorithm:
                     *self.relative_velocity(m),
                     Eq(m_notconsm, sp.Matrix((self.Mu*f)[nconsm:]))]
         else:
-            return Eq(m, self.M*f)
+            product = self._matrix_product('f2m_matrix', self.M, m, f)
+            return product if product is not None else Eq(m, self.M*f)
 
     def f2m(self):
         """
@@ -308,7 +467,19 @@ class BaseAlgorithm:
         space_index = self._get_space_idx_full()
         f = self._get_indexed_on_range('f', space_index)
         m = self._get_indexed_on_range('m', space_index)
-        return {'code': For(space_index, self.f2m_local(f, m))}
+        return {'code': For(self._get_loop_idx(space_index), self.f2m_local(f, m))}
+
+    def f2m_consm(self):
+        """
+        Return the code expression which computes only the conserved
+        moments from the distributed functions on the inner domain
+        (the moments read by the probes and the monitoring).
+        """
+        space_index = self._get_space_idx_inner()
+        f = self._get_indexed_on_range('f', space_index)
+        m = self._get_indexed_on_range('m', space_index)
+        code = [Eq(m[k], (self.M[k, :]*f)[0]) for k in range(len(self.consm))]
+        return {'code': For(self._get_loop_idx(space_index), code)}
 
     def m2f_local(self, m, f, with_rel_velocity=False):
         """
@@ -333,7 +504,8 @@ class BaseAlgorithm:
         if with_rel_velocity:
             return Eq(f, self.invMu*m)
         else:
-            return Eq(f, self.invM*m)
+            product = self._matrix_product('m2f_matrix', self.invM, f, m)
+            return product if product is not None else Eq(f, self.invM*m)
 
     def m2f(self):
         """
@@ -343,7 +515,7 @@ class BaseAlgorithm:
         space_index = self._get_space_idx_full()
         f = self._get_indexed_on_range('f', space_index)
         m = self._get_indexed_on_range('m', space_index)
-        return {'code': For(space_index, self.m2f_local(m, f))}
+        return {'code': For(self._get_loop_idx(space_index), self.m2f_local(m, f))}
 
     def equilibrium_local(self, m):
         """
@@ -366,7 +538,7 @@ class BaseAlgorithm:
         """
         space_index = self._get_space_idx_full()
         m = self._get_indexed_on_range('m', space_index)
-        return {'code': For(space_index, self.equilibrium_local(m))}
+        return {'code': For(self._get_loop_idx(space_index), self.equilibrium_local(m))}
 
     def relaxation_local(self, m, with_rel_velocity=False):
         """
@@ -398,7 +570,7 @@ class BaseAlgorithm:
         """
         space_index = self._get_space_idx_full()
         m = self._get_indexed_on_range('m', space_index)
-        return {'code': For(space_index, self.relaxation_local(m))}
+        return {'code': For(self._get_loop_idx(space_index), self.relaxation_local(m))}
 
     def source_term_local(self, m):
         """
@@ -427,8 +599,9 @@ class BaseAlgorithm:
             indices_str = ['ix_', 'iy_', 'iz_']
             lbm_ind = [ix, iy, iz]
             ind_to_subs = []
+            offset = 0 if self.batch is None else 1
             for i, sorder in enumerate(self.sorder[1:]):
-                indices.append(m[0].indices[sorder])
+                indices.append(m[0].indices[sorder + offset])
                 ind_to_subs.extend([(indices_str[i], indices[i]),
                                     (lbm_ind[i], indices[i]),
                                     ])
@@ -436,6 +609,7 @@ class BaseAlgorithm:
                           'consm': self.consm,
                           'sorder': self.sorder,
                           'default_index': indices,
+                          'batch': self.batch,
                           }
             for i, ind in enumerate(indices):
                 local_dict[indices_str[i]] = ind
@@ -460,7 +634,7 @@ class BaseAlgorithm:
         """
         space_index = self._get_space_idx_inner()
         m = self._get_indexed_on_range('m', space_index)
-        return {'code': For(space_index, self.source_term_local(m))}
+        return {'code': For(self._get_loop_idx(space_index), self.source_term_local(m))}
 
     def one_time_step_local(self, f, fnew, m):
         """
@@ -507,16 +681,213 @@ class BaseAlgorithm:
         code.append(self.m2f_local(m, fnew, with_rel_velocity))
         return code
 
+    def collision_matrix(self):
+        """
+        Return the matrix C and the vector c0 of the collision written
+        in the space of the distribution functions
+
+            f* = invM ((I - S) M f + S meq) = C f + c0
+
+        when the equilibrium meq is affine in the moments, the
+        relaxation rates and the relative velocity are constant and
+        there is no source term (None otherwise).
+        """
+        if self._collision is None:
+            self._collision = self._get_collision_matrix() or ()
+        return self._collision or None
+
+    def _get_collision_matrix(self):
+        if self.source_eq or self.s.free_symbols:
+            return None
+        nconsm = len(self.consm)
+        M, invM, eq = self.M, self.invM, sp.Matrix(list(self.eq))
+        if self.rel_vel_symb:
+            if self.rel_vel.free_symbols:
+                return None
+            rel_vel = list(zip(self.rel_vel_symb, self.rel_vel))
+            Mu, invM = self.Mu.subs(rel_vel), self.invMu.subs(rel_vel)
+            eq = (self.Tu*eq).subs(rel_vel)
+            # the conserved moments are computed with M and the others with Mu
+            M = M[:nconsm, :].col_join(Mu[nconsm:, :])
+
+        xs = sp.symbols('x0:%d'%self.ns)
+        eq = eq.subs(list(zip(self.mv, xs)))
+        if not eq.free_symbols <= set(xs):
+            return None
+        if any(not e.is_polynomial(*xs) or sp.Poly(e, *xs).total_degree() > 1 for e in eq if e != 0):
+            return None
+        S = sp.diag(*self.s)
+        relax = (sp.eye(self.ns) - S + S*eq.jacobian(xs))*M
+        relax0 = S*eq.subs({x: 0 for x in xs})
+        if self.rel_vel_symb:
+            # the conserved moments are restored with Mu
+            relax = Mu[:nconsm, :].col_join(relax[nconsm:, :])
+            relax0 = sp.zeros(nconsm, 1).col_join(relax0[nconsm:, :])
+        return invM*relax, invM*relax0
+
+    def _use_collision_matrix(self):
+        """
+        Return True if the time step uses the collision matrix.
+
+        The setting 'collision_matrix' can be False (default), True (the
+        equilibrium must be affine) or 'auto': the collision matrix is
+        used if it exists and if it needs fewer operations than the
+        computation of the moments, the relaxation and the computation
+        of the distribution functions.
+
+        When fnew shares its memory with f (in-place algorithms and numpy
+        generator), the distribution functions of a point must be copied
+        before the collision: the collision matrix is only used with the
+        setting 'm_local' so that the copy is not stored in the moments.
+        """
+        setting = self.settings.get('collision_matrix', False)
+        if not setting:
+            return False
+        collision = self.collision_matrix()
+        copy_in_moments = self._shared_f() and not self.settings.get('m_local', False)
+        if collision is None or copy_in_moments:
+            if setting == 'auto':
+                return False
+            if copy_in_moments:
+                log.error("%s: the collision matrix needs the setting 'm_local' when fnew shares its memory with f",
+                          self.__class__.__name__)
+            else:
+                log.error('%s: the collision matrix needs an equilibrium affine in the moments, '
+                          'constant relaxation rates, no source term and a constant (or no) relative velocity',
+                          self.__class__.__name__)
+            sys.exit()
+        if setting != 'auto':
+            return True
+
+        f = SymbolicVector(sp.symbols('f0:%d'%self.ns))
+        fnew = SymbolicVector(sp.symbols('fnew0:%d'%self.ns))
+        m = SymbolicVector(sp.symbols('m0:%d'%self.ns))
+        fused = sum(sp.count_ops(e.rhs) for e in self.collision_local(f, fnew, m))
+        moments = sum(sp.count_ops(e.rhs) for e in self.one_time_step_local(f, fnew, m))
+        return fused < moments
+
+    def _shared_f(self):
+        """
+        Return True if fnew shares its memory with f.
+        """
+        return self.in_place or self.generator.backend == 'NUMPY'
+
+    def collision_local(self, f, fnew, m):
+        """
+        Return symbolic expression which makes one time step of
+        LBM algorithm with the collision matrix:
+
+            - transport
+            - fnew = C f + c0
+
+        f is first copied in m when fnew shares its memory with f.
+
+        Parameters
+        ----------
+
+        f : SymPy Matrix
+            indexed objects for the old distributed functions
+
+        fnew : SymPy Matrix
+            indexed objects for the new distributed functions
+
+        m : SymPy Matrix
+            indexed objects used as temporaries
+
+        """
+        C, c0 = self.collision_matrix()
+        code = []
+        if self._shared_f():
+            code.append(Eq(m, f))
+            f = m
+        if any(c0):
+            return code + [Eq(fnew, C*f + c0)]
+        return code + [Eq(fnew, C*f)]
+
+    def reduction_local(self, m):
+        """
+        Return the symbolic expressions of the reductions
+        (expressions of the conserved moments) for the moments m.
+
+        Parameters
+        ----------
+
+        m : SymPy Matrix
+            indexed objects for the moments
+
+        """
+        reductions = []
+        for expr in self.reductions:
+            expr = recursive_sub(sp.sympify(expr), self.to_subs_full)
+            reductions.append(expr.subs(list(zip(self.mv, m))))
+        return reductions
+
     def one_time_step(self):
         """
         Return the code expression which  makes one time step of
         LBM algorithm on the whole inner domain.
         """
+        return self._one_time_step()
+
+    def one_time_step_reduce(self):
+        """
+        Return the code expression which makes one time step of
+        LBM algorithm on the whole inner domain and which sums
+        the reductions over the fluid points.
+
+        The sums are accumulated in the array reduction which must
+        be set to zero before the call.
+        """
+        return self._one_time_step(reduce=True)
+
+    def one_time_step_box(self):
+        """
+        Return the code of the time step on the box of the points
+        [ixmin, ixmax[ x [iymin, iymax[ x [izmin, izmax[
+        (setting 'overlap': the interior of the domain is computed
+        during the exchange of the halo points).
+        """
+        return self._one_time_step(box=True)
+
+    def one_time_step_reduce_box(self):
+        """
+        Return the code of the time step with the reductions
+        on a box of the points.
+        """
+        return self._one_time_step(reduce=True, box=True)
+
+    def _get_streaming_indexed(self, space_index, phase=0): #pylint: disable=unused-argument
+        """
+        Return the indexed objects read and written by one time step.
+
+        Parameters
+        ----------
+
+        space_index : list
+            list of SymPy Idx corresponding to space variables
+
+        phase : int
+            the phase of the time step (default is 0)
+
+        Return
+        ------
+
+        f : SymPy Matrix
+            the distribution functions read at the points x - v
+        fnew : SymPy Matrix
+            the distribution functions written at the points x
+
+        """
+        f = self._get_indexed_on_velocities('f', space_index, -self.all_velocities)
+        fnew = self._get_indexed_on_range('fnew', space_index)
+        return f, fnew
+
+    def _one_time_step(self, reduce=False, phase=0, box=False):
         m_local = self.settings.get('m_local', False)
         check_isfluid = self.settings.get('check_isfluid', False)
         split = self.settings.get('split', False)
 
-        space_index = self._get_space_idx_inner()
+        space_index = self._get_space_idx_box() if box else self._get_space_idx_inner()
         if m_local:
             if split:
                 m = self._get_indexed_on_range('m', space_index)
@@ -531,18 +902,32 @@ class BaseAlgorithm:
         if self.rel_vel_symb:
             local_vars.extend(self.rel_vel_symb)
 
-        f = self._get_indexed_on_velocities('f', space_index, -self.all_velocities)
-        fnew = self._get_indexed_on_range('fnew', space_index)
+        f, fnew = self._get_streaming_indexed(space_index, phase)
 
-        internal = self.one_time_step_local(f, fnew, m)
+        # the reductions need the moments
+        if not reduce and self._use_collision_matrix():
+            internal = self.collision_local(f, fnew, m)
+        else:
+            internal = self.one_time_step_local(f, fnew, m)
+
+        valin = sp.Symbol('valin', real=True)
+        in_or_out = indexed('in_or_out', [nx, ny, nz], space_index,
+                            priority=self.sorder[1:])
+
+        if reduce:
+            if self.batch is None:
+                reduction = sp.IndexedBase('reduction', [len(self.reductions)])
+                store = [reduction[i] for i in range(len(self.reductions))]
+            else:
+                reduction = sp.IndexedBase('reduction', [nb, len(self.reductions)])
+                store = [reduction[self.batch, i] for i in range(len(self.reductions))]
+            internal.append(If((Eq(in_or_out, valin),
+                                [Eq(r, r + e) for r, e in zip(store, self.reduction_local(m))])))
 
         if check_isfluid:
-            valin = sp.Symbol('valin', real=True)
-            in_or_out = indexed('in_or_out', [nx, ny, nz], space_index,
-                                priority=self.sorder[1:])
-            loop = lambda x: For(space_index, If((Eq(in_or_out, valin), x)))
+            loop = lambda x: self._get_tiled_loop(space_index, [If((Eq(in_or_out, valin), x))])
         else:
-            loop = lambda x: For(space_index, x)
+            loop = lambda x: self._get_tiled_loop(space_index, x)
 
         if split:
             # code = [loop([*self.coords(), i]) for i in internal]
@@ -551,7 +936,11 @@ class BaseAlgorithm:
             # code = loop([*self.coords(), *internal])
             code = loop([*internal])
 
-        return {'code': code, 'local_vars': local_vars+self.local_vars, 'settings':{"prefetch":[f[0]]}}
+        # the sums of the reductions are shared: the loop can't be parallel
+        settings = {"prefetch": [f[0]], "parallel": not reduce,
+                    "block_size": self.settings.get('block_size', None),
+                    "double_arrays": ['reduction']}
+        return {'code': code, 'local_vars': local_vars+self.local_vars, 'settings': settings}
 
     @monitor
     def generate(self):
@@ -570,6 +959,31 @@ class BaseAlgorithm:
         if self.source_eq:
             to_generate.append(self.source_term)
 
+        if self.reductions:
+            to_generate.append(self.one_time_step_reduce)
+
+        if self.consm:
+            to_generate.append(self.f2m_consm)
+
+        if self.settings.get('overlap', False):
+            to_generate.append(self.one_time_step_box)
+            if self.reductions:
+                to_generate.append(self.one_time_step_reduce_box)
+
+        self._add_routines(to_generate)
+
+    def _add_routines(self, to_generate):
+        """
+        Add the routines to the code generator.
+
+        Parameters
+        ----------
+
+        to_generate : list
+            the methods which return the code of each routine
+            (the name of the routine is the name of the method)
+
+        """
         for gen in to_generate:
             name = gen.__name__
             output = gen()
@@ -587,6 +1001,7 @@ class BaseAlgorithm:
         else:
             mm = simulation.container.m
         m = mm.array
+        nb = mm.nbatch
 
         dim = len(mm.nspace)
         nx = mm.nspace[0]
@@ -604,21 +1019,364 @@ class BaseAlgorithm:
             f = simulation.container.F.array
         fnew = simulation.container.Fnew.array
 
+        # the box of the time step (given at each call)
+        ixmin = ixmax = iymin = iymax = izmin = izmax = 0
+
         t = simulation.t
         dt = simulation.dt
         in_or_out = simulation.domain.in_or_out
         valin = simulation.domain.valin
+        reduction = simulation.probes.reduction
+
+        if self.settings.get('matrix_product', False) and not self.M.free_symbols:
+            f2m_matrix = np.array(self.M.tolist(), dtype=fnew.dtype)
+            m2f_matrix = np.array(self.invM.tolist(), dtype=fnew.dtype)
 
         return locals()
 
+    def restricted_f2m(self, rows):
+        """
+        Return a function which computes only the moments of index rows
+        from the distribution functions.
+
+        The function is called as f2m(f, m) where f and m are the lists of
+        the arrays of each distribution function and of each moment
+        (typically views on the interior domain). The functions are cached
+        per subset of moments with a scratch array for the products by the
+        coefficients of M. The conserved moments are computed by the
+        generated function f2m_consm instead.
+
+        Return None if the restricted computation is not possible:
+        non conserved moments with a relative velocity or
+        a matrix M which is not numeric.
+
+        Parameters
+        ----------
+
+        rows : list
+            the indices of the moments to compute
+
+        """
+        rows = tuple(sorted(set(rows)))
+        if rows not in self._restricted_f2m:
+            self._restricted_f2m[rows] = self._get_restricted_f2m(rows)
+        return self._restricted_f2m[rows]
+
+    def _get_restricted_f2m(self, rows):
+        if self.rel_vel_symb and max(rows) >= len(self.consm):
+            return None
+        try:
+            matrix = np.array(self.M.tolist(), dtype=np.double)
+        except TypeError:
+            return None
+
+        coefficients = []
+        for k in rows:
+            nonzero = np.nonzero(matrix[k])[0]
+            coefficients.append([(j, matrix[k, j]) for j in nonzero])
+
+        scratch = []
+
+        def f2m(f, m):
+            if not scratch or scratch[0].shape != f[0].shape or scratch[0].dtype != f[0].dtype:
+                scratch[:] = [np.empty_like(f[0])]
+            tmp = scratch[0]
+            for k, coefs in zip(rows, coefficients):
+                mk = m[k]
+                if not coefs:
+                    mk[...] = 0
+                    continue
+                j, coef = coefs[0]
+                np.multiply(f[j], coef, out=mk)
+                for j, coef in coefs[1:]:
+                    if coef == 1:
+                        mk += f[j]
+                    elif coef == -1:
+                        mk -= f[j]
+                    else:
+                        np.multiply(f[j], coef, out=tmp)
+                        mk += tmp
+        return f2m
+
+    def residual(self):
+        """
+        Return the code expression which computes the conserved moments
+        on the inner domain and which sums over the fluid points the squares
+        of their variations since the previous call and the squares of their
+        values, weighted by the array weights (one weight by conserved moment).
+
+        The two sums are accumulated in double precision in the array residual
+        which must be set to zero before the call and the moments are stored
+        in the array mprev for the next call.
+        """
+        nconsm = len(self.consm)
+        space_index = self._get_space_idx_inner()
+        f = self._get_indexed_on_range('f', space_index)
+        mprev = indexed('mprev', [nconsm, nx, ny, nz], [nv] + space_index,
+                        velocities_index=range(nconsm), priority=self.sorder,
+                        batch=self.batch)
+        weights = sp.IndexedBase('weights', [nconsm])
+        valin = sp.Symbol('valin', real=True)
+        in_or_out = indexed('in_or_out', [nx, ny, nz], space_index,
+                            priority=self.sorder[1:])
+        if self.batch is None:
+            residual = sp.IndexedBase('residual', [2])
+            store = [residual[0], residual[1]]
+        else:
+            residual = sp.IndexedBase('residual', [nb, 2])
+            store = [residual[self.batch, 0], residual[self.batch, 1]]
+
+        m = [sp.Symbol('mres_%d'%k, real=True) for k in range(nconsm)]
+        code = [Eq(mk, (self.M[k, :]*f)[0]) for k, mk in enumerate(m)]
+        diff = sum(weights[k]*(mk - mprev[k])**2 for k, mk in enumerate(m))
+        norm = sum(weights[k]*mk**2 for k, mk in enumerate(m))
+        code.append(If((Eq(in_or_out, valin),
+                        [Eq(store[0], store[0] + diff), Eq(store[1], store[1] + norm)])))
+        code += [Eq(mprev[k], mk) for k, mk in enumerate(m)]
+        # the sums are shared: the loop can't be parallel
+        settings = {"double_arrays": ['residual', 'weights']}
+        return {'code': For(self._get_loop_idx(space_index), code), 'local_vars': m,
+                'settings': settings}
+
+    def bind_residual(self, simulation, mprev, residual, weights):
+        """
+        Bind the generated function of the residual to the arrays
+        of the simulation and to the given arrays.
+
+        The function is compiled in its own module at the first call
+        since the residual is only computed on request. The module is
+        then shared by all the residuals of the simulation.
+
+        Parameters
+        ----------
+
+        simulation : Simulation
+            the simulation
+        mprev : ndarray
+            the conserved moments of the previous call
+        residual : ndarray
+            the array where the two sums are accumulated
+        weights : ndarray
+            the weight of each conserved moment
+
+        """
+        from ..generator import Generator
+        from ..symbolic import BoundKernel
+        if self._residual_module is None:
+            generator = self.generator
+            residual_generator = Generator(generator.backend, generator.directory,
+                                           generator.verbose, generator.dtype,
+                                           generator.compute_dtype, generator.num_threads)
+            output = self.residual()
+            residual_generator.add_routine(('residual', output['code']),
+                                           local_vars=output['local_vars'],
+                                           settings=output['settings'])
+            residual_generator.compile()
+            self._residual_module = residual_generator.module
+        args = self._get_args(simulation)
+        args.update({'mprev': mprev, 'residual': residual, 'weights': weights})
+        return BoundKernel(self._residual_module.residual, args,
+                           num_threads=self.generator.num_threads)
+
+    def layout(self, phase): #pylint: disable=unused-argument, no-self-use
+        """
+        Return the layout of the distribution functions read by the
+        time step of the given phase.
+
+        The layout is a tuple (slots, shifts): the distribution function i
+        of the point x is stored in the slot slots[i] of the point
+        x + shifts[i]. None means the natural layout
+        (slots[i] = i and shifts[i] = 0).
+
+        Parameters
+        ----------
+
+        phase : int
+            the phase of the time step
+
+        """
+        return None
+
+    def slot_shifts(self, phase):
+        """
+        Return the shift of each slot in the layout of the given phase
+        (None for the natural layout). It is used to update the
+        interfaces between the processes.
+
+        Parameters
+        ----------
+
+        phase : int
+            the phase of the time step
+
+        """
+        layout = self.layout(phase)
+        if layout is None:
+            return None
+        slots, shifts = layout
+        out = np.empty_like(shifts)
+        out[slots] = shifts
+        return out
+
+    def kernel_name(self, name, phase): #pylint: disable=unused-argument, no-self-use
+        """
+        Return the name of the generated function used for the given phase.
+
+        Parameters
+        ----------
+
+        name : str
+            the name of the function for the phase 0
+        phase : int
+            the phase of the time step
+
+        """
+        return name
+
+    def to_natural(self, f, phase):
+        """
+        Put the distribution functions stored with the layout of the
+        given phase in the natural layout (only the inner points).
+
+        Parameters
+        ----------
+
+        f : Array
+            the distribution functions
+        phase : int
+            the phase of the current layout
+
+        """
+        self._permute(f, phase, True)
+
+    def from_natural(self, f, phase):
+        """
+        Put the distribution functions stored with the natural layout
+        in the layout of the given phase (only the inner points).
+
+        Parameters
+        ----------
+
+        f : Array
+            the distribution functions
+        phase : int
+            the phase of the new layout
+
+        """
+        self._permute(f, phase, False)
+
+    def _permute(self, f, phase, to_natural):
+        layout = self.layout(phase)
+        if layout is None:
+            return
+        slots, shifts = layout
+
+        def view(slot, shift):
+            ind = tuple(slice(v + s, n - v + s) for v, s, n in zip(f.vmax, shift, f.nspace))
+            return f[int(slot)][(Ellipsis,) + ind]
+
+        zero = [0]*len(f.nspace)
+        # the permutation of the slots is made cycle by cycle with
+        # only one temporary array for each cycle
+        visited = np.zeros(len(slots), dtype=bool)
+        for start in range(len(slots)):
+            if visited[start]:
+                continue
+            cycle = [start]
+            visited[start] = True
+            while not visited[slots[cycle[-1]]]:
+                cycle.append(slots[cycle[-1]])
+                visited[cycle[-1]] = True
+
+            if to_natural:
+                # the slot i receives the values stored in slots[i]
+                tmp = view(slots[cycle[0]], shifts[cycle[0]]).copy()
+                for i in cycle[1:]:
+                    view(i, zero)[...] = view(slots[i], shifts[i])
+                view(cycle[0], zero)[...] = tmp
+            else:
+                # the slot slots[i] receives the values of the slot i
+                tmp = view(cycle[-1], zero).copy()
+                for i in cycle[-2::-1]:
+                    view(slots[i], shifts[i])[...] = view(i, zero)
+                view(slots[cycle[-1]], shifts[cycle[-1]])[...] = tmp
+
+    def bind(self, simulation, function_name):
+        """
+        Bind the generated function to the arrays of the simulation.
+
+        The arguments are resolved once and the kernel keeps
+        direct references to the arrays.
+        """
+        kernel = self.bind_arrays(simulation, function_name)
+        self.kernels[function_name] = kernel
+        return kernel
+
+    def bind_arrays(self, simulation, function_name, m_user=None, f_user=None):
+        """
+        Bind the generated function to the arrays of the simulation
+        or to the arrays given by the user.
+
+        The kernel is not kept by the algorithm: it is not modified
+        when F and Fnew are swapped.
+
+        Parameters
+        ----------
+
+        simulation : Simulation
+            the simulation
+        function_name : str
+            the name of the generated function
+        m_user : Array, optional
+            the moments used instead of the moments of the simulation
+        f_user : Array, optional
+            the distribution functions used instead of F
+
+        """
+        from ..symbolic import BoundKernel
+        function = getattr(self.generator.module, function_name)
+        nodes = None
+        if options().monitoring and function_name in self.generator.routines:
+            Monitor.set_cost(function, *self.generator.cost(function_name))
+            nodes = self.generator.routines[function_name].nodes()
+        return BoundKernel(function, self._get_args(simulation, m_user, f_user), nodes,
+                           self.generator.num_threads)
+
+    def swap(self, first, second):
+        """
+        Exchange the references to the arrays first and second
+        in the bound kernels (used when F and Fnew are swapped).
+        """
+        for kernel in self.kernels.values():
+            kernel.swap(first, second)
+
     def call_function(self, function_name, simulation,
                       m_user=None, f_user=None, **kwargs):
         """
         Call the generated function.
+
+        The arrays modified on the host are transferred to the device
+        before the call and are marked as modified on the device after
+        (GPU backend).
         """
-        from ..symbolic import call_genfunction
-        func = getattr(self.generator.module, function_name)
+        container = simulation.container
+        arrays = [m_user or container.m, f_user or container.F, container.Fnew]
+        for array in arrays:
+            array.sync_device()
+
+        if m_user is None and f_user is None:
+            kernel = self.kernels.get(function_name, None)
+            if kernel is None:
+                kernel = self.bind(simulation, function_name)
+            kernel.set('t', simulation.t)
+            kernel(**kwargs)
+        else:
+            from ..symbolic import call_genfunction
+            func = getattr(self.generator.module, function_name)
+
+            args = self._get_args(simulation, m_user, f_user)
+            args.update(kwargs)
+            call_genfunction(func, args, self.generator.num_threads)
 
-        args = self._get_args(simulation, m_user, f_user)
-        args.update(kwargs)
-        call_genfunction(func, args)
+        for array in arrays:
+            array.modified_on_device()
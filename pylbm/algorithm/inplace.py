@@ -0,0 +1,162 @@
+# Authors:
+#     Loic Gouarin <loic.gouarin@polytechnique.edu>
+#     Benjamin Graille <benjamin.graille@math.u-psud.fr>
+#
+# License: BSD 3 clause
+
+"""
+In-place lattice Boltzmann algorithms
+=====================================
+
+These algorithms stream the distribution functions in place:
+only one array is needed to store the distribution functions
+instead of the two arrays F and Fnew of the pull algorithm.
+
+The time steps alternate between two phases. A time step reads the
+distribution functions with the layout of its phase and writes them
+with the layout of the other phase in the same memory locations, so
+that the points can be computed in any order.
+
+"""
+
+import sys
+import logging
+import numpy as np
+
+from .pull import PullAlgorithm
+from ..symbolic import nx, ny, nz, indexed, SymbolicVector
+
+log = logging.getLogger(__name__) #pylint: disable=invalid-name
+
+
+class InPlaceAlgorithm(PullAlgorithm):
+    """
+    Base class of the algorithms which stream in place.
+
+    The derived classes define the two layouts with the method layout.
+    The time step of the phase p reads the distribution functions with
+    the layout p and writes them with the layout 1 - p.
+    """
+    in_place = True
+    box_time_step = False
+    nphases = 2
+
+    def __init__(self, scheme, sorder, generator, settings=None):
+        super(InPlaceAlgorithm, self).__init__(scheme, sorder, generator, settings)
+        try:
+            self.ksym = scheme.stencil.get_symmetric()
+        except ValueError:
+            log.error('%s: the velocities of the stencil must be symmetric', self.__class__.__name__)
+            sys.exit()
+        self.velocities = np.asarray(self.all_velocities, dtype=np.int64).reshape(self.ns, -1)
+
+    def kernel_name(self, name, phase):
+        if phase % 2:
+            return name + '_odd'
+        return name
+
+    def _get_indexed_on_layout(self, name, space_index, layout, velocities=None):
+        """
+        Return a SymPy matrix of indexed objects with the given layout
+        (one component for each velocity).
+
+        Parameters
+        ----------
+
+        name : string
+            name of the SymPy symbol for the indexed object
+
+        space_index : list
+            list of SymPy Idx corresponding to space variables
+
+        layout : tuple
+            (slots, shifts) or None for the natural layout
+
+        velocities : ndarray
+            the distribution function i is taken at the point
+            x + velocities[i] (default is None)
+
+        """
+        if layout is None:
+            slots, shifts = np.arange(self.ns), np.zeros((self.ns, self.dim), dtype=np.int64)
+        else:
+            slots, shifts = layout
+        if velocities is not None:
+            shifts = shifts + velocities
+
+        output = []
+        for slot, shift in zip(slots, shifts):
+            index = [int(slot)] + [i + int(s) for i, s in zip(space_index, shift)]
+            output.append(indexed(name, [self.ns, nx, ny, nz], index,
+                                  priority=self.sorder, batch=self.batch))
+        return SymbolicVector(output)
+
+    def _get_streaming_indexed(self, space_index, phase=0):
+        f = self._get_indexed_on_layout('f', space_index, self.layout(phase), -self.velocities)
+        fnew = self._get_indexed_on_layout('f', space_index, self.layout(phase + 1))
+        return f, fnew
+
+    def one_time_step_odd(self):
+        """
+        Return the code expression which makes one time step of
+        the phase 1 on the whole inner domain.
+        """
+        return self._one_time_step(phase=1)
+
+    def one_time_step_reduce_odd(self):
+        """
+        Return the code expression which makes one time step of
+        the phase 1 on the whole inner domain and which sums
+        the reductions over the fluid points.
+        """
+        return self._one_time_step(reduce=True, phase=1)
+
+    def generate(self):
+        super(InPlaceAlgorithm, self).generate()
+        to_generate = [self.one_time_step_odd]
+        if self.reductions:
+            to_generate.append(self.one_time_step_reduce_odd)
+        self._add_routines(to_generate)
+
+
+class AAPatternAlgorithm(InPlaceAlgorithm):
+    """
+    In-place streaming with the AA-pattern.
+
+    - phase 0 reads the natural layout: the distribution function i of the
+      point x is read at the point x - v_i and the new one is written in
+      the slot of the opposite velocity at the point x + v_i.
+    - phase 1 only uses the slots of the point x: it reads the slots of the
+      opposite velocities and writes the natural layout.
+
+    After an even number of time steps, the distribution functions are
+    in the natural layout.
+    """
+    def layout(self, phase):
+        if phase % 2 == 0:
+            return None
+        return self.ksym, self.velocities
+
+
+class EsotericTwistAlgorithm(InPlaceAlgorithm):
+    """
+    In-place streaming with the esoteric twist.
+
+    The distribution functions of the velocities with a positive first
+    non zero component are stored at the point x + v_i, the other ones at
+    the point x. Each time step only uses the slots of the point x and of
+    its neighbors in the positive directions, and swaps the slots of the
+    opposite velocities (the twist).
+
+    The layouts of both phases differ from the natural layout: they are
+    converted when the moments or the distribution functions are read.
+    """
+    def layout(self, phase):
+        positive = np.zeros(self.ns, dtype=bool)
+        for i, v in enumerate(self.velocities):
+            nonzero = v[v != 0]
+            positive[i] = nonzero.size > 0 and nonzero[0] > 0
+        shifts = self.velocities*positive[:, np.newaxis]
+        if phase % 2 == 0:
+            return np.arange(self.ns), shifts
+        return self.ksym, shifts
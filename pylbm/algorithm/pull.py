@@ -36,11 +36,16 @@ class PullAlgorithm(BaseAlgorithm):
         """
         with_rel_velocity = True if self.rel_vel_symb else False
 
-        f2m = self.f2m_local(f, m, with_rel_velocity)
-        if isinstance(f2m, list):
-            code = f2m
+        if not with_rel_velocity and self._matrix_product('f2m_matrix', self.M, m, fnew) is not None:
+            # the moments are computed by one matrix product
+            # on the distribution functions once transported
+            code = [self.transport_local(f, fnew), self.f2m_local(fnew, m)]
         else:
-            code = [f2m]
+            f2m = self.f2m_local(f, m, with_rel_velocity)
+            if isinstance(f2m, list):
+                code = f2m
+            else:
+                code = [f2m]
 
         if self.source_eq:
             code.extend(self.source_term_local(m))
@@ -0,0 +1,303 @@
+# Authors:
+#     Loic Gouarin <loic.gouarin@polytechnique.edu>
+#     Benjamin Graille <benjamin.graille@math.u-psud.fr>
+#
+# License: BSD 3 clause
+
+"""
+Lattice Boltzmann algorithm on a list of fluid points
+=====================================================
+
+The time step of the pull algorithm visits every point of the
+interior domain. For porous geometries where most of the points are
+solid, SparsePullAlgorithm only visits the fluid points and only
+stores the distribution functions of the points it uses.
+
+The distribution functions are stored on a list of points (see
+CompactArray): the fluid points of the interior domain first, then
+the ghost points, i.e. the other points read by the time step (the
+neighbors x - v_k of the fluid points, halo points included) or read
+and written by the boundary conditions. The neighbors of each fluid
+point are precomputed as indices in this list, so that the
+distribution functions are read by indirect addressing.
+
+The moments are still stored on the whole grid: the kernels which
+compute the moments from the distribution functions (and conversely)
+loop over the list and use the coordinates of its points.
+
+"""
+
+import sys
+import logging
+import numpy as np
+import sympy as sp
+
+from .pull import PullAlgorithm
+from ..generator import For
+from ..storage import CompactArray
+from ..symbolic import nb, indexed, set_order, SymbolicVector
+
+log = logging.getLogger(__name__) #pylint: disable=invalid-name
+
+nfluid, npoints = sp.symbols('nfluid, npoints', integer=True) #pylint: disable=invalid-name
+
+
+class SparsePullAlgorithm(PullAlgorithm):
+    """
+    Pull algorithm where the distribution functions are stored on
+    a list of points and where the time step loops over the fluid
+    points of the interior domain.
+
+    The list is built from the array in_or_out of the domain and from the
+    indices of the boundary conditions: points[p] gives the indices (with
+    the halo points) of the point p of the list (the nfluid first points
+    are the fluid points) and neighbors[k, p] the position in the list of
+    the point points[p] - v_k.
+    """
+    box_time_step = False
+    #: the distribution functions are stored on the points of the list
+    compact = True
+
+    def __init__(self, scheme, sorder, generator, settings=None):
+        super(SparsePullAlgorithm, self).__init__(scheme, sorder, generator, settings)
+        if generator.backend == 'LOOPY':
+            log.error('%s: the loopy generator is not supported', self.__class__.__name__)
+            sys.exit()
+        if self.source_eq:
+            log.error('%s: the source terms are not supported', self.__class__.__name__)
+            sys.exit()
+        if self.settings.get('aosoa', None) is not None:
+            log.error('%s: the AoSoA storage is not supported', self.__class__.__name__)
+            sys.exit()
+        self._fluid = None
+        self._points = None
+        self._neighbors = None
+
+    def fluid_nodes(self, domain):
+        """
+        Return the indices (with the halo points) of the fluid
+        points of the interior domain.
+
+        Parameters
+        ----------
+
+        domain : Domain
+            the domain of the simulation
+
+        Return
+        ------
+
+        ndarray
+            array of shape (nfluid, dim)
+
+        """
+        if self._fluid is None:
+            vmax = domain.stencil.vmax
+            inner = tuple(slice(v, -v) for v in vmax)
+            is_fluid = domain.in_or_out[inner] == domain.valin
+            fluid = np.asarray(np.nonzero(is_fluid), dtype=np.int32).T + np.asarray(vmax, dtype=np.int32)
+            self._fluid = np.ascontiguousarray(fluid)
+        return self._fluid
+
+    def compact_points(self, domain, indices=()):
+        """
+        Return the indices (with the halo points) of the points where
+        the distribution functions are stored: the fluid points of the
+        interior domain first and then the ghost points sorted in the
+        order of the grid.
+
+        The ghost points are the neighbors x - v_k of the fluid points x
+        and the given points (the points of the boundary conditions)
+        which are not fluid points.
+
+        Parameters
+        ----------
+
+        domain : Domain
+            the domain of the simulation
+
+        indices : list
+            arrays of shape (dim, n) of the other points to store
+
+        Return
+        ------
+
+        ndarray
+            array of shape (npoints, dim)
+
+        """
+        if self._points is None:
+            fluid = self.fluid_nodes(domain)
+            shape = domain.in_or_out.shape
+            velocities = np.asarray(self.all_velocities, dtype=np.int32).reshape(self.ns, 1, -1)
+            used = [(fluid[np.newaxis] - velocities).reshape(-1, self.dim).T]
+            used += [np.asarray(index)[:self.dim] for index in indices]
+            used = np.unique(np.concatenate([np.ravel_multi_index(tuple(index), shape) for index in used]))
+            ghost = np.setdiff1d(used, np.ravel_multi_index(tuple(fluid.T), shape))
+            ghost = np.asarray(np.unravel_index(ghost, shape), dtype=np.int32).T
+            self._points = np.ascontiguousarray(np.concatenate([fluid, ghost.reshape(-1, self.dim)]))
+        return self._points
+
+    def neighbor_nodes(self, domain):
+        """
+        Return the positions in the list of the points (see compact_points)
+        of the neighbors x - v_k of the fluid points x of the interior domain.
+
+        Parameters
+        ----------
+
+        domain : Domain
+            the domain of the simulation
+
+        Return
+        ------
+
+        ndarray
+            array of shape (ns, nfluid)
+
+        """
+        if self._neighbors is None:
+            points = self.compact_points(domain)
+            index = -np.ones(domain.in_or_out.shape, dtype=np.int32)
+            index[tuple(points.T)] = np.arange(points.shape[0], dtype=np.int32)
+            fluid = self.fluid_nodes(domain)
+            velocities = np.asarray(self.all_velocities, dtype=np.int32).reshape(self.ns, 1, -1)
+            neighbors = fluid[np.newaxis] - velocities
+            self._neighbors = np.ascontiguousarray(index[tuple(np.moveaxis(neighbors, -1, 0))])
+        return self._neighbors
+
+    def _get_point_idx(self, size):
+        """
+        Return the list of the space indices of the points of the list
+        ordered with sorder: points[ip_] with ip_ in [0, size[.
+        """
+        ip = sp.Idx(sp.Symbol('ip_', integer=True), (0, size))
+        points = sp.IndexedBase(sp.Symbol('points', integer=True), [npoints, self.dim])
+        return set_order([points[ip, d] for d in range(self.dim)], self.sorder[1:])
+
+    def _get_space_idx_inner(self):
+        """
+        Return the list of the space indices of the fluid points
+        of the interior domain ordered with sorder.
+        """
+        return self._get_point_idx(nfluid)
+
+    def _get_loop_idx(self, space_index):
+        if all(isinstance(index, sp.Idx) for index in space_index):
+            return super(SparsePullAlgorithm, self)._get_loop_idx(space_index)
+        # the loop over the points of the list
+        return super(SparsePullAlgorithm, self)._get_loop_idx([space_index[0].indices[0]])
+
+    def _get_tiled_loop(self, space_index, body):
+        # the points of the list are not split in tiles
+        return For(self._get_loop_idx(space_index), body)
+
+    def _get_compact_indexed(self, name, index):
+        """
+        Return the indexed object of the distribution functions
+        stored on the list of points.
+        """
+        return indexed(name, [self.ns, npoints], index,
+                       priority=CompactArray.storage_order(self.sorder), batch=self.batch)
+
+    def _get_indexed_on_range(self, name, space_index):
+        if name not in ['f', 'fnew'] or all(isinstance(index, sp.Idx) for index in space_index):
+            return super(SparsePullAlgorithm, self)._get_indexed_on_range(name, space_index)
+        ip = self._get_loop_idx(space_index)[-1]
+        return SymbolicVector([self._get_compact_indexed(name, [k, ip]) for k in range(self.ns)])
+
+    def _get_streaming_indexed(self, space_index, phase=0):
+        ip = self._get_loop_idx(space_index)[-1]
+        neighbors = sp.IndexedBase(sp.Symbol('neighbors', integer=True), [self.ns, nfluid])
+        f = SymbolicVector([self._get_compact_indexed('f', [k, neighbors[k, ip]]) for k in range(self.ns)])
+        return f, self._get_indexed_on_range('fnew', space_index)
+
+    def transport(self):
+        """
+        Return the code expression of the lbm transport on the fluid points.
+        """
+        space_index = self._get_space_idx_inner()
+        f, fnew = self._get_streaming_indexed(space_index)
+        return {'code': For(self._get_loop_idx(space_index), self.transport_local(f, fnew))}
+
+    def f2m(self):
+        """
+        Return the code expression which computes the moments from the
+        distributed functions on all the points of the list.
+        """
+        space_index = self._get_point_idx(npoints)
+        f = self._get_indexed_on_range('f', space_index)
+        m = self._get_indexed_on_range('m', space_index)
+        return {'code': For(self._get_loop_idx(space_index), self.f2m_local(f, m))}
+
+    def f2m_consm(self):
+        """
+        Return the code expression which computes only the conserved
+        moments from the distributed functions on all the points of the list.
+        """
+        space_index = self._get_point_idx(npoints)
+        f = self._get_indexed_on_range('f', space_index)
+        m = self._get_indexed_on_range('m', space_index)
+        code = [sp.Eq(m[k], (self.M[k, :]*f)[0]) for k in range(len(self.consm))]
+        return {'code': For(self._get_loop_idx(space_index), code)}
+
+    def m2f(self):
+        """
+        Return the code expression which computes the distributed functions
+        from the moments on all the points of the list.
+        """
+        space_index = self._get_point_idx(npoints)
+        f = self._get_indexed_on_range('f', space_index)
+        m = self._get_indexed_on_range('m', space_index)
+        return {'code': For(self._get_loop_idx(space_index), self.m2f_local(m, f))}
+
+    def _get_restricted_f2m(self, rows):
+        # the distribution functions have no view on the grid
+        return None
+
+    def _one_time_step(self, reduce=False, phase=0):
+        m_local = self.settings.get('m_local', False)
+
+        space_index = self._get_space_idx_inner()
+
+        if m_local:
+            m = sp.MatrixSymbol('m', self.ns, 1)
+            local_vars = [m]
+        else:
+            m = self._get_indexed_on_range('m', space_index)
+            local_vars = []
+
+        if self.rel_vel_symb:
+            local_vars.extend(self.rel_vel_symb)
+
+        f, fnew = self._get_streaming_indexed(space_index, phase)
+
+        if not reduce and self._use_collision_matrix():
+            code = self.collision_local(f, fnew, m)
+        else:
+            code = self.one_time_step_local(f, fnew, m)
+
+        if reduce:
+            # all the points of the list are fluid points
+            if self.batch is None:
+                reduction = sp.IndexedBase('reduction', [len(self.reductions)])
+                store = [reduction[i] for i in range(len(self.reductions))]
+            else:
+                reduction = sp.IndexedBase('reduction', [nb, len(self.reductions)])
+                store = [reduction[self.batch, i] for i in range(len(self.reductions))]
+            code.extend([sp.Eq(r, r + e) for r, e in zip(store, self.reduction_local(m))])
+
+        loop = For(self._get_loop_idx(space_index), code)
+        settings = {"parallel": not reduce, "double_arrays": ["reduction"]}
+        return {'code': loop, 'local_vars': local_vars+self.local_vars, 'settings': settings}
+
+    def _get_args(self, simulation, m_user=None, f_user=None, **kwargs):
+        args = super(SparsePullAlgorithm, self)._get_args(simulation, m_user, f_user, **kwargs)
+        # the points of the distribution functions given by the user
+        # (the packed values of the boundary conditions)
+        f = f_user or simulation.container.F
+        args['points'] = f.points
+        args['npoints'] = f.points.shape[0]
+        args['nfluid'] = self.fluid_nodes(simulation.domain).shape[0]
+        args['neighbors'] = self.neighbor_nodes(simulation.domain)
+        return args
@@ -20,6 +20,16 @@ def reorder(tokens, local_dict, global_dict):
         result.append((OP, ','))
     return result
 
+def batch_index(local_dict):
+    """
+    the tokens of the index of the members of an ensemble
+    (always the first index of the moments)
+    """
+    batch = local_dict.get('batch', None)
+    if batch is None:
+        return []
+    return [(NAME, '%s'%batch), (OP, ',')]
+
 def transform_expr(tokens, local_dict, global_dict):
     result = []
     l = 0
@@ -30,6 +40,7 @@ def transform_expr(tokens, local_dict, global_dict):
             if nextTok[0] == OP and nextTok[1] == '[':
                 result.append((NAME, 'm'))
                 result.append(nextTok)
+                result.extend(batch_index(local_dict))
                 stacks = [[(NUMBER, '%s'%local_dict['consm'][token[1]])]]
                 stacks.append([])
                 l += 2
@@ -46,6 +57,7 @@ def transform_expr(tokens, local_dict, global_dict):
             else:
                 result.append((NAME, 'm'))
                 result.append((OP, '['))
+                result.extend(batch_index(local_dict))
                 default_index = [local_dict['consm'][token[1]]] + local_dict['default_index']
                 if local_dict['sorder']:
                     index_ordered = set_order(default_index, local_dict['sorder'])
@@ -68,6 +80,8 @@ def transform_expr(tokens, local_dict, global_dict):
 
 def parse_expr(expr, user_local_dict):
     local_dict = user_local_dict
+    if local_dict.get('batch', None) is not None:
+        local_dict['%s'%local_dict['batch']] = local_dict['batch']
     for s in expr.atoms(sp.Symbol):
         local_dict[s.name] = s
 
@@ -0,0 +1,226 @@
+# Authors:
+#     Loic Gouarin <loic.gouarin@polytechnique.edu>
+#     Benjamin Graille <benjamin.graille@math.u-psud.fr>
+#
+# License: BSD 3 clause
+
+"""
+Autotuning of the storage order and of the algorithm settings
+
+The fastest configuration is saved in a json file (one entry per host,
+stencil, grid size, generator, type and number of processes) and is
+reused by the simulations whose dictionary contains 'autotune': True.
+The file is given by the environment variable PYLBM_AUTOTUNE_CACHE
+(default is ~/.cache/pylbm/autotune.json).
+"""
+
+import os
+import copy
+import json
+import socket
+import logging
+import itertools
+import numpy as np
+import mpi4py.MPI as mpi
+
+from .monitoring import Monitor
+
+log = logging.getLogger(__name__) #pylint: disable=invalid-name
+
+
+def cache_filename():
+    """
+    Return the name of the json file where the tuned
+    configurations are saved.
+    """
+    default = os.path.join(os.path.expanduser('~'), '.cache', 'pylbm', 'autotune.json')
+    return os.environ.get('PYLBM_AUTOTUNE_CACHE', default)
+
+
+def tuning_key(domain, scheme, dico, dtype):
+    """
+    Return the key of a configuration in the cache.
+
+    Parameters
+    ----------
+
+    domain : Domain
+        the domain of the simulation
+    scheme : Scheme
+        the scheme of the simulation
+    dico : dictionary
+        the dictionary of the simulation
+    dtype : str or numpy.dtype
+        the type of the values
+
+    """
+    algorithm = dico.get('lbm_algorithm', {}).get('name', None)
+    key = {'host': socket.gethostname(),
+           'nprocs': mpi.COMM_WORLD.Get_size(),
+           'generator': dico.get('generator', 'cython').upper(),
+           'dtype': np.dtype(dtype).name,
+           'algorithm': algorithm.__name__ if algorithm else 'PullAlgorithm',
+           'ensemble': dico.get('ensemble', None),
+           'velocities': scheme.stencil.get_all_velocities().tolist(),
+           'grid': [int(n) for n in domain.global_size],
+          }
+    return json.dumps(key, sort_keys=True)
+
+
+def _read_cache(filename):
+    try:
+        with open(filename) as cache:
+            return json.load(cache)
+    except (IOError, ValueError):
+        return {}
+
+
+def load_tuning(key, filename=None):
+    """
+    Return the configuration saved for the key
+    (None if the key is not in the cache).
+
+    Parameters
+    ----------
+
+    key : str
+        the key given by tuning_key
+    filename : str, optional
+        the json file (default is given by cache_filename)
+
+    """
+    return _read_cache(filename or cache_filename()).get(key, None)
+
+
+def save_tuning(key, config, filename=None):
+    """
+    Save the configuration for the key (only on the process 0).
+
+    Parameters
+    ----------
+
+    key : str
+        the key given by tuning_key
+    config : dictionary
+        the configuration ('sorder', 'settings' and 'time')
+    filename : str, optional
+        the json file (default is given by cache_filename)
+
+    """
+    if mpi.COMM_WORLD.Get_rank() != 0:
+        return
+    filename = filename or cache_filename()
+    cache = _read_cache(filename)
+    cache[key] = config
+    directory = os.path.dirname(filename)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(filename, 'w') as output:
+        json.dump(cache, output, indent=2, sort_keys=True)
+
+
+def default_candidates(dim, generator):
+    """
+    Return the candidates tried by default for a generator:
+    the storage orders SOA and AOS and, for the generated loops,
+    the settings m_local (Cython and Numba), matrix_product (NumPy)
+    or the block sizes (loo.py).
+
+    Parameters
+    ----------
+
+    dim : int
+        the spatial dimension
+    generator : str
+        the generator ('numpy', 'cython', 'numba' or 'loopy')
+
+    """
+    sorders = [list(range(dim + 1)), [dim] + list(range(dim))]
+    generator = generator.upper()
+    if generator in ['CYTHON', 'NUMBA']:
+        settings = [{'m_local': True}, {'m_local': False}]
+    elif generator == 'LOOPY':
+        block_sizes = {1: [[256], [128]],
+                       2: [[16, 16], [32, 8], [8, 32]],
+                       3: [[4, 4, 4], [8, 8, 2], [16, 4, 2]]}[dim]
+        settings = [{'block_size': b} for b in block_sizes]
+    else:
+        settings = [{'matrix_product': False}, {'matrix_product': True}]
+    return [{'sorder': s, 'settings': copy.copy(d)} for s, d in itertools.product(sorders, settings)]
+
+
+def autotune(dico, candidates=None, steps=20, dtype='float64', filename=None):
+    """
+    Find the fastest storage order and algorithm settings for
+    a simulation and save it in the cache.
+
+    Each candidate is compiled and a short run is timed with the
+    monitor of pylbm (the slowest process gives the time).
+
+    Parameters
+    ----------
+
+    dico : dictionary
+        the dictionary of the simulation
+    candidates : list, optional
+        list of dictionaries with the keys 'sorder' (the storage order
+        or None for the default one) and 'settings' (the settings of the
+        algorithm added to the ones of the dictionary). The default
+        is given by default_candidates
+    steps : int, optional
+        the number of time steps of the timed runs (default is 20)
+    dtype : str, optional
+        the type of the values (default is 'float64')
+    filename : str, optional
+        the json file of the cache (default is given by cache_filename)
+
+    Return
+    ------
+
+    dictionary
+        the fastest configuration ('sorder', 'settings' and 'time')
+
+    Examples
+    --------
+
+    >>> best = pylbm.autotune(dico, steps=50)
+    >>> dico['autotune'] = True
+    >>> sol = pylbm.Simulation(dico)  # uses best['sorder'] and best['settings']
+
+    """
+    from .simulation import Simulation
+    from .domain import Domain
+
+    dico = dict(dico)
+    dico.pop('autotune', None)
+    lbm_algorithm = dico.get('lbm_algorithm', {})
+    user_settings = lbm_algorithm.get('settings', {})
+
+    if candidates is None:
+        dim = Domain(dico, need_validation=False).dim
+        candidates = default_candidates(dim, dico.get('generator', 'cython'))
+
+    best, key = None, None
+    for candidate in candidates:
+        settings = dict(user_settings)
+        settings.update(candidate.get('settings', {}))
+        test_dico = dict(dico)
+        test_dico['lbm_algorithm'] = dict(lbm_algorithm, settings=settings)
+
+        simulation = Simulation(test_dico, sorder=candidate.get('sorder', None), dtype=dtype)
+        # the first call binds the kernels
+        simulation.run(1)
+        simulation.run(steps)
+        time = mpi.COMM_WORLD.allreduce(Monitor.last_time(Simulation.run), op=mpi.MAX)
+        log.info('autotune: sorder %s settings %s: %f s',
+                 simulation.container.sorder, candidate.get('settings', {}), time)
+
+        if best is None or time < best['time']:
+            best = {'sorder': [int(s) for s in simulation.container.sorder],
+                    'settings': candidate.get('settings', {}),
+                    'time': time}
+        if key is None:
+            key = tuning_key(simulation.domain, simulation.scheme, dico, dtype)
+
+    save_tuning(key, best, filename)
+    return best
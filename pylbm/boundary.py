@@ -14,7 +14,7 @@ import types
 import numpy as np
 from sympy import symbols, IndexedBase, Idx, Eq
 
-from .storage import Array
+from .storage import Array, CompactArray
 
 log = logging.getLogger(__name__) #pylint: disable=invalid-name
 
@@ -121,10 +121,167 @@ class Boundary:
                             distance[v] = np.concatenate([distance[v], distance_tmp])
 
         # for each method create the instance associated
+        nbatch = dico.get('ensemble', None)
+        block = dico.get('aosoa', None)
         self.methods = []
         for k in list(istore.keys()):
             self.methods.append(k(istore[k], ilabel[k], distance[k], stencil,
                                   value_bc, time_bc, domain.distance.shape, generator))
+            if nbatch is not None:
+                self.methods[-1].set_ensemble(nbatch)
+            if block is not None:
+                self.methods[-1].set_aosoa(block)
+        self.workspace = None
+
+
+    def prepare_rhs(self, simulation):
+        """
+        Compute the distribution functions at the equilibrium
+        with the values on the border for all the boundary methods.
+
+        All the labels are computed at once in a packed workspace.
+        The labels with time dependent values are kept in a second
+        workspace which is updated by update_feq.
+
+        Parameters
+        ----------
+        simulation : Simulation
+            simulation class
+
+        """
+        values, unsteady = [], []
+        for method in self.methods:
+            for value in method.boundary_values(simulation):
+                values.append((method,) + value)
+                if value[-1]:
+                    unsteady.append(values[-1])
+
+        BoundaryWorkspace(simulation, values).evaluate(simulation, 0)
+        self.workspace = BoundaryWorkspace(simulation, unsteady) if unsteady else None
+
+    def update_feq(self, simulation):
+        """
+        Update the distribution functions at the equilibrium
+        on the border for the time dependent values and the
+        additional terms of the methods which use them.
+
+        Parameters
+        ----------
+        simulation : Simulation
+            simulation class
+
+        """
+        if self.workspace is not None:
+            self.workspace.evaluate(simulation, simulation.t)
+            # only the additional terms of these methods have changed
+            for method in self.workspace.methods:
+                method.set_rhs()
+
+
+class BoundaryWorkspace:
+    """
+    Packed storage of the values on the border.
+
+    The points of several labels and boundary methods are stored in
+    one array of moments and one array of distribution functions.
+    The functions given by the user set the values of each label
+    in views on these arrays and the equilibrium and the distribution
+    functions of all the labels are computed by one call of the kernels.
+
+    Parameters
+    ----------
+    simulation : Simulation
+        simulation class
+    values : list
+        the boundary method followed by the items of its
+        boundary_values for each label
+
+    Attributes
+    ----------
+    m : Array
+        the moments of all the points
+    f : Array
+        the distribution functions of all the points
+    views : list
+        the distribution functions and the moments of each label
+    methods : list
+        the boundary methods of the points
+
+    """
+    def __init__(self, simulation, values):
+        container = simulation.container
+        self.values = values
+        self.methods = list(dict.fromkeys(value[0] for value in values))
+        self.size = sum(value[1].size for value in values)
+
+        nspace = [self.size] + [1]*(simulation.domain.dim - 1)
+        kwargs = dict(dtype=container.dtype, gpu_support=container.gpu_support,
+                       nbatch=simulation.nbatch)
+        self.m = Array(container.nv, nspace, 0, container.sorder, **kwargs)
+        self.m.set_conserved_moments(simulation.scheme.consm)
+        if isinstance(container.F, CompactArray):
+            # all the points are stored in the order of the packed moments
+            points = np.indices(nspace).reshape(len(nspace), -1).T
+            self.f = CompactArray(container.nv, nspace, 0, points, container.sorder,
+                                  dtype=container.dtype, nbatch=simulation.nbatch)
+        else:
+            self.f = Array(container.nv, nspace, 0, container.sorder, **kwargs)
+        self.f.set_conserved_moments(simulation.scheme.consm)
+        # the kernels write the distribution functions stored by blocks (AoSoA)
+        self._fblock = None
+        if container.block is not None:
+            self._fblock = Array(container.nv, nspace, 0, container.sorder,
+                                 block=container.block, **kwargs)
+
+        self.views = []
+        start = 0
+        for value in values:
+            stop = start + value[1].size
+            self.views.append((self.f.sub_array(start, stop), self.m.sub_array(start, stop)))
+            start = stop
+
+        # the kernels are bound once to the arrays of the workspace
+        self._fout = self.f if self._fblock is None else self._fblock
+        self._equilibrium = simulation.algo.bind_arrays(simulation, 'equilibrium', self.m)
+        self._m2f = simulation.algo.bind_arrays(simulation, 'm2f', self.m, self._fout)
+
+    def evaluate(self, simulation, t):
+        """
+        Compute the distribution functions at the equilibrium with
+        the values on the border and store them in the feq of the
+        boundary methods.
+
+        Parameters
+        ----------
+        simulation : Simulation
+            simulation class
+        t : double
+            the time given to the time dependent values
+
+        """
+        if self.size == 0:
+            return
+
+        for (_, _, func, args, time_bc), (f, m) in zip(self.values, self.views):
+            if time_bc:
+                func(f, m, t, *args)
+            else:
+                func(f, m, *args)
+
+        # the views write on the host
+        self.m.modified_on_host()
+        self.m.sync_device()
+        for kernel in [self._equilibrium, self._m2f]:
+            kernel.set('t', t)
+            kernel()
+        self.m.modified_on_device()
+        self._fout.modified_on_device()
+        if self._fblock is not None:
+            self.f[:] = self._fblock[:]
+        self.f.sync_host()
+
+        for (method, indices, *_), (f, _) in zip(self.values, self.views):
+            method.feq[..., indices] = f.swaparray.reshape(method.feq.shape[:-1] + (indices.size,))
 
 
 #pylint: disable=protected-access
@@ -157,7 +314,7 @@ class BoundaryMethod:
     def __init__(self, istore, ilabel, distance, stencil, value_bc, time_bc, nspace, generator):
         self.istore = istore
         self.feq = np.zeros((stencil.nv_ptr[-1], istore.shape[1]))
-        self.rhs = np.zeros(istore.shape[1])
+        self.rhs = np.zeros(istore.shape[1], dtype=generator.dtype)
         self.ilabel = ilabel
         self.distance = distance
         self.stencil = stencil
@@ -169,13 +326,82 @@ class BoundaryMethod:
         self.iload = []
         self.nspace = nspace
         self.generator = generator
+        self.kernel = None
+        self.nbatch = None
+        self.block = None
+        self.layout_indices = None
+        self.compact_index = None
+        self.nlocal = None
+
+    def set_ensemble(self, nbatch):
+        """
+        Store one set of boundary values for each member of an ensemble.
+
+        Parameters
+        ----------
+        nbatch : int
+            the number of members of the ensemble
+        """
+        self.nbatch = nbatch
+        self.feq = np.zeros((nbatch,) + self.feq.shape)
+        self.rhs = np.zeros((nbatch,) + self.rhs.shape, dtype=self.rhs.dtype)
+
+    def set_aosoa(self, block):
+        """
+        Access the distribution functions stored by blocks (AoSoA).
+
+        Parameters
+        ----------
+        block : int
+            the number of points of the blocks
+        """
+        self.block = block
+
+    def split_conditions(self, near):
+        """
+        Put the conditions which read or write a point of near after
+        the other ones (overlap of the exchange of the halo points).
+
+        The conditions [0, nlocal[ can be computed during the exchange,
+        the other ones must wait for the halo points.
+        Must be called after set_iload and before fix_iload.
+
+        Parameters
+        ----------
+        near : ndarray
+            True on the points received or sent by the exchange
 
-        # used if time boundary
-        self.func = []
-        self.args = []
-        self.f = []
-        self.m = []
-        self.indices = []
+        Returns
+        -------
+        ndarray
+            the points written by the conditions which wait for the exchange
+
+        """
+        halo = np.zeros(self.istore.shape[1], dtype=bool)
+        for indices in [self.istore] + self.iload:
+            halo |= near[tuple(indices[1:])]
+
+        # a condition computed before the exchange must not write
+        # a point read by a condition computed after
+        shape = (self.stencil.nv_ptr[-1],) + near.shape
+        store = np.ravel_multi_index(tuple(self.istore), shape)
+        loads = [np.ravel_multi_index(tuple(iload), shape) for iload in self.iload]
+        while True:
+            read = np.concatenate([load[halo] for load in loads])
+            moved = ~halo & np.isin(store, read)
+            if not moved.any():
+                break
+            halo |= moved
+        order = np.argsort(halo, kind='stable')
+
+        self.istore = self.istore[:, order]
+        self.iload = [iload[:, order] for iload in self.iload]
+        self.ilabel = self.ilabel[order]
+        self.distance = self.distance[order]
+        if hasattr(self, 's'):
+            self.s = self.s[order] #pylint: disable=attribute-defined-outside-init
+        self.nlocal = int(np.count_nonzero(~halo))
+        return self.istore[1:, self.nlocal:]
 
     def fix_iload(self):
         """
@@ -188,30 +414,80 @@ class BoundaryMethod:
             self.iload[i] = np.ascontiguousarray(self.iload[i].T, dtype=np.int32)
         self.istore = np.ascontiguousarray(self.istore.T, dtype=np.int32)
 
-    #pylint: disable=too-many-locals
-    def prepare_rhs(self, simulation):
+    def set_compact(self, compact_index):
+        """
+        Access the distribution functions stored on a list of points
+        (see CompactArray): the indices istore and iload of the kernel
+        are the velocity and the position of the point in the list.
+
+        Must be called before generate.
+
+        Parameters
+        ----------
+        compact_index : ndarray
+            the position in the list of each point of the grid
+        """
+        self.compact_index = compact_index
+
+    def set_layouts(self, layouts):
         """
-        Compute the distribution function at the equilibrium with the value on the border.
+        Compute the indices istore and iload in the storage for each
+        layout of the distribution functions (in-place algorithms)
+        or for the compact storage.
+
+        Must be called after fix_iload.
+
+        Parameters
+        ----------
+        layouts : list
+            the layout of each phase: (slots, shifts) or None
+            for the natural layout
+        """
+        if all(layout is None for layout in layouts) and self.compact_index is None:
+            self.layout_indices = None
+            return
+
+        def to_layout(indices, layout):
+            if layout is not None:
+                slots, shifts = layout
+                k = indices[:, 0]
+                indices = indices.copy()
+                indices[:, 0] = slots[k]
+                indices[:, 1:] += shifts[k]
+            if self.compact_index is not None:
+                indices = np.stack([indices[:, 0], self.compact_index[tuple(indices[:, 1:].T)]], axis=1)
+            return np.ascontiguousarray(indices, dtype=np.int32)
+
+        self.layout_indices = []
+        for layout in layouts:
+            self.layout_indices.append((to_layout(self.istore, layout),
+                                        [to_layout(iload, layout) for iload in self.iload]))
+
+    def boundary_values(self, simulation):
+        """
+        Return the description of the prescribed values
+        of each label of this boundary method.
 
         Parameters
         ----------
         simulation : Simulation
             simulation class
 
-        """
+        Returns
+        -------
+        list
+            for each label with a value: the indices of its points
+            in this method, the function which sets the values, the
+            arguments of this function (the coordinates of the points
+            on the border first) and True if the values depend on time
 
-        nv = simulation.container.nv
-        sorder = simulation.container.sorder
-        nspace = [1]*(len(sorder)-1)
+        """
         v = self.stencil.get_all_velocities()
 
-        gpu_support = simulation.container.gpu_support
-
+        values = []
         for key, value in self.value_bc.items():
             if value is not None:
-                indices = np.where(self.ilabel == key)
-                # TODO: check the index in sorder to be the most contiguous
-                nspace[0] = indices[0].size
+                indices = np.where(self.ilabel == key)[0]
                 k = self.istore[0, indices]
 
                 s = 1 - self.distance[indices]
@@ -224,12 +500,6 @@ class BoundaryMethod:
                         x = x[:, np.newaxis]
                     coords += (x,)
 
-                m = Array(nv, nspace, 0, sorder, gpu_support=gpu_support)
-                m.set_conserved_moments(simulation.scheme.consm)
-
-                f = Array(nv, nspace, 0, sorder, gpu_support=gpu_support)
-                f.set_conserved_moments(simulation.scheme.consm)
-
                 args = coords
                 if isinstance(value, types.FunctionType):
                     func = value
@@ -237,39 +507,8 @@ class BoundaryMethod:
                     func = value[0]
                     args += value[1]
 
-                if self.time_bc[key]:
-                    func(f, m, 0, *args)
-                else:
-                    func(f, m, *args)
-
-                simulation.equilibrium(m)
-                simulation.m2f(m, f)
-
-                if self.generator.backend.upper() == "LOOPY":
-                    f.array_cpu[...] = f.array.get()
-
-                self.feq[:, indices[0]] = f.swaparray.reshape((nv, indices[0].size))
-
-                if self.time_bc[key]:
-                    self.func.append(func)
-                    self.args.append(args)
-                    self.f.append(f)
-                    self.m.append(m)
-                    self.indices.append(indices[0])
-
-    def update_feq(self, simulation):
-        t = simulation.t
-        nv = simulation.container.nv
-
-        for i in range(len(self.func)):
-            self.func[i](self.f[i], self.m[i], t, *self.args[i])
-            simulation.equilibrium(self.m[i])
-            simulation.m2f(self.m[i], self.f[i])
-
-            if self.generator.backend.upper() == "LOOPY":
-                self.f[i].array_cpu[...] = self.f[i].array.get()
-
-            self.feq[:, self.indices[i]] = self.f[i].swaparray.reshape((nv, self.indices[i].size))
+                values.append((indices, func, args, self.time_bc[key]))
+        return values
 
     def _get_istore_iload_symb(self, dim):
         ncond = symbols('ncond', integer=True)
@@ -283,13 +522,28 @@ class BoundaryMethod:
             iload.append(IndexedBase(iloads, [ncond, dim+1]))
         return istore, iload, ncond
 
+    def _get_batch_symb(self, idx):
+        """
+        Return the index of the members of the ensemble
+        (None if there is no ensemble) and the loop indices.
+        """
+        if self.nbatch is None:
+            return None, idx
+        from .symbolic import batch_idx
+        batch = batch_idx()
+        return batch, [batch, idx]
+
     @staticmethod
-    def _get_rhs_dist_symb(ncond):
-        rhs = IndexedBase('rhs', [ncond])
+    def _get_rhs_dist_symb(ncond, idx, batch=None):
         dist = IndexedBase('dist', [ncond])
-        return rhs, dist
-
-    def update(self, ff, **kwargs):
+        if batch is None:
+            rhs = IndexedBase('rhs', [ncond])
+            return rhs[idx], dist[idx]
+        from .symbolic import nb
+        rhs = IndexedBase('rhs', [nb, ncond])
+        return rhs[batch, idx], dist[idx]
+
+    def update(self, ff, phase=0, part=None, **kwargs):
         """
         Update distribution functions with this boundary condition.
 
@@ -298,33 +552,83 @@ class BoundaryMethod:
 
         ff : array
             The distribution functions
+        phase : int
+            the phase of the time step for the in-place algorithms
+            (default is 0)
+        part : str
+            'local' or 'halo' to update only the conditions computed
+            before or after the exchange of the halo points
+            (default is None: all the conditions)
         """
-        from .symbolic import call_genfunction
-
-        args = self._get_args(ff)
+        if self.kernel is None:
+            self.bind(ff)
+        args = self._part_args(part)
+        if args.get('ncond', None) == 0:
+            return
+        self.kernel.set('f', ff.array)
+        self._set_layout_indices(phase)
         args.update(kwargs)
-        call_genfunction(self.function, args) #pylint: disable=no-member
+        self.kernel(**args)
 
-    #pylint: disable=possibly-unused-variable
-    def _get_args(self, ff):
-        dim = len(ff.nspace)
-        nx = ff.nspace[0]
-        if dim > 1:
-            ny = ff.nspace[1]
-        if dim > 2:
-            nz = ff.nspace[2]
+    def _part_args(self, part):
+        """
+        Return the arguments of the kernel restricted to the conditions
+        of part (see split_conditions).
+        """
+        if part is None:
+            return {}
+        conditions = slice(0, self.nlocal) if part == 'local' else slice(self.nlocal, None)
+        args = {'istore': self.istore[conditions],
+                'rhs': self.rhs[..., conditions]}
+        args['ncond'] = args['istore'].shape[0]
+        for i, iload in enumerate(self.iload):
+            args['iload{}'.format(i)] = iload[conditions]
+        if hasattr(self, 's'):
+            args['dist'] = self.s[conditions]
+        return args
 
-        f = ff.array
+    def _set_layout_indices(self, phase):
+        """
+        Set the indices of the layout of the phase in the kernel.
+        """
+        if self.layout_indices is not None:
+            istore, iload = self.layout_indices[phase]
+            self.kernel.set('istore', istore)
+            for i, iload_i in enumerate(iload):
+                self.kernel.set('iload{}'.format(i), iload_i)
 
-        for i in range(len(self.iload)):
-            exec('iload{i} = self.iload[{i}]'.format(i=i)) #pylint: disable=exec-used
+    def bind(self, ff):
+        """
+        Bind the generated function to the arrays of this boundary condition.
 
-        istore = self.istore
-        rhs = self.rhs
+        Parameters
+        ----------
+
+        ff : array
+            The distribution functions
+        """
+        from .symbolic import BoundKernel
+        self.kernel = BoundKernel(self.function, self._get_args(ff), #pylint: disable=no-member
+                                  num_threads=self.generator.num_threads)
+
+    def _get_args(self, ff):
+        istore, iloads = self.istore, self.iload
+        if self.layout_indices is not None:
+            istore, iloads = self.layout_indices[0]
+        args = {'f': ff.array,
+                'istore': istore,
+                'rhs': self.rhs,
+                'ncond': istore.shape[0],
+               }
+        for i, nspace in enumerate(ff.nspace):
+            args['n' + 'xyz'[i]] = nspace
+        for i, iload in enumerate(iloads):
+            args['iload{}'.format(i)] = iload
+        if self.nbatch is not None:
+            args['nb'] = self.nbatch
         if hasattr(self, 's'):
-            dist = self.s
-        ncond = istore.shape[0]
-        return locals()
+            args['dist'] = self.s
+        return args
 
     def move2gpu(self):
         """
@@ -355,6 +659,7 @@ class BounceBack(BoundaryMethod):
     .. plot:: codes/bounce_back.py
 
     """
+    name = 'bounce_back'
     def set_iload(self):
         """
         Compute the indices that are needed (symmertic velocities and space indices).
@@ -371,7 +676,7 @@ class BounceBack(BoundaryMethod):
         """
         k = self.istore[:, 0]
         ksym = self.stencil.get_symmetric()[k]
-        self.rhs[:] = self.feq[k, np.arange(k.size)] - self.feq[ksym, np.arange(k.size)]
+        self.rhs[:] = self.feq[..., k, np.arange(k.size)] - self.feq[..., ksym, np.arange(k.size)]
 
     #pylint: disable=too-many-locals
     def generate(self, sorder):
@@ -382,26 +687,28 @@ class BounceBack(BoundaryMethod):
         ----------
         sorder : list
             the order of nv, nx, ny and nz
+            (the order of nv and of the points for a compact storage)
         """
         from .generator import For
         from .symbolic import nx, ny, nz, indexed, ix
 
         ns = int(self.stencil.nv_ptr[-1])
-        dim = self.stencil.dim
+        dim = len(sorder) - 1
 
         istore, iload, ncond = self._get_istore_iload_symb(dim)
-        rhs, _ = self._get_rhs_dist_symb(ncond)
 
         idx = Idx(ix, (0, ncond))
-        fstore = indexed('f', [ns, nx, ny, nz], index=[istore[idx, k] for k in range(dim+1)], priority=sorder)
-        fload = indexed('f', [ns, nx, ny, nz], index=[iload[0][idx, k] for k in range(dim+1)], priority=sorder)
+        batch, loop = self._get_batch_symb(idx)
+        rhs, _ = self._get_rhs_dist_symb(ncond, idx, batch)
+        fstore = indexed('f', [ns, nx, ny, nz], index=[istore[idx, k] for k in range(dim+1)], priority=sorder, batch=batch, block=self.block)
+        fload = indexed('f', [ns, nx, ny, nz], index=[iload[0][idx, k] for k in range(dim+1)], priority=sorder, batch=batch, block=self.block)
 
-        self.generator.add_routine(('bounce_back', For(idx, Eq(fstore, fload + rhs[idx]))))
+        self.generator.add_routine((self.name, For(loop, Eq(fstore, fload + rhs))), settings={'parallel': True})
 
     @property
     def function(self):
         """Return the generated function"""
-        return self.generator.module.bounce_back
+        return getattr(self.generator.module, self.name)
 
 class BouzidiBounceBack(BoundaryMethod):
     """
@@ -413,9 +720,10 @@ class BouzidiBounceBack(BoundaryMethod):
     .. plot:: codes/Bouzidi.py
 
     """
+    name = 'Bouzidi_bounce_back'
     def __init__(self, istore, ilabel, distance, stencil, value_bc, time_bc, nspace, generator):
         super(BouzidiBounceBack, self).__init__(istore, ilabel, distance, stencil, value_bc, time_bc, nspace, generator)
-        self.s = np.empty(self.istore.shape[1])
+        self.s = np.empty(self.istore.shape[1], dtype=generator.dtype)
 
     def set_iload(self):
         """
@@ -445,30 +753,31 @@ class BouzidiBounceBack(BoundaryMethod):
         self.iload.append(iload1)
         self.iload.append(iload2)
 
-    def _get_args(self, ff):
-        dim = len(ff.nspace)
-        nx = ff.nspace[0]
-        if dim > 1:
-            ny = ff.nspace[1]
-        if dim > 2:
-            nz = ff.nspace[2]
-
-        f = ff.array
+    def update(self, ff, phase=0, part=None, **kwargs):
         # FIXME: needed to have the same results between numpy and cython
         # That means that there are dependencies between the rhs and the lhs
         # during the loop over the boundary elements
         # check why (to test it use air_conditioning example)
-        fcopy = ff.array.copy()
-
-        for i in range(len(self.iload)):
-            exec('iload{i} = self.iload[{i}]'.format(i=i)) #pylint: disable=exec-used
+        if self.kernel is None:
+            self.bind(ff)
+        args = self._part_args(part)
+        if args.get('ncond', None) == 0:
+            return
+        if 'fcopy' in self.kernel.names:
+            if self.generator.backend.upper() == "LOOPY":
+                self.kernel.set('fcopy', ff.array.copy())
+            else:
+                np.copyto(self.fcopy, ff.array)
+        self.kernel.set('f', ff.array)
+        self._set_layout_indices(phase)
+        args.update(kwargs)
+        self.kernel(**args)
 
-        istore = self.istore
-        rhs = self.rhs
-        if hasattr(self, 's'):
-            dist = self.s
-        ncond = istore.shape[0]
-        return locals()
+    def _get_args(self, ff):
+        args = super(BouzidiBounceBack, self)._get_args(ff)
+        self.fcopy = ff.array.copy() #pylint: disable=attribute-defined-outside-init
+        args['fcopy'] = self.fcopy
+        return args
 
     def set_rhs(self):
         """
@@ -476,7 +785,7 @@ class BouzidiBounceBack(BoundaryMethod):
         """
         k = self.istore[:, 0]
         ksym = self.stencil.get_symmetric()[k]
-        self.rhs[:] = self.feq[k, np.arange(k.size)] - self.feq[ksym, np.arange(k.size)]
+        self.rhs[:] = self.feq[..., k, np.arange(k.size)] - self.feq[..., ksym, np.arange(k.size)]
 
     #pylint: disable=too-many-locals
     def generate(self, sorder):
@@ -487,27 +796,29 @@ class BouzidiBounceBack(BoundaryMethod):
         ----------
         sorder : list
             the order of nv, nx, ny and nz
+            (the order of nv and of the points for a compact storage)
         """
         from .generator import For
         from .symbolic import nx, ny, nz, indexed, ix
 
         ns = int(self.stencil.nv_ptr[-1])
-        dim = self.stencil.dim
+        dim = len(sorder) - 1
 
         istore, iload, ncond = self._get_istore_iload_symb(dim)
-        rhs, dist = self._get_rhs_dist_symb(ncond)
 
         idx = Idx(ix, (0, ncond))
-        fstore = indexed('f', [ns, nx, ny, nz], index=[istore[idx, k] for k in range(dim+1)], priority=sorder)
-        fload0 = indexed('fcopy', [ns, nx, ny, nz], index=[iload[0][idx, k] for k in range(dim+1)], priority=sorder)
-        fload1 = indexed('fcopy', [ns, nx, ny, nz], index=[iload[1][idx, k] for k in range(dim+1)], priority=sorder)
+        batch, loop = self._get_batch_symb(idx)
+        rhs, dist = self._get_rhs_dist_symb(ncond, idx, batch)
+        fstore = indexed('f', [ns, nx, ny, nz], index=[istore[idx, k] for k in range(dim+1)], priority=sorder, batch=batch, block=self.block)
+        fload0 = indexed('fcopy', [ns, nx, ny, nz], index=[iload[0][idx, k] for k in range(dim+1)], priority=sorder, batch=batch, block=self.block)
+        fload1 = indexed('fcopy', [ns, nx, ny, nz], index=[iload[1][idx, k] for k in range(dim+1)], priority=sorder, batch=batch, block=self.block)
 
-        self.generator.add_routine(('Bouzidi_bounce_back', For(idx, Eq(fstore, dist[idx]*fload0 + (1-dist[idx])*fload1 + rhs[idx]))))
+        self.generator.add_routine((self.name, For(loop, Eq(fstore, dist*fload0 + (1-dist)*fload1 + rhs))), settings={'parallel': True})
 
     @property
     def function(self):
         """Return the generated function"""
-        return self.generator.module.Bouzidi_bounce_back
+        return getattr(self.generator.module, self.name)
 
 class AntiBounceBack(BounceBack):
     """
@@ -519,13 +830,14 @@ class AntiBounceBack(BounceBack):
     .. plot:: codes/anti_bounce_back.py
 
     """
+    name = 'anti_bounce_back'
     def set_rhs(self):
         """
         Compute and set the additional terms to fix the boundary values.
         """
         k = self.istore[:, 0]
         ksym = self.stencil.get_symmetric()[k]
-        self.rhs[:] = self.feq[k, np.arange(k.size)] + self.feq[ksym, np.arange(k.size)]
+        self.rhs[:] = self.feq[..., k, np.arange(k.size)] + self.feq[..., ksym, np.arange(k.size)]
 
     #pylint: disable=too-many-locals
     def generate(self, sorder):
@@ -536,25 +848,27 @@ class AntiBounceBack(BounceBack):
         ----------
         sorder : list
             the order of nv, nx, ny and nz
+            (the order of nv and of the points for a compact storage)
         """
         from .generator import For
         from .symbolic import nx, ny, nz, indexed, ix
 
         ns = int(self.stencil.nv_ptr[-1])
-        dim = self.stencil.dim
+        dim = len(sorder) - 1
 
         istore, iload, ncond = self._get_istore_iload_symb(dim)
-        rhs, _ = self._get_rhs_dist_symb(ncond)
 
         idx = Idx(ix, (0, ncond))
-        fstore = indexed('f', [ns, nx, ny, nz], index=[istore[idx, k] for k in range(dim+1)], priority=sorder)
-        fload = indexed('f', [ns, nx, ny, nz], index=[iload[0][idx, k] for k in range(dim+1)], priority=sorder)
+        batch, loop = self._get_batch_symb(idx)
+        rhs, _ = self._get_rhs_dist_symb(ncond, idx, batch)
+        fstore = indexed('f', [ns, nx, ny, nz], index=[istore[idx, k] for k in range(dim+1)], priority=sorder, batch=batch, block=self.block)
+        fload = indexed('f', [ns, nx, ny, nz], index=[iload[0][idx, k] for k in range(dim+1)], priority=sorder, batch=batch, block=self.block)
 
-        self.generator.add_routine(('anti_bounce_back', For(idx, Eq(fstore, -fload + rhs[idx]))))
+        self.generator.add_routine((self.name, For(loop, Eq(fstore, -fload + rhs))), settings={'parallel': True})
 
     @property
     def function(self):
-        return self.generator.module.anti_bounce_back
+        return getattr(self.generator.module, self.name)
 
 class BouzidiAntiBounceBack(BouzidiBounceBack):
     """
@@ -566,13 +880,14 @@ class BouzidiAntiBounceBack(BouzidiBounceBack):
     .. plot:: codes/Bouzidi.py
 
     """
+    name = 'Bouzidi_anti_bounce_back'
     def set_rhs(self):
         """
         Compute and set the additional terms to fix the boundary values.
         """
         k = self.istore[:, 0]
         ksym = self.stencil.get_symmetric()[k]
-        self.rhs[:] = self.feq[k, np.arange(k.size)] + self.feq[ksym, np.arange(k.size)]
+        self.rhs[:] = self.feq[..., k, np.arange(k.size)] + self.feq[..., ksym, np.arange(k.size)]
 
     #pylint: disable=too-many-locals
     def generate(self, sorder):
@@ -583,26 +898,28 @@ class BouzidiAntiBounceBack(BouzidiBounceBack):
         ----------
         sorder : list
             the order of nv, nx, ny and nz
+            (the order of nv and of the points for a compact storage)
         """
         from .generator import For
         from .symbolic import nx, ny, nz, indexed, ix
 
         ns = int(self.stencil.nv_ptr[-1])
-        dim = self.stencil.dim
+        dim = len(sorder) - 1
 
         istore, iload, ncond = self._get_istore_iload_symb(dim)
-        rhs, dist = self._get_rhs_dist_symb(ncond)
 
         idx = Idx(ix, (0, ncond))
-        fstore = indexed('f', [ns, nx, ny, nz], index=[istore[idx, k] for k in range(dim+1)], priority=sorder)
-        fload0 = indexed('f', [ns, nx, ny, nz], index=[iload[0][idx, k] for k in range(dim+1)], priority=sorder)
-        fload1 = indexed('f', [ns, nx, ny, nz], index=[iload[1][idx, k] for k in range(dim+1)], priority=sorder)
+        batch, loop = self._get_batch_symb(idx)
+        rhs, dist = self._get_rhs_dist_symb(ncond, idx, batch)
+        fstore = indexed('f', [ns, nx, ny, nz], index=[istore[idx, k] for k in range(dim+1)], priority=sorder, batch=batch, block=self.block)
+        fload0 = indexed('fcopy', [ns, nx, ny, nz], index=[iload[0][idx, k] for k in range(dim+1)], priority=sorder, batch=batch, block=self.block)
+        fload1 = indexed('fcopy', [ns, nx, ny, nz], index=[iload[1][idx, k] for k in range(dim+1)], priority=sorder, batch=batch, block=self.block)
 
-        self.generator.add_routine(('Bouzidi_anti_bounce_back', For(idx, Eq(fstore, -dist[idx]*fload0 + (1-dist[idx])*fload1 + rhs[idx]))))
+        self.generator.add_routine((self.name, For(loop, Eq(fstore, -dist*fload0 + (1-dist)*fload1 + rhs))), settings={'parallel': True})
 
     @property
     def function(self):
-        return self.generator.module.Bouzidi_anti_bounce_back
+        return getattr(self.generator.module, self.name)
 
 class Neumann(BoundaryMethod):
     """
@@ -634,20 +951,24 @@ class Neumann(BoundaryMethod):
         ----------
         sorder : list
             the order of nv, nx, ny and nz
+            (the order of nv and of the points for a compact storage)
         """
         from .generator import For
         from .symbolic import nx, ny, nz, indexed, ix
 
         ns = int(self.stencil.nv_ptr[-1])
-        dim = self.stencil.dim
+        dim = len(sorder) - 1
 
         istore, iload, ncond = self._get_istore_iload_symb(dim)
 
         idx = Idx(ix, (0, ncond))
-        fstore = indexed('f', [ns, nx, ny, nz], index=[istore[idx, k] for k in range(dim+1)], priority=sorder)
-        fload = indexed('f', [ns, nx, ny, nz], index=[iload[0][idx, k] for k in range(dim+1)], priority=sorder)
+        batch, loop = self._get_batch_symb(idx)
+        fstore = indexed('f', [ns, nx, ny, nz], index=[istore[idx, k] for k in range(dim+1)], priority=sorder, batch=batch, block=self.block)
+        fload = indexed('f', [ns, nx, ny, nz], index=[iload[0][idx, k] for k in range(dim+1)], priority=sorder, batch=batch, block=self.block)
 
-        self.generator.add_routine((self.name, For(idx, Eq(fstore, fload))))
+        # the values loaded can be stored by another condition:
+        # the loop stays serial
+        self.generator.add_routine((self.name, For(loop, Eq(fstore, fload))))
 
     @property
     def function(self):
@@ -4,11 +4,13 @@
 #
 # License: BSD 3 clause
 
-from .storage import Array, AOS, SOA
+import numpy as np
+
+from .storage import Array, AOS, SOA, CompactArray
 
 class BaseContainer:
     gpu_support = False
-    def __init__(self, domain, scheme, sorder, default_type):
+    def __init__(self, domain, scheme, sorder, default_type, nbatch=None, dtype=np.double, block=None):
         self.dim = domain.dim
         self.mpi_topo = domain.mpi_topo
 
@@ -16,13 +18,22 @@ class BaseContainer:
         self.nspace = domain.global_size
         self.vmax = domain.stencil.vmax
         self.sorder = sorder
+        self.nbatch = nbatch
+        self.dtype = np.dtype(dtype)
+        # size of the blocks of the AoSoA storage of the distribution functions
+        self.block = block
+        # the interfaces only exchange the distribution functions read by the transport
+        self.velocities = scheme.stencil.get_all_velocities()
 
         if sorder:
-            self.m = Array(self.nv, self.nspace, self.vmax, sorder, self.mpi_topo, gpu_support=self.gpu_support)
-            self.F = Array(self.nv, self.nspace, self.vmax, sorder, self.mpi_topo, gpu_support=self.gpu_support)
+            self.m = Array(self.nv, self.nspace, self.vmax, sorder, self.mpi_topo, dtype, gpu_support=self.gpu_support, nbatch=nbatch)
+            self.F = Array(self.nv, self.nspace, self.vmax, sorder, self.mpi_topo, dtype, gpu_support=self.gpu_support, nbatch=nbatch, block=block, velocities=self.velocities)
         else:
-            self.m = default_type(self.nv, self.nspace, self.vmax, self.mpi_topo, gpu_support=self.gpu_support)
-            self.F = default_type(self.nv, self.nspace, self.vmax, self.mpi_topo, gpu_support=self.gpu_support)
+            self.m = default_type(self.nv, self.nspace, self.vmax, self.mpi_topo, dtype, gpu_support=self.gpu_support, nbatch=nbatch)
+            if block is None:
+                self.F = default_type(self.nv, self.nspace, self.vmax, self.mpi_topo, dtype, gpu_support=self.gpu_support, nbatch=nbatch, velocities=self.velocities)
+            else:
+                self.F = Array(self.nv, self.nspace, self.vmax, None, self.mpi_topo, dtype, gpu_support=self.gpu_support, nbatch=nbatch, block=block, velocities=self.velocities)
             sorder = [i for i in range(self.dim + 1)]
 
         self.m.set_conserved_moments(scheme.consm)
@@ -30,12 +41,33 @@ class BaseContainer:
 
         self._set_sorder(sorder)
 
+    def set_compact(self, points):
+        """
+        Store the distribution functions only on the given points
+        (see CompactArray). The moments are still stored on the whole grid.
+
+        Parameters
+        ----------
+        points : ndarray
+            the indices (with the halo points) of the stored points,
+            array of shape (npoints, dim)
+        """
+        nspace = list(self.m.nspace)
+        in_place = self.Fnew is self.F
+        def compact():
+            array = CompactArray(self.nv, nspace, self.vmax, points, self.sorder, self.mpi_topo,
+                                 self.dtype, nbatch=self.nbatch, velocities=self.velocities)
+            array.set_conserved_moments(self.F.consm)
+            return array
+        self.F = compact()
+        self.Fnew = self.F if in_place else compact()
+
     def _set_sorder(self, sorder):
         pass
 
 class NumpyContainer(BaseContainer):
-    def __init__(self, domain, scheme, sorder=None, default_type=SOA):
-        super(NumpyContainer, self).__init__(domain, scheme, sorder, default_type)
+    def __init__(self, domain, scheme, sorder=None, default_type=SOA, nbatch=None, dtype=np.double, in_place=False): #pylint: disable=unused-argument
+        super(NumpyContainer, self).__init__(domain, scheme, sorder, default_type, nbatch, dtype)
         self.Fnew = self.F
 
     def _set_sorder(self, sorder):
@@ -43,10 +75,14 @@ class NumpyContainer(BaseContainer):
             self.sorder = [i for i in range(self.dim + 1)]
 
 class CythonContainer(BaseContainer):
-    def __init__(self, domain, scheme, sorder=None, default_type=AOS):
-        super(CythonContainer, self).__init__(domain, scheme, sorder, default_type)
-        self.Fnew = Array(self.nv, self.nspace, self.vmax, self.sorder, self.mpi_topo, gpu_support=self.gpu_support)
-        self.Fnew.set_conserved_moments(scheme.consm)
+    def __init__(self, domain, scheme, sorder=None, default_type=AOS, nbatch=None, dtype=np.double, in_place=False, block=None):
+        super(CythonContainer, self).__init__(domain, scheme, sorder, default_type, nbatch, dtype, block)
+        if in_place:
+            # the algorithm streams in place in F
+            self.Fnew = self.F
+        else:
+            self.Fnew = Array(self.nv, self.nspace, self.vmax, self.sorder, self.mpi_topo, dtype, gpu_support=self.gpu_support, nbatch=nbatch, block=block, velocities=self.velocities)
+            self.Fnew.set_conserved_moments(scheme.consm)
 
     def _set_sorder(self, sorder):
         if not self.sorder:
@@ -54,8 +90,8 @@ class CythonContainer(BaseContainer):
 
 class LoopyContainer(CythonContainer):
     gpu_support = True
-    def __init__(self, domain, scheme, sorder=None, default_type=AOS):
-        super(LoopyContainer, self).__init__(domain, scheme, sorder, default_type)
+    def __init__(self, domain, scheme, sorder=None, default_type=AOS, nbatch=None, dtype=np.double, in_place=False):
+        super(LoopyContainer, self).__init__(domain, scheme, sorder, default_type, nbatch, dtype, in_place)
 
     def move2gpu(self, array):
         try:
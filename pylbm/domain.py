@@ -100,6 +100,10 @@ class Domain:
                 :ref:`elements <mod_elements>`)
             - space_step : the spatial step
             - schemes : a list of dictionaries,
+            - decomposition : the splitting of the box between the
+              processes (optional): 'uniform' (default) for regions
+              of the same size or 'fluid' for regions with the same
+              number of fluid points,
 
         each of them defining a elementary
         :py:class:`Scheme <pylbm.Scheme>`
@@ -166,6 +170,8 @@ class Domain:
       :py:class:`Stencil <pylbm.stencil.Stencil>`)
     global_size : list
       number of points in each direction
+    decomposition : string
+      the splitting of the box between the processes ('uniform' or 'fluid')
     extent : list
       number of points to add on each side (max velocities)
     coords : ndarray
@@ -257,6 +263,7 @@ class Domain:
 
         self.box_label = copy.copy(self.geom.box_label)
 
+        self.decomposition = 'uniform' if dico is None else dico.get('decomposition', 'uniform')
         self.mpi_topo = None
         self.construct_mpi_topology(dico)
 
@@ -403,6 +410,9 @@ class Domain:
 
         # we now are sure that global_size item are integers
         self.global_size = np.asarray(self.global_size, dtype='int')
+        if self.decomposition == 'fluid':
+            # the cut planes balance the fluid points between the processes
+            self.mpi_topo.balance(self.get_fluid_weights(), self.stencil.vmax)
         # pylint: disable=no-value-for-parameter
         region = self.mpi_topo.get_region(*self.global_size)
         region_size = [r[1] - r[0] for r in region]
@@ -425,6 +435,47 @@ class Domain:
             for k in range(self.dim)
         ]
 
+    def get_fluid_weights(self, max_points=2**20):
+        """
+        Return the number of fluid points of each slice of the box
+        orthogonal to each direction.
+
+        The elements of the geometry are evaluated on a grid coarser
+        than the space step: the fluid points are estimated with the
+        centers of cells of step x step points.
+
+        Parameters
+        ----------
+
+        max_points : int
+            the maximal number of points of the coarse grid
+            (default is 2**20)
+
+        Returns
+        -------
+
+        list
+            the number of fluid points of each slice for each direction
+
+        """
+        phys_box = self.geom.bounds
+        step = int(np.ceil((np.prod(self.global_size)/max_points)**(1./self.dim)))
+        step = max(step, 1)
+        coarse = [np.arange(step//2, n, step) for n in self.global_size]
+        grid = np.meshgrid(*[phys_box[k][0] + self.dx*(coarse[k] + .5) for k in range(self.dim)],
+                           sparse=True, indexing='ij')
+
+        fluid = np.ones([c.size for c in coarse], dtype=bool)
+        for elem in self.geom.list_elem:
+            fluid[elem.point_inside(grid)] = elem.isfluid
+
+        weights = []
+        for k in range(self.dim):
+            axes = tuple(i for i in range(self.dim) if i != k)
+            count = step**(self.dim - 1)*np.sum(fluid, axis=axes)
+            weights.append(count[np.minimum(np.arange(self.global_size[k])//step, count.size - 1)])
+        return weights
+
     def get_bounds_halo(self):
         """
         Return the coordinates of the bottom right and upper left corner of the
@@ -512,6 +563,9 @@ class Domain:
         nmin = np.maximum(vmax, tmp)
         tmp = np.array((elem_ur - phys_bl)/self.dx, np.int) + vmax + 1
         nmax = np.minimum(vmax + self.shape_in, tmp)
+        if np.any(nmax <= nmin):
+            # the element does not cross the region of the process
+            return
 
         # set the grid
         space_slice = [slice(imin, imax) for imin, imax in zip(nmin, nmax)]
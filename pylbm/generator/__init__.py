@@ -1,4 +1,4 @@
 from .codegen import codegen, make_routine
-from .ast import For, If, IdxRange, IndexedIntBase
+from .ast import For, If, IdxRange, IndexedIntBase, MatrixProduct, BlockNumber, BlockLane
 from .autowrap import autowrap
 from .generator import Generator
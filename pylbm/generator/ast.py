@@ -872,7 +872,7 @@ class For(Token, WithBody):
     def _construct_target(cls, itr):
         from sympy.tensor import Idx
         from sympy.core.compatibility import is_sequence
-        if isinstance(itr, Idx):
+        if isinstance(itr, (Idx, IdxRange)):
             return Tuple(itr)
         elif is_sequence(itr):
             # return (*itr,)
@@ -1924,3 +1924,56 @@ from sympy.tensor import IndexedBase
 class IndexedIntBase(IndexedBase):
     is_integer = True
     is_Integer = True
+
+from sympy.core.function import Function
+class MatrixProduct(Function):
+    """
+    Product of a numeric matrix with an array along its velocity axis.
+
+    The arguments are the symbol of the matrix (given to the routine as
+    an argument), the indexed array where the velocity index is the Idx
+    given as last argument. Only the NumPy printer supports this node.
+    """
+    nargs = 3
+
+    @property
+    def matrix(self):
+        return self.args[0]
+
+    @property
+    def array(self):
+        return self.args[1]
+
+    @property
+    def velocity_index(self):
+        return self.args[2]
+
+class BlockNumber(Function):
+    """
+    Number of the block of a point in a storage by blocks (AoSoA):
+    the quotient of the index of the point by the size of the blocks.
+
+    The indices must be nonnegative.
+    """
+    nargs = 2
+    is_integer = True
+
+    @classmethod
+    def eval(cls, index, size):
+        if index.is_Integer and size.is_Integer:
+            return index//size
+
+class BlockLane(Function):
+    """
+    Position of a point inside its block in a storage by blocks (AoSoA):
+    the remainder of the index of the point by the size of the blocks.
+
+    The indices must be nonnegative.
+    """
+    nargs = 2
+    is_integer = True
+
+    @classmethod
+    def eval(cls, index, size):
+        if index.is_Integer and size.is_Integer:
+            return index % size
@@ -4,7 +4,9 @@
 import sys
 import os
 import shutil
+import hashlib
 import tempfile
+import importlib.util
 from subprocess import STDOUT, CalledProcessError, check_output
 
 from .codegen import get_code_generator
@@ -83,19 +85,20 @@ class CythonCodeWrapper(CodeWrapper):
     @property
     def command(self):
         bld = open(self.filename + '.pyxbld', "w")
+        if self.generator.num_threads is not None:
+            compile_args, link_args = ['-O3', '-fopenmp', '-w'], ['-fopenmp']
+        else:
+            compile_args, link_args = ['-O3', '-w'], []
         code = """
 def make_ext(modname, pyxfilename):
     from distutils.extension import Extension
 
     return Extension(name = modname,
                      sources=[pyxfilename],
-                     #extra_compile_args = ['-O3', '-fopenmp, '-w'],
-                     #extra_link_args= ['-fopenmp'])
-                     extra_compile_args = ['-O3', '-w']
-                     #extra_compile_args = ['-O3', '-fopenmp', '-w'],
-                     #extra_link_args= ['-fopenmp'])
+                     extra_compile_args = {compile_args},
+                     extra_link_args = {link_args}
                     )
-                    """
+                    """.format(compile_args=compile_args, link_args=link_args)
         bld.write(code)
         bld.close()
         bld = open('build.py', 'w')
@@ -129,18 +132,58 @@ class PythonCodeWrapper(CodeWrapper):
         if self.verbose:
             print(open(self.filename + '.py').read())
 
+class NumbaCodeWrapper(CodeWrapper):
+    """
+    Wrapper of the numba code.
+
+    The module is named after a hash of its code and is kept in the
+    directory of the generated code (by default ~/.cache/pylbm/numba)
+    so that the on-disk cache of numba is found by the next runs.
+    """
+    def wrap_code(self, routines):
+        try:
+            import numba
+        except ImportError:
+            raise ImportError("Please install numba")
+
+        [(_, code)] = self.generator.write(routines, self._module_name, False, True, False)
+        if self.verbose:
+            print(code)
+
+        workdir = self.filepath or os.path.join(os.path.expanduser('~'), '.cache', 'pylbm', 'numba')
+        if not os.path.exists(workdir):
+            os.makedirs(workdir, exist_ok=True)
+        module_name = "%s_%s" % (self._module_name, hashlib.sha1(code.encode()).hexdigest()[:16])
+        filename = os.path.join(workdir, module_name + '.py')
+        if not os.path.exists(filename):
+            # the processes can write the same module at the same time
+            tmp = "%s.%d" % (filename, os.getpid())
+            with open(tmp, 'w') as f:
+                f.write(code)
+            os.replace(tmp, filename)
+
+        spec = importlib.util.spec_from_file_location(module_name, filename)
+        mod = importlib.util.module_from_spec(spec)
+        # numba finds the globals of the cached functions in sys.modules
+        sys.modules[module_name] = mod
+        spec.loader.exec_module(mod)
+        CodeWrapper._module_counter += 1
+        return mod
+
 def get_code_wrapper(backend):
     CodeWrapClass = {"NUMPY" : PythonCodeWrapper,
                      "CYTHON": CythonCodeWrapper,
+                     "NUMBA": NumbaCodeWrapper,
                      "LOOPY": PythonCodeWrapper}.get(backend.upper())
     if CodeWrapClass is None:
         raise ValueError("Language '%s' is not supported." % backend)
     return CodeWrapClass
 
 def autowrap(routines, backend='cython', tempdir=None, args=None, flags=[],
-    verbose=False):
+    verbose=False, precision=None, num_threads=None):
 
-    code_generator = get_code_generator(backend, "project")
+    code_generator = get_code_generator(backend, "project", precision=precision,
+                                        num_threads=num_threads)
     CodeWrapperClass = get_code_wrapper(backend)
     code_wrapper = CodeWrapperClass(code_generator, tempdir, flags, verbose)
 
@@ -102,10 +102,13 @@ unsurmountable issues that can only be tackled with dedicated code generator:
 
 import os
 import textwrap
+from collections import OrderedDict
 from io import StringIO
 
+import numpy as np
+
 from sympy import __version__ as sympy_version
-from .ast import Assignment, For, If, WithBody
+from .ast import Assignment, CodeBlock, For, If, IdxRange, WithBody
 # from sympy.codegen import Assignment
 from sympy.core import Symbol, S, Tuple, Equality, Function, Basic
 from sympy.core.compatibility import is_sequence
@@ -115,6 +118,7 @@ from sympy.matrices import (MatrixSymbol, ImmutableMatrix, MatrixBase,
 
 from .printing.pycode import NumPyPrinter
 from .printing.cython import CythonCodePrinter
+from .printing.numba import NumbaCodePrinter
 from .printing.loopy import LoopyCodePrinter
 
 __all__ = [
@@ -122,7 +126,7 @@ __all__ = [
     "Routine",
     "Argument", "InputArgument", "OutputArgument", "Result",
     # routines -> code
-    "CodeGen", "CythonCodeGen", "NumPyCodeGen", "LoopyCodeGen",
+    "CodeGen", "CythonCodeGen", "NumPyCodeGen", "NumbaCodeGen", "LoopyCodeGen",
     # friendly functions
     "codegen", "make_routine",
 ]
@@ -229,6 +233,8 @@ class Routine:
         self.local_vars = local_vars
         self.global_vars = global_vars
         self.settings = settings
+        self._cost = None
+        self._nodes = None
 
     def __str__(self):
         return self.__class__.__name__ + "({name!r}, {arguments}, {results}, {statements}, {local_vars}, {global_vars})".format(**self.__dict__)
@@ -261,6 +267,193 @@ class Routine:
         args.extend(self.results)
         return args
 
+    def cost(self, itemsize=8):
+        """Returns the cost of the routine per lattice node.
+
+        The cost is the number of arithmetic operations of the body of
+        the loops after a common subexpression elimination and the number
+        of bytes loaded and stored in the arrays given as arguments
+        (each element is counted once per node even if it is read several
+        times).
+
+        Parameters
+        ==========
+
+        itemsize : int
+            The size in bytes of an element of the arrays.
+
+        Returns
+        =======
+
+        (flops, nbytes) : tuple of int
+
+        """
+        if self._cost is None:
+            self._cost = _routine_cost(self.statements)
+        flops, nitems = self._cost
+        return flops, nitems*itemsize
+
+    def nodes(self):
+        """Returns the number of lattice nodes visited by a call of the routine.
+
+        The number is given by the loops over the space (and over the
+        members of an ensemble or the fluid points), the only ones
+        with symbolic bounds: it depends on the arguments of the call
+        (a box given by its bounds, the size of the arrays, ...).
+
+        Returns
+        =======
+
+        (names, function) : tuple
+            the names of the arguments used by the count and the
+            function which returns the number of nodes from their values
+
+        """
+        if self._nodes is None:
+            from sympy import lambdify
+            nodes = _loop_nodes(self.statements)
+            symbols = sorted(nodes.free_symbols, key=str)
+            self._nodes = ([str(s) for s in symbols], lambdify(symbols, nodes, [{'Max': max, 'Min': min}, 'math']))
+        return self._nodes
+
+def _extent(index, tiles):
+    """Number of lattice nodes of a loop index (1 for the other loops)."""
+    if isinstance(index, IdxRange):
+        # the loop over the tiles covers the whole range
+        return index.stop - index.start
+    if not isinstance(index, Idx) or index.lower is None:
+        return S.One
+    extent = index.upper - index.lower
+    if extent.is_Integer or extent.free_symbols & tiles:
+        # a loop over the velocities or inside a tile
+        return S.One
+    return extent
+
+def _loop_nodes(statements):
+    """Number of lattice nodes visited by the loop nests of statements."""
+    from sympy import Max
+    nodes = []
+    for statement in statements:
+        if isinstance(statement, For):
+            tiles = {i.label for i in statement.target if isinstance(i, IdxRange)}
+            extent = S.One
+            for index in statement.target:
+                extent *= _extent(index, tiles)
+            nodes.append(extent*_loop_nodes(statement.body.args))
+        elif isinstance(statement, If):
+            nodes.extend(_loop_nodes(body) for _, body in statement.args)
+        elif is_sequence(statement) or isinstance(statement, CodeBlock):
+            nodes.append(_loop_nodes(statement))
+    # the loop nests of a routine run over the same nodes
+    return Max(S.One, *nodes)
+
+def _assignments(statements):
+    """Yield the conditions and the scalar assignments of a list of statements."""
+    for statement in statements:
+        if isinstance(statement, For):
+            yield from _assignments(statement.body.args)
+        elif isinstance(statement, If):
+            for cond, body in statement.args:
+                yield cond, None
+                yield from _assignments(body)
+        elif isinstance(statement, (Equality, Assignment)):
+            lhs, rhs = statement.lhs, statement.rhs
+            if isinstance(lhs, MatrixBase):
+                yield from zip(lhs, rhs)
+            else:
+                yield lhs, rhs
+        elif is_sequence(statement) or isinstance(statement, CodeBlock):
+            yield from _assignments(statement)
+
+def _items(indexed):
+    """Number of elements of an indexed array accessed per lattice node."""
+    # the upper bounds are excluded as in the loops printed by the generators;
+    # the loops over the space are the only ones with symbolic bounds,
+    # the other ranges are vectorized over a fixed size (the velocities)
+    items = 1
+    for i in indexed.indices:
+        if isinstance(i, Idx) and i.lower is not None and (i.upper - i.lower).is_Integer:
+            items *= int(i.upper - i.lower)
+    return items
+
+def _routine_cost(statements):
+    """Count the operations and the array elements accessed per lattice node."""
+    from sympy import count_ops, cse
+    from sympy.matrices.expressions.matexpr import MatrixElement
+    from .ast import MatrixProduct
+
+    reads, writes = set(), set()
+    exprs, flops = [], 0
+    for lhs, rhs in _assignments(statements):
+        if rhs is None:
+            # a condition of an If
+            reads.update(lhs.atoms(Indexed))
+            continue
+        if isinstance(lhs, Indexed):
+            writes.add(lhs)
+        if isinstance(rhs, MatrixProduct):
+            flops += 2*_items(lhs)*_items(rhs.array)
+            reads.add(rhs.array)
+            continue
+        reads.update(rhs.atoms(Indexed))
+        exprs.append(rhs)
+
+    # the accesses to the arrays are leaves for the count of the operations
+    leaves = set()
+    for expr in exprs:
+        leaves.update(expr.atoms(Indexed, MatrixElement))
+    leaves = {l: Symbol('_leaf{}'.format(i)) for i, l in enumerate(sorted(leaves, key=str))}
+    exprs = [expr.xreplace(leaves) for expr in exprs]
+
+    replacements, reduced = cse(exprs)
+    flops += sum(count_ops(e) for _, e in replacements)
+    flops += sum(count_ops(e) for e in reduced)
+    nitems = sum(_items(a) for a in reads) + sum(_items(a) for a in writes)
+    return int(flops), nitems
+
+class Driver:
+    """
+    Loop over the time steps which calls generated routines.
+
+    The generated function is called as
+
+        t = name(nsteps, exchange, t, dt, f, fnew, ...)
+
+    and makes nsteps time steps: exchange (None or a function) is called
+    with the parity of the step at the beginning of each time step, then
+    the routines are called in the order of calls and f and fnew are
+    swapped at the end. The other arguments are the arguments of the
+    routines prefixed by 'a<i>_' where i is the index of the call.
+    The time is returned.
+
+    Parameters
+    ==========
+
+    name : string
+        Name of the driver.
+
+    calls : list
+        The routines called at each time step given as tuples
+        (name, roles) where roles gives the role of some arguments:
+        'f' and 'fnew' (the distribution functions swapped at the end
+        of each time step), 't' (the time) or 'copy' (an array where
+        f is copied before the call).
+
+    """
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+
+    def arguments(self, i, names):
+        """
+        Return the names of the arguments of the driver
+        given to the arguments names of the call i.
+        """
+        roles = self.calls[i][1]
+        return [n if roles.get(n, None) in ('f', 'fnew', 't') else 'a%d_%s'%(i, n)
+                for n in names]
+
+
 COMPLEX_ALLOWED = False
 def get_default_datatype(expr, complex_allowed=None):
     """Derives an appropriate datatype based on the expression."""
@@ -513,7 +706,11 @@ class CodeGen:
 
     printer = None  # will be set to an instance of a CodePrinter subclass
     default_datatypes = None
+    array_datatypes = None
+    float_datatypes = None
     has_output = True
+    # number of OpenMP threads of the parallel loops (None is serial)
+    num_threads = None
 
     def _indent_code(self, codelines):
         return self.printer.indent_code(codelines)
@@ -531,6 +728,34 @@ class CodeGen:
     def _get_type(self, stype):
         return self.default_datatypes[stype]
 
+    def _get_array_type(self, stype):
+        if self.array_datatypes is None:
+            return self._get_type(stype)
+        return self.array_datatypes[stype]
+
+    def set_precision(self, dtype, compute_dtype=None):
+        """
+        Set the types of the floating point numbers.
+
+        Parameters
+        ----------
+
+        dtype : numpy type
+            the type of the arrays (float32 or float64)
+        compute_dtype : numpy type
+            the type of the scalars and of the local variables
+            (default is dtype)
+
+        """
+        if self.float_datatypes is None:
+            return
+        if compute_dtype is None:
+            compute_dtype = dtype
+        self.array_datatypes = dict(self.default_datatypes,
+                                    float=self.float_datatypes[np.dtype(dtype)])
+        self.default_datatypes = dict(self.default_datatypes,
+                                      float=self.float_datatypes[np.dtype(compute_dtype)])
+
     def _get_symbol(self, s):
         """Returns the symbol as fcode prints it."""
         if self.printer._settings['human']:
@@ -631,7 +856,7 @@ class CodeGen:
                     # remove duplicate arguments when they are not local variables
                     if symbol not in local_vars:
                         # avoid duplicate arguments
-                        symbols.remove(symbol)
+                        symbols.discard(symbol)
                 elif isinstance(expr, WithBody): # we should add all the classes which have a CodeBlock
                     new_expr.append(expr)
                 elif isinstance(expr, (ImmutableMatrix, MatrixSlice)):
@@ -714,6 +939,13 @@ class CodeGen:
         symbols = (expressions.free_symbols | local_expressions.free_symbols) - local_symbols - global_vars
         symbols = self._update_symbols(symbols)
 
+        # the symbolic bounds of the loops are arguments
+        labels = {i.label for i in idx_vars} | {i.label for i in expressions.atoms(IdxRange)}
+        for i in idx_vars:
+            for bound in (i.lower, i.upper):
+                if bound is not None:
+                    symbols.update(bound.free_symbols - labels - local_symbols - global_vars)
+
         statements, return_val, output_args = self._get_statements_and_outputs(name, expressions, symbols, local_vars)
         expressions = Tuple(*statements)
 
@@ -773,6 +1005,13 @@ class CodeGen:
                     new_args.append(InputArgument(symbol, **metadata))
             arg_list = new_args
 
+        # the arrays which accumulate sums are stored in double precision
+        # whatever the type of the other arrays
+        double_arrays = (settings or {}).get('double_arrays', ())
+        for arg in arg_list:
+            if str(arg.name) in double_arrays:
+                arg.datatype = 'double'
+
         return Routine(name, arg_list, return_val, statements, idx_vars, local_vars, global_vars, settings)
 
     def write(self, routines, prefix, to_files=False, header=True, empty=True):
@@ -850,6 +1089,9 @@ class CodeGen:
         code_lines = self._preprocessor_statements(prefix)
 
         for routine in routines:
+            if isinstance(routine, Driver):
+                code_lines.extend(self._get_driver(routine, routines))
+                continue
             if empty:
                 code_lines.append("\n")
             code_lines.extend(self._get_routine_opening(routine))
@@ -872,6 +1114,30 @@ class CodeGen:
             f.write(code_lines)
 
 
+    def _driver_calls(self, driver, routines):
+        """
+        Return the arguments of the driver (after nsteps, exchange, t and dt)
+        as an ordered dictionary of routine arguments and the calls of the
+        driver as tuples (name, arguments of the driver given to the
+        routine, arrays where f is copied).
+        """
+        routines = {r.name: r for r in routines if isinstance(r, Routine)}
+        arguments = OrderedDict()
+        calls = []
+        for i, (name, roles) in enumerate(driver.calls):
+            names = [str(arg.name) for arg in routines[name].arguments]
+            values = driver.arguments(i, names)
+            for arg, value in zip(routines[name].arguments, values):
+                if value != 't':
+                    arguments.setdefault(value, arg)
+            copies = [v for n, v in zip(names, values) if roles.get(n, None) == 'copy']
+            calls.append((name, values, copies))
+        return arguments, calls
+
+    def _get_driver(self, driver, routines):
+        raise CodeGenError("%s: the drivers are not supported" % self.__class__.__name__)
+
+
 class CodeGenError(Exception):
     pass
 
@@ -901,11 +1167,16 @@ class CythonCodeGen(CodeGen):
 
     default_datatypes = {'int': 'int',
                          'float': 'double',
+                         'double': 'double',
                          'complex': 'double'}
 
+    float_datatypes = {np.dtype('float32'): 'float',
+                       np.dtype('float64'): 'double'}
+
     def __init__(self, project='project', printer=None, settings={}):
         super(CythonCodeGen, self).__init__(project)
         self.printer = printer or CythonCodePrinter(settings)
+        self._driven = set()
 
     def _get_header(self):
         code_lines = []
@@ -925,56 +1196,52 @@ class CythonCodeGen(CodeGen):
                       "#import cython\n",
                       "from libc.math cimport *\n",
                      ]
+        if self.num_threads is not None:
+            code_lines.append("from cython.parallel cimport prange\n")
         return code_lines + ["\n\n"]
 
     def _preprocessor_statements(self, prefix):
 
         return []
 
+    def _get_argument(self, arg, name=None, export=True):
+        """Returns the declaration of the argument arg."""
+        if isinstance(arg, OutputArgument):
+            raise CodeGenError("Cython: invalid argument of type %s" %
+                               str(type(arg)))
+
+        if not isinstance(arg, (InputArgument, InOutArgument)):
+            raise CodeGenError("Unknown Argument type: %s" % type(arg))
+
+        name = name or self._get_symbol(arg.name)
+
+        if not arg.dimensions:
+            # If it is a scalar
+            if isinstance(arg, ResultBase):
+                # if it is an output
+                return "*%s %s" % (self._get_type(arg.datatype), name)
+            return "%s %s" % (self._get_type(arg.datatype), name)
+        if not export and len(arg.dimensions) == 1:
+            # if the dimension is 1
+            return "*%s %s" % (self._get_type(arg.datatype), name)
+        array_type = self._get_array_type(arg.datatype) + '[' + ', '.join([':']*len(arg.dimensions)) + ':1]'
+        return "%s %s" % (array_type, name)
+
     def _get_routine_opening(self, routine):
         """Returns the opening statements of the routine."""
         code_list = []
 
         export = True
         # export = self.settings.pop('export', True)
-        if export:
-            code_list.append("def ")
+        args = ", ".join(self._get_argument(arg, export=export) for arg in routine.arguments)
+        if routine.name in self._driven:
+            # the body is a C function called by the drivers
+            # and by a python function (see _get_routine_ending)
+            code_list.append("cdef void _%s(%s):\n" % (routine.name, args))
+        elif export:
+            code_list.append("def %s(%s):\n" % (routine.name, args))
         else:
-            code_list.append("cdef void ")
-
-        # Inputs
-        args = []
-
-        for arg in routine.arguments:
-            if isinstance(arg, OutputArgument):
-                raise CodeGenError("Cython: invalid argument of type %s" %
-                                   str(type(arg)))
-
-            if isinstance(arg, (InputArgument, InOutArgument)):
-
-                name = self._get_symbol(arg.name)
-
-                if not arg.dimensions:
-                    # If it is a scalar
-                    if isinstance(arg, ResultBase):
-                        # if it is an output
-                        args.append("*%s %s" % (self._get_type(arg.datatype), name))
-                    else:
-                        # if it is an output
-                        args.append("%s %s" % (self._get_type(arg.datatype), name))
-                else:
-                    if not export and len(arg.dimensions) == 1:
-                        # if the dimension is 1
-                        args.append("*%s %s" % (self._get_type(arg.datatype), name))
-                    else:
-                        array_type = self._get_type(arg.datatype) + '[' + ', '.join([':']*len(arg.dimensions)) + ':1]'
-                        args.append("%s %s" % (array_type, name))
-            else:
-                raise CodeGenError("Unknown Argument type: %s" % type(arg))
-
-        args = ", ".join(args)
-        code_list.append("%s(%s)%s\n" % (routine.name, args, ":" if export else " nogil:"))
-        code_list = [ "".join(code_list) ]
+            code_list.append("cdef void %s(%s) nogil:\n" % (routine.name, args))
 
         return code_list
 
@@ -984,17 +1251,35 @@ class CythonCodeGen(CodeGen):
     def _declare_globals(self, routine):
         return []
 
+    def _is_parallel(self, routine):
+        """
+        Return True if the outermost loop of the routine is
+        a prange loop.
+
+        The local arrays are shared by the threads: only the routines
+        whose local arrays are matrix symbols (declared as scalars)
+        can be parallel.
+        """
+        if self.num_threads is None or not routine.settings.get('parallel', False):
+            return False
+        return all(isinstance(g, (Symbol, MatrixSymbol)) for g in routine.local_vars)
+
     def _declare_locals(self, routine):
         args = []
         for l in routine.idx_vars:
             args.append("cdef int %s\n" % self._get_symbol(l))
 
+        parallel = self._is_parallel(routine)
         for g in routine.local_vars:
             if isinstance(g, Symbol):
-                args.append("cdef double %s\n"%(self._get_symbol(g)))
+                args.append("cdef %s %s\n"%(self._get_type('float'), self._get_symbol(g)))
+            elif parallel:
+                # one scalar per element to have private variables in prange
+                names = ['%s_%d'%(g.name, i) for i in range(g.shape[0]*g.shape[1])]
+                args.append("cdef %s %s\n"%(self._get_type('float'), ', '.join(names)))
             else:
                 shape = [d for d in g.shape if d!=1]
-                args.append("cdef double %s[%s]\n"%(self._get_symbol(g), ','.join("%s"%s for s in shape)))
+                args.append("cdef %s %s[%s]\n"%(self._get_type('float'), self._get_symbol(g), ','.join("%s"%s for s in shape)))
         return ["".join(args)]
 
     def _call_printer(self, routine):
@@ -1019,8 +1304,10 @@ class CythonCodeGen(CodeGen):
             if isinstance(statement, Equality):
                 expr = Assignment(statement.lhs, statement.rhs)
 
-            settings = routine.settings
-            settings.update(dict(human=False, dereference=dereference))
+            settings = dict(routine.settings)
+            settings.update(dict(human=False, dereference=dereference,
+                                 parallel=self._is_parallel(routine),
+                                 num_threads=self.num_threads))
             constants, not_c, c_expr = self._printer_method_with_settings(
                 'doprint', settings,
                 expr)
@@ -1032,13 +1319,48 @@ class CythonCodeGen(CodeGen):
         return code_lines
 
     def _get_routine_ending(self, routine):
-        return ["#end\n"]
+        if routine.name not in self._driven:
+            return ["#end\n"]
+        args = ", ".join(self._get_argument(arg) for arg in routine.arguments)
+        names = ", ".join(self._get_symbol(arg.name) for arg in routine.arguments)
+        return ["#end\n",
+                "def %s(%s):\n" % (routine.name, args),
+                "_%s(%s)\n" % (routine.name, names),
+                "#end\n"]
+
+    def _get_driver(self, driver, routines):
+        """
+        Returns the driver: the loop over the time steps is compiled
+        and the routines are called as C functions.
+        """
+        arguments, calls = self._driver_calls(driver, routines)
+        args = ["int nsteps", "exchange", "double t", "double dt"]
+        args += [self._get_argument(arg, name) for name, arg in arguments.items()]
+        code_lines = ["\n",
+                      "def %s(%s):\n" % (driver.name, ", ".join(args)),
+                      "cdef int step\n"]
+        if 'f' in arguments:
+            code_lines.append("cdef %s\n" % self._get_argument(arguments['f'], 'ftmp'))
+        code_lines += ["for step in range(nsteps):\n",
+                       "if exchange is not None:\n",
+                       "exchange(step % 2)\n",
+                       "#end\n"]
+        for name, values, copies in calls:
+            code_lines += ["%s[...] = f\n" % copy for copy in copies]
+            code_lines.append("_%s(%s)\n" % (name, ", ".join(values)))
+        if 'fnew' in arguments:
+            code_lines += ["ftmp = f\n", "f = fnew\n", "fnew = ftmp\n"]
+        code_lines += ["t = t + dt\n", "#end\n", "return t\n", "#end\n"]
+        return code_lines
 
     def _indent_code(self, codelines):
         p = CythonCodePrinter()
         return p.indent_code(codelines)
 
     def dump_pyx(self, routines, f, prefix, header=True, empty=True):
+        # the routines called by the drivers
+        self._driven = {name for driver in routines if isinstance(driver, Driver)
+                        for name, _ in driver.calls}
         self.dump_code(routines, f, prefix, header, empty)
 
     dump_pyx.extension = code_extension
@@ -1147,6 +1469,24 @@ class NumPyCodeGen(CodeGen):
             code_lines.append("%s\n" % (py_expr))
         return declarations + code_lines
 
+    def _get_driver(self, driver, routines):
+        """Returns the driver: the loop over the time steps in python."""
+        arguments, calls = self._driver_calls(driver, routines)
+        args = ["nsteps", "exchange", "t", "dt"] + list(arguments)
+        code_lines = ["\n",
+                      "def %s(%s):\n" % (driver.name, ", ".join(args)),
+                      "for step in range(nsteps):\n",
+                      "if exchange is not None:\n",
+                      "exchange(step % 2)\n",
+                      "#end\n"]
+        for name, values, copies in calls:
+            code_lines += ["numpy.copyto(%s, f)\n" % copy for copy in copies]
+            code_lines.append("%s(%s)\n" % (name, ", ".join(values)))
+        if 'fnew' in arguments:
+            code_lines.append("f, fnew = fnew, f\n")
+        code_lines += ["t = t + dt\n", "#end\n", "return t\n", "#end\n"]
+        return code_lines
+
     def _indent_code(self, codelines):
         p = NumPyPrinter()
         return p.indent_code(codelines)
@@ -1161,6 +1501,104 @@ class NumPyCodeGen(CodeGen):
     # functions it has to call.
     dump_fns = [dump_py]
 
+class NumbaCodeGen(CodeGen):
+    """Generator for Python code with explicit loops compiled by numba.
+
+    The .write() method inherited from CodeGen will output a code file
+    <prefix>.py where each routine is decorated by numba.njit.
+
+    """
+
+    code_extension = "py"
+    has_output = False
+
+    def __init__(self, project='project', printer=None, settings={}):
+        super(NumbaCodeGen, self).__init__(project)
+        self.printer = printer or NumbaCodePrinter(settings)
+
+    def _get_header(self):
+        code_lines = []
+        tmp = header_comment % {"version": sympy_version,
+            "project": self.project}
+        for line in tmp.splitlines():
+            if line == '':
+                code_lines.append("#\n")
+            else:
+                code_lines.append("#   %s\n" % line)
+        code_lines += ["import math\n",
+                       "import numpy\n",
+                       "import numba\n",
+                       "\n\n"]
+        return code_lines
+
+    def _preprocessor_statements(self, prefix):
+        return []
+
+    def _is_parallel(self, routine):
+        """
+        Return True if the outermost loop of the routine is
+        a numba.prange loop.
+        """
+        if not routine.settings.get('parallel', False):
+            return False
+        return all(isinstance(g, (Symbol, MatrixSymbol)) for g in routine.local_vars)
+
+    def _get_routine_opening(self, routine):
+        """Returns the opening statements of the routine."""
+        args = []
+        for arg in routine.arguments:
+            if not isinstance(arg, (InputArgument, InOutArgument)):
+                raise CodeGenError("Numba: invalid argument of type %s" %
+                                   str(type(arg)))
+            args.append(self._get_symbol(arg.name))
+
+        parallel = ", parallel=True" if self._is_parallel(routine) else ""
+        return ["@numba.njit(cache=True%s)\n" % parallel,
+                "def %s(%s):\n" % (routine.name, ", ".join(args))]
+
+    def _declare_arguments(self, routine):
+        return []
+
+    def _declare_globals(self, routine):
+        return []
+
+    def _declare_locals(self, routine):
+        return []
+
+    def _call_printer(self, routine):
+        code_lines = []
+        for statement in routine.statements:
+            expr = statement
+            if isinstance(statement, Equality):
+                expr = Assignment(statement.lhs, statement.rhs)
+
+            settings = dict(routine.settings)
+            settings.update(dict(human=False, parallel=self._is_parallel(routine)))
+            constants, not_supported, py_expr = self._printer_method_with_settings(
+                'doprint', settings, expr)
+
+            for name, value in sorted(constants, key=str):
+                code_lines.append("%s = %s\n" % (name, value))
+            code_lines.append("%s\n" % py_expr)
+        return code_lines
+
+    def _get_routine_ending(self, routine):
+        return ["#end\n"]
+
+    def _indent_code(self, codelines):
+        p = NumbaCodePrinter()
+        return p.indent_code(codelines)
+
+    def dump_py(self, routines, f, prefix, header=True, empty=True):
+        self.dump_code(routines, f, prefix, header, empty)
+
+    dump_py.extension = code_extension
+    dump_py.__doc__ = CodeGen.dump_code.__doc__
+
+    # This list of dump functions is used by CodeGen.write to know which dump
+    # functions it has to call.
+    dump_fns = [dump_py]
+
 class LoopyCodeGen(CodeGen):
     """Generator for Cython code.
 
@@ -1175,8 +1613,12 @@ class LoopyCodeGen(CodeGen):
 
     default_datatypes = {'int': 'int',
                          'float': 'float',
+                         'double': 'np.float64',
                          'complex': 'complex'}
 
+    float_datatypes = {np.dtype('float32'): 'np.float32',
+                       np.dtype('float64'): 'np.float64'}
+
     def __init__(self, project='project', printer=None, settings={}):
         super(LoopyCodeGen, self).__init__(project)
         self.printer = printer or LoopyCodePrinter(settings)
@@ -1259,7 +1701,7 @@ class LoopyCodeGen(CodeGen):
                 name = self._get_symbol(arg.name)
                 if arg.dimensions:
                     dims = ["{}".format(d[1]-d[0]+1) for d in arg.dimensions]
-                    dtype = self._get_type(arg.datatype)
+                    dtype = self._get_array_type(arg.datatype)
                     if dtype == 'int':
                         dtype = 'np.int32'
                     args.append('lp.GlobalArg("{name}", dtype={dtype}, shape="{shape}")'.format(name=name, dtype=dtype, shape=", ".join(dims)))
@@ -1267,10 +1709,10 @@ class LoopyCodeGen(CodeGen):
                     args.append('lp.ValueArg("{name}", dtype={dtype})'.format(name=name, dtype=self._get_type(arg.datatype)))
         for i, arg in enumerate(routine.local_vars):
             if isinstance(arg, Symbol):
-                args.append('lp.TemporaryVariable("{name}", dtype=float)'.format(name=self._get_symbol(arg)))
+                args.append('lp.TemporaryVariable("{name}", dtype={dtype})'.format(name=self._get_symbol(arg), dtype=self._get_type('float')))
             else:
                 dims = [d for d in arg.shape if d!=1]
-                args.append('lp.TemporaryVariable("{name}", dtype=float, shape="{shape}")'.format(name=self._get_symbol(arg), shape=','.join("%s"%s for s in dims)))
+                args.append('lp.TemporaryVariable("{name}", dtype={dtype}, shape="{shape}")'.format(name=self._get_symbol(arg), dtype=self._get_type('float'), shape=','.join("%s"%s for s in dims)))
 
         code_list.append('[')
         args = ",\n".join(args)
@@ -1285,6 +1727,7 @@ class LoopyCodeGen(CodeGen):
             block_size = [16, 16]
         if dim == 3:
             block_size = [4, 4, 4]
+        block_size = routine.settings.get("block_size", None) or block_size
 
         # for i, idx in enumerate(routine.idx_vars[-1::-1]):
         i = 0
@@ -1320,13 +1763,18 @@ class LoopyCodeGen(CodeGen):
     dump_fns = [dump_py]
 
 
-def get_code_generator(language, project=None, standard=None, printer=None, settings=None):
+def get_code_generator(language, project=None, standard=None, printer=None, settings=None, precision=None, num_threads=None):
     CodeGenClass = {"NUMPY": NumPyCodeGen,
                     "CYTHON": CythonCodeGen,
+                    "NUMBA": NumbaCodeGen,
                     "LOOPY": LoopyCodeGen}.get(language.upper())
     if CodeGenClass is None:
         raise ValueError("Language '%s' is not supported." % language)
-    return CodeGenClass(project, printer, settings=settings)
+    code_gen = CodeGenClass(project, printer, settings=settings)
+    if precision is not None:
+        code_gen.set_precision(*precision)
+    code_gen.num_threads = num_threads
+    return code_gen
 
 #
 # Friendly functions
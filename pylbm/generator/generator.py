@@ -2,17 +2,25 @@
 # pylint: disable=all
 
 import collections
-from .codegen import make_routine
+import numpy as np
+from .codegen import make_routine, Driver
 from .autowrap import autowrap
 
 
 class Generator:
-    def __init__(self, backend, directory=None, verbose=False):
+    def __init__(self, backend, directory=None, verbose=False,
+                 dtype=np.double, compute_dtype=None, num_threads=None):
         self.routines = collections.OrderedDict()
+        self.drivers = []
         self.module = None
         self.directory = directory
         self.backend = backend
         self.verbose = verbose
+        # type of the arrays and type of the local computations
+        self.dtype = np.dtype(dtype)
+        self.compute_dtype = np.dtype(compute_dtype if compute_dtype else dtype)
+        # number of OpenMP threads of the parallel loops (cython only)
+        self.num_threads = num_threads
 
     def add_routine(self, name_expr,
                     local_vars=None, settings={}):
@@ -21,8 +29,24 @@ class Generator:
                                                    language=self.backend,
                                                    settings=settings)
 
+    def add_driver(self, name, calls):
+        """
+        Add a function which loops over the time steps and calls
+        the routines of calls at each time step (see Driver).
+        """
+        self.drivers.append(Driver(name, calls))
+
+    def cost(self, name):
+        """
+        Return the number of operations and the number of bytes
+        loaded and stored per lattice node by the routine name.
+        """
+        return self.routines[name].cost(self.dtype.itemsize)
+
     def compile(self):
-        self.module = autowrap(self.routines.values(),
+        self.module = autowrap(list(self.routines.values()) + self.drivers,
                                self.backend,
                                self.directory,
-                               verbose=self.verbose)
+                               verbose=self.verbose,
+                               precision=(self.dtype, self.compute_dtype),
+                               num_threads=self.num_threads)
@@ -3,7 +3,7 @@ from sympy.printing.codeprinter import CodePrinter
 from sympy.core import sympify, Eq
 from sympy.core.basic import Basic
 from sympy.core.symbol import Symbol
-from ..ast import Assignment
+from ..ast import Assignment, IdxRange
 
 from sympy.printing.precedence import precedence
 from sympy.sets.fancysets import Range
@@ -83,6 +83,8 @@ class CythonCodePrinter(CodePrinter):
         'dereference': set(),
         'error_on_reserved': False,
         'reserved_word_suffix': '_',
+        'parallel': False,
+        'num_threads': None,
     }
 
     def __init__(self, settings=None):
@@ -93,6 +95,7 @@ class CythonCodePrinter(CodePrinter):
         self.known_functions.update(userfuncs)
         self._dereference = set(settings.get('dereference', []))
         self.reserved_words = set(reserved_words)
+        self._in_prange = False
 
     def doprint(self, expr, assign_to=None):
         """
@@ -213,6 +216,30 @@ class CythonCodePrinter(CodePrinter):
     def _print_Idx(self, expr):
         return self._print(expr.label)
 
+    def _print_BlockNumber(self, expr):
+        # the indices are nonnegative: shift for a power of 2
+        # and the C division is the floor division otherwise
+        index, size = expr.args
+        if size.is_Integer and int(size) & (int(size) - 1) == 0:
+            return "(%s) >> %d"%(self._print(index), int(size).bit_length() - 1)
+        return "(%s)//%s"%(self._print(index), self._print(size))
+
+    def _print_BlockLane(self, expr):
+        index, size = expr.args
+        if size.is_Integer and int(size) & (int(size) - 1) == 0:
+            return "(%s) & %d"%(self._print(index), int(size) - 1)
+        return "(%s)%%%s"%(self._print(index), self._print(size))
+
+    def _print_Min(self, expr):
+        if len(expr.args) == 1:
+            return self._print(expr.args[0])
+        return "min(%s, %s)"%(self._print(expr.args[0]), self._print(expr.func(*expr.args[1:])))
+
+    def _print_Max(self, expr):
+        if len(expr.args) == 1:
+            return self._print(expr.args[0])
+        return "max(%s, %s)"%(self._print(expr.args[0]), self._print(expr.func(*expr.args[1:])))
+
     def _print_Exp1(self, expr):
         return "M_E"
 
@@ -225,18 +252,18 @@ class CythonCodePrinter(CodePrinter):
     def _print_NegativeInfinity(self, expr):
         return '-HUGE_VAL'
 
-    # TODO Loic: fix
-    # def _print_If(self, expr):
-    #     lines = []
-    #     for c, e in expr.statement:
-    #         #temp1, temp2, cond = self.doprint(c)
-    #         c = c.replace(Eq, AssignmentIf)
-    #         lines.append("if %s:"%self._print(c))
-    #         for ee in e:
-    #             temp1, temp2, output = self.doprint(ee)
-    #             lines.append(output)
-    #     lines.append("#end")
-    #     return "\n".join(lines)
+    def _print_If(self, expr):
+        lines = []
+        for i, (c, e) in enumerate(expr.statement):
+            lines.append("%s %s:"%('if' if i == 0 else 'elif', self._print(c)))
+            for ee in e:
+                temp1, temp2, output = self.doprint(ee)
+                lines.append(output)
+            lines.append("#end")
+        return "\n".join(lines)
+
+    def _print_Relational(self, expr):
+        return "%s %s %s"%(self._print(expr.lhs), expr.rel_op, self._print(expr.rhs))
 
     def _print_Piecewise(self, expr):
         if expr.args[-1].cond != True:
@@ -276,6 +303,10 @@ class CythonCodePrinter(CodePrinter):
         return self._print(_piecewise)
 
     def _print_MatrixElement(self, expr):
+        if self._settings['parallel']:
+            # the local arrays are declared as scalars to be private
+            return "{0}_{1}".format(expr.parent, expr.j +
+                    expr.i*expr.parent.shape[1])
         return "{0}[{1}]".format(expr.parent, expr.j +
                 expr.i*expr.parent.shape[1])
 
@@ -290,18 +321,36 @@ class CythonCodePrinter(CodePrinter):
     def _print_For(self, expr):
         lines = []
         index = expr.target
-        for i in index:
-            lines.append("for %s in range(%s, %s):"%(i.label, i.lower, i.upper))
+        # only the outermost loop is shared between the threads
+        parallel = self._settings['parallel'] and not self._in_prange
+        for n, i in enumerate(index):
+            if isinstance(i, IdxRange):
+                # loop over the tiles
+                bounds = [i.start, i.stop, i.step]
+            else:
+                bounds = [i.lower, i.upper]
+            bounds = ', '.join(self._print(b) for b in bounds)
+            if parallel and n == 0:
+                lines.append(self._print_prange(i, bounds))
+            else:
+                lines.append("for %s in range(%s):"%(self._print(i.label), bounds))
+        if parallel:
+            self._in_prange = True
         for e in expr.body:
             temp1, temp2, addlines = self.doprint(e)
             if isinstance(addlines, str):
                 lines.append(addlines)
             else:
                 lines += addlines
+        if parallel:
+            self._in_prange = False
         for i in index:
             lines.append("#end")
         return "\n".join(lines)
 
+    def _print_prange(self, index, bounds):
+        return "for %s in prange(%s, nogil=True, schedule='static', num_threads=%d):"%(self._print(index.label), bounds, self._settings['num_threads'])
+
     def _print_Assignment(self, expr):
         from sympy.functions.elementary.piecewise import Piecewise
         from sympy.matrices.expressions.matexpr import MatrixSymbol
@@ -0,0 +1,86 @@
+from sympy.printing.precedence import precedence
+
+from .cython import CythonCodePrinter
+from ..ast import IdxRange
+
+# dictionary mapping sympy function to the functions of the math module
+known_functions = {
+    "Abs": "abs",
+    "gamma": "math.gamma",
+    "sin": "math.sin",
+    "cos": "math.cos",
+    "tan": "math.tan",
+    "asin": "math.asin",
+    "acos": "math.acos",
+    "atan": "math.atan",
+    "atan2": "math.atan2",
+    "exp": "math.exp",
+    "log": "math.log",
+    "erf": "math.erf",
+    "sinh": "math.sinh",
+    "cosh": "math.cosh",
+    "tanh": "math.tanh",
+    "asinh": "math.asinh",
+    "acosh": "math.acosh",
+    "atanh": "math.atanh",
+    "floor": "math.floor",
+    "ceiling": "math.ceil",
+}
+
+class NumbaCodePrinter(CythonCodePrinter):
+    """
+    A printer to convert python expressions to strings of python code
+    with explicit loops compiled by numba.
+
+    The loops are printed as for the Cython printer: only the outermost
+    loop of a parallel routine is a numba.prange and the local arrays
+    are printed as scalars so that numba can privatize them.
+    """
+    printmethod = "_numbacode"
+    language = "Numba"
+
+    def __init__(self, settings=None):
+        super(NumbaCodePrinter, self).__init__(settings)
+        self.known_functions = dict(known_functions)
+        self.known_functions.update((settings or {}).get('user_functions', {}))
+
+    def _declare_number_const(self, name, value):
+        return "{0} = {1}".format(name, value)
+
+    def _print_Pow(self, expr):
+        PREC = precedence(expr)
+        if expr.exp == 0.5:
+            return 'math.sqrt(%s)' % self._print(expr.base)
+        elif expr.exp == -1 or (expr.exp > 0 and expr.exp.is_integer):
+            return super(NumbaCodePrinter, self)._print_Pow(expr)
+        return '%s**%s' % (self.parenthesize(expr.base, PREC),
+                           self.parenthesize(expr.exp, PREC))
+
+    def _print_Exp1(self, expr):
+        return "math.e"
+
+    def _print_Pi(self, expr):
+        return 'math.pi'
+
+    def _print_Infinity(self, expr):
+        return 'math.inf'
+
+    def _print_NegativeInfinity(self, expr):
+        return '-math.inf'
+
+    def _print_sign(self, func):
+        return 'numpy.sign({0})'.format(self._print(func.args[0]))
+
+    def _print_MatrixElement(self, expr):
+        # the local arrays are always scalars
+        return "{0}_{1}".format(expr.parent, expr.j + expr.i*expr.parent.shape[1])
+
+    def _print_prange(self, index, bounds):
+        # the number of threads is set by BoundKernel around each call
+        label = self._print(index.label)
+        if isinstance(index, IdxRange) and index.step != 1:
+            # prange only supports a step of 1: loop over the tile numbers
+            start, stop, step = [self._print(b) for b in (index.start, index.stop, index.step)]
+            return ("for {0}n in numba.prange(({2} - ({1}) + {3} - 1)//{3}):\n"
+                    "{0} = {1} + {3}*{0}n").format(label, start, stop, step)
+        return "for %s in numba.prange(%s):"%(label, bounds)
@@ -979,11 +979,14 @@ class NumPyPrinter(PythonCodePrinter):
         from sympy.matrices.expressions.matexpr import MatrixSymbol
         from sympy.matrices import MatrixBase, MatrixSlice
         from sympy.codegen.ast import Assignment
+        from ..ast import MatrixProduct
 
         lhs = expr.lhs
         rhs = expr.rhs
         # We special case assignments that take multiple lines
-        if isinstance(expr.rhs, Piecewise):
+        if isinstance(rhs, MatrixProduct):
+            return self._print_MatrixProduct(rhs, lhs)
+        elif isinstance(expr.rhs, Piecewise):
             # Here we modify Piecewise so each expression is now
             # an Assignment, and then continue on the print.
             expressions = []
@@ -1011,6 +1014,17 @@ class NumPyPrinter(PythonCodePrinter):
                 return ""
             return self._get_statement("%s = %s" % (lhs_code, rhs_code))
 
+    def _print_MatrixProduct(self, expr, out):
+        # the velocity axis is contracted with the second axis of the matrix
+        # and the result is written directly in the array out
+        letters = 'abcdefgh'
+        axis = list(expr.array.indices).index(expr.velocity_index)
+        rank = expr.array.rank
+        inp = ''.join('j' if i == axis else letters[i] for i in range(rank))
+        res = ''.join('i' if i == axis else letters[i] for i in range(rank))
+        return "numpy.einsum('ij,%s->%s', %s, %s, out=%s, optimize=True)" % (
+            inp, res, self._print(expr.matrix), self._print(expr.array), self._print(out))
+
     def indent_code(self, code):
         """Accepts a string of code or a list of code lines"""
 
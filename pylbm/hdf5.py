@@ -8,12 +8,17 @@
 HDF5 module
 """
 import os
+import copy
 import logging
+import threading
+import queue
 from six.moves import range
 import numpy as np
 import h5py
 import mpi4py.MPI as mpi
 
+from .mpi_topology import get_mpi_datatype
+
 log = logging.getLogger(__name__) #pylint: disable=invalid-name
 
 class H5File:
@@ -45,7 +50,7 @@ class H5File:
             self.h5file = h5py.File(path + '/' + self.h5filename, "w")
 
         # All the processes wait for the creation of the output directory
-        mpi.COMM_WORLD.Barrier()
+        mpi_topo.cartcomm.Barrier()
 
         self.mpi_topo = mpi_topo
         self.scalars = {}
@@ -131,6 +136,15 @@ class H5File:
             buffer_size.append(self.region[i][mpi_coords[i]+1] - self.region[i][mpi_coords[i]])
         return ind[::-1], buffer_size[::-1]
 
+    @staticmethod
+    def _get_dtype(data):
+        """
+        the type used to store data (float32 is kept, float64 otherwise).
+        """
+        if np.asarray(data).dtype == np.float32:
+            return np.dtype(np.float32)
+        return np.dtype(np.double)
+
     def _set_dset(self, dset, comm, data, index=0, with_index=False):
         """
         Merge data from multiple sub domains into a dataset.
@@ -166,8 +180,8 @@ class H5File:
             ind = tuple(ind)
             if with_index:
                 ind = ind + (index,)
-            rcv_buffer = np.empty(buffer_size)
-            comm.Recv([rcv_buffer, mpi.DOUBLE], source=i, tag=index)
+            rcv_buffer = np.empty(buffer_size, dtype=dset.dtype)
+            comm.Recv([rcv_buffer, get_mpi_datatype(dset.dtype)], source=i, tag=index)
             dset[ind] = rcv_buffer
 
     def add_scalar(self, name, f, *fargs):
@@ -191,14 +205,15 @@ class H5File:
             data = f
         else:
             data = f(*fargs)
+        dtype = self._get_dtype(data)
 
         comm = self.mpi_topo.cartcomm
         if comm.Get_rank() == 0:
-            dset = self.h5file.create_dataset(name, self.global_size[::-1], dtype=np.double)
+            dset = self.h5file.create_dataset(name, self.global_size[::-1], dtype=dtype)
             self._set_dset(dset, comm, data)
             self.scalars[name] = self.h5filename + ":/" + name
         else:
-            comm.Send([np.ascontiguousarray(data.T, dtype=np.double), mpi.DOUBLE], dest=0, tag=0)
+            comm.Send([np.ascontiguousarray(data.T, dtype=dtype), get_mpi_datatype(dtype)], dest=0, tag=0)
 
     def add_vector(self, name, f, *fargs):
         """
@@ -221,16 +236,17 @@ class H5File:
             datas = f
         else:
             datas = f(*fargs)
+        dtype = np.result_type(*[self._get_dtype(data) for data in datas])
 
         comm = self.mpi_topo.cartcomm
         if comm.Get_rank() == 0:
-            dset = self.h5file.create_dataset(name, self.global_size[::-1] + [3], dtype=np.double)
+            dset = self.h5file.create_dataset(name, self.global_size[::-1] + [3], dtype=dtype)
             for i, data in enumerate(datas):
                 self._set_dset(dset, comm, data, i, with_index=True)
             self.vectors[name] = self.h5filename + ":/" + name
         else:
             for i, data in enumerate(datas):
-                comm.Send([np.ascontiguousarray(data.T), mpi.DOUBLE], dest=0, tag=i)
+                comm.Send([np.ascontiguousarray(data.T, dtype=dtype), get_mpi_datatype(dtype)], dest=0, tag=i)
 
     def save(self):
         """
@@ -286,3 +302,174 @@ class H5File:
 
             self.xdmf_file.write("</Grid>\n</Domain>\n</Xdmf>\n")
             self.xdmf_file.close()
+
+
+class H5OutputQueue:
+    """
+    asynchronous output of the moments of a simulation in hdf5 and xdmf files.
+
+    At each call of write, the requested fields are copied in a free
+    buffer and the files are written by a background thread while the
+    simulation goes on. The time loop only waits when all the buffers
+    are still being written.
+
+    If the MPI library does not provide MPI_THREAD_MULTIPLE and several
+    processes are used, the files are written synchronously.
+
+    An error of the writer is raised again by the next call of write,
+    flush or close. For an ensemble, each member is written in its
+    own dataset: the dataset name_i contains the member i of the
+    field name.
+
+    Parameters
+    ----------
+
+    simulation : Simulation
+        the simulation to output
+    filename : string
+        the prefix of the files (the time step is added as in H5File)
+    fields : dict
+        the fields to store
+
+        key : the name of the dataset entry
+
+        value : a moment (sympy symbol) or a function f(simulation)
+        which returns an array on the interior domain
+    path : string
+        the directory of the output files (default is '')
+    nbuffers : int
+        the number of buffers (default is 2)
+
+    Examples
+    --------
+
+    >>> output = H5OutputQueue(sol, 'lid_driven', {'rho': RHO, 'qx': QX}, 'results')
+    >>> while sol.t < final_time:
+    ...     sol.run(128)
+    ...     output.write(sol.nt)
+    >>> output.close()
+
+    """
+    def __init__(self, simulation, filename, fields, path='', nbuffers=2):
+        self.simulation = simulation
+        self.filename = filename
+        self.fields = fields
+        self.path = path
+
+        # the writer has its own communicator to not interfere
+        # with the communications of the time loop
+        self.mpi_topo = copy.copy(simulation.domain.mpi_topo)
+        self.mpi_topo.cartcomm = simulation.domain.mpi_topo.cartcomm.Dup()
+
+        self.buffers = [None]*nbuffers
+        self._free = queue.Queue()
+        for slot in range(nbuffers):
+            self._free.put(slot)
+        self._pending = queue.Queue()
+        self._error = None
+
+        threaded = mpi.Query_thread() == mpi.THREAD_MULTIPLE or self.mpi_topo.cartcomm.Get_size() == 1
+        if threaded:
+            self._writer = threading.Thread(target=self._run, daemon=True)
+            self._writer.start()
+        else:
+            log.warning("MPI_THREAD_MULTIPLE is not available: the output is synchronous")
+            self._writer = None
+
+    def _snapshot(self, slot):
+        sol = self.simulation
+        if self.buffers[slot] is None:
+            self.buffers[slot] = {}
+        buffers = self.buffers[slot]
+
+        for name, field in self.fields.items():
+            if callable(field):
+                data = field(sol)
+            else:
+                data = sol.m[field]
+            if data.ndim > sol.dim:
+                # one dataset for each member of the ensemble
+                members = {'{}_{}'.format(name, i): member for i, member in enumerate(data)}
+            else:
+                members = {name: data}
+            for key, value in members.items():
+                if key not in buffers:
+                    buffers[key] = np.empty(value.shape, dtype=H5File._get_dtype(value))
+                np.copyto(buffers[key], value)
+
+    def _write(self, slot, timestep):
+        h5 = H5File(self.mpi_topo, self.filename, self.path, timestep)
+        h5.set_grid(*self.simulation.domain.coords)
+        for name, data in self.buffers[slot].items():
+            h5.add_scalar(name, data)
+        h5.save()
+
+    def _run(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                self._pending.task_done()
+                break
+            slot, timestep = item
+            try:
+                self._write(slot, timestep)
+            except Exception as error: #pylint: disable=broad-except
+                # the error is raised again in the thread of the simulation
+                if self._error is None:
+                    self._error = error
+            finally:
+                self._free.put(slot)
+                self._pending.task_done()
+
+    def write(self, timestep=None):
+        """
+        copy the fields in a free buffer and send it to the writer.
+
+        Parameters
+        ----------
+
+        timestep : int
+            the time step added to the file name (default is None)
+
+        """
+        slot = self._free.get()
+        if self._error is not None:
+            self._free.put(slot)
+            self._raise_error()
+        self._snapshot(slot)
+        if self._writer is None:
+            try:
+                self._write(slot, timestep)
+            finally:
+                self._free.put(slot)
+        else:
+            self._pending.put((slot, timestep))
+
+    def flush(self):
+        """
+        wait until all the buffers are written by all the processes.
+        """
+        if self._writer is not None:
+            self._pending.join()
+        self.mpi_topo.cartcomm.Barrier()
+        self._raise_error()
+
+    def close(self):
+        """
+        flush the buffers and stop the writer.
+        """
+        if self._writer is not None:
+            self._pending.put(None)
+            self._writer.join()
+            self._writer = None
+        self.mpi_topo.cartcomm.Barrier()
+        self.mpi_topo.cartcomm.Free()
+        self._raise_error()
+
+    def _raise_error(self):
+        """
+        raise the first error of the writer if any.
+        """
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
@@ -7,6 +7,9 @@
 """
 module monitoring
 usage: python filename.py --monitoring
+
+The generated kernels also report their operations and bytes per
+lattice node and the achieved GFLOP/s and GB/s (roofline data).
 """
 
 # import time
@@ -24,6 +27,12 @@ class PerfMonitor:
         self.count = 0
         self.total_time = []
         self.self_time = []
+        # operations and bytes per lattice node (generated kernels only)
+        self.flops = None
+        self.bytes = None
+        # lattice nodes visited by the calls which give their count
+        self.nodes = 0
+        self.ncount = 0
 
 
 class Node:
@@ -68,6 +77,36 @@ class Monitoring:
         if not self.func.get(info, None):
             self.func[info] = PerfMonitor()
 
+    def set_cost(self, f, flops, nbytes):
+        """
+        Set the number of operations and the number of bytes loaded
+        and stored per lattice node by the monitored function f.
+        """
+        self.register(f)
+        info = self.information(f)
+        self.func[info].flops = flops
+        self.func[info].bytes = nbytes
+
+    def add_nodes(self, f, nodes):
+        """
+        Add the number of lattice nodes visited by a call of the
+        monitored function f (the whole domain is assumed otherwise).
+        """
+        info = self.information(f)
+        self.func[info].nodes += nodes
+        self.func[info].ncount += 1
+
+    def nodes(self, f):
+        """
+        Return the number of lattice nodes visited by all the calls
+        of the monitored function f.
+        """
+        v = self.func[self.information(f)]
+        return self._nodes(v)
+
+    def _nodes(self, v):
+        return v.nodes + (len(v.total_time) - v.ncount)*self.size
+
     def start_timing(self, f):
         info = self.information(f)
         self.tree = self.tree.add_node(info)
@@ -83,6 +122,43 @@ class Monitoring:
             - self.tree.time
         self.tree = self.tree.del_node()
 
+    def last_time(self, f):
+        """
+        Return the total time of the last call of the monitored function f.
+        """
+        return self.func[self.information(f)].total_time[-1]
+
+    def roofline(self):
+        """
+        Return the achieved performances of the functions with a cost.
+
+        Returns
+        -------
+
+        dict
+            for each (module name, function name): the number of calls,
+            the number of lattice nodes visited by all the calls,
+            the total time, the operations and the bytes per lattice node,
+            the arithmetic intensity, the GFLOP/s and the GB/s
+        """
+        report = {}
+        for info, v in self.func.items():
+            if v.flops is None or not v.total_time:
+                continue
+            ncall, time = len(v.total_time), np.sum(v.total_time)
+            nodes = self._nodes(v)
+            report[info] = {
+                'ncall': ncall,
+                'nodes': nodes,
+                'time': time,
+                'flops': v.flops,
+                'bytes': v.bytes,
+                'intensity': v.flops/v.bytes if v.bytes else np.inf,
+                'GFLOP/s': nodes*v.flops/time/1e9 if time > 0 else 0.,
+                'GB/s': nodes*v.bytes/time/1e9 if time > 0 else 0.,
+            }
+        return report
+
     def __str__(self):
         if mpi.COMM_WORLD.rank == 0:
             titles = [
@@ -100,12 +176,26 @@ class Monitoring:
                     np.sum(v.self_time)
                 ] for v in self.func.values()
             ]
+            nodes = [self._nodes(v) for v in self.func.values()]
             ind = np.argsort(np.asarray(data)[:, 1])
             for i in ind[::-1]:
                 print(row_format.format(data[i][1]/data[ind[-1]][1]*100,
                                         *names[i],
                                         *data[i],
-                                        data[i][0]*self.size/data[i][1]/1e6))
+                                        nodes[i]/data[i][1]/1e6))
+
+            report = self.roofline()
+            if report:
+                titles = [
+                    'module name', 'kernel name', 'flops/node', 'bytes/node',
+                    'flops/byte', 'GFLOP/s', 'GB/s'
+                ]
+                row_format = "{:>25}{:>30}{:>12}{:>12}{:>12}{:>10}{:>10}"
+                print('\n', row_format.format(*titles), '\n')
+                row_format = "{:>25}{:>30}{:12}{:12}{:12.3f}{:10.3f}{:10.3f}"
+                for info, r in sorted(report.items(), key=lambda x: -x[1]['time']):
+                    print(row_format.format(*info, r['flops'], r['bytes'],
+                                            r['intensity'], r['GFLOP/s'], r['GB/s']))
 
 Monitor = Monitoring()  # pylint: disable=invalid-name
 
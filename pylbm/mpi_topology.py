@@ -37,6 +37,9 @@ class MpiTopology:
       the communicator of the topology
     split : tuple
       number of processes in each direction
+    region_indices : list
+      the cut planes of the regions in each direction if they are
+      set by balance (None for regions of the same size)
     neighbors : list
       list of the neighbors where we have to send and to receive messages
     sendType : list
@@ -55,6 +58,8 @@ class MpiTopology:
       defines command line options.
     get_coords :
       return the coords of the process in the MPI topology.
+    balance :
+      set the regions so that their weights are the same.
     set_subarray :
       create subarray for the send and receive message
     update :
@@ -76,6 +81,32 @@ class MpiTopology:
 
         self.split = np.asarray(split[:self.dim])
         self.cartcomm = comm.Create_cart(self.split, period)
+        self.region_indices = None
+
+    def balance(self, weights, minsize=None):
+        """
+        Set the regions owned by each sub domain so that they have
+        the same weight.
+
+        The cut planes of a direction are the same for all the
+        processes: the regions stay the blocks of a Cartesian
+        topology with non uniform sizes.
+
+        Parameters
+        ----------
+
+        weights : list
+            the weight of each slice orthogonal to the direction
+            (for instance its number of fluid points) for each direction
+        minsize : list
+            the minimal number of points of a region in each direction
+            default is None (one point)
+
+        """
+        self.region_indices = []
+        for axis, weight in enumerate(weights):
+            size = 1 if minsize is None else int(minsize[axis])
+            self.region_indices.append(get_balanced_indices(weight, self.split[axis], size))
 
     def get_region_indices_(self, n, axis=0):
         """
@@ -96,6 +127,9 @@ class MpiTopology:
             list of regions owned by each processes for a given axis
 
         """
+        if self.region_indices is not None and self.region_indices[axis][-1] == n:
+            return list(self.region_indices[axis])
+
         region_indices = [0]
         nproc = self.cartcomm.Get_topo()[0][axis]
         for i in range(nproc):
@@ -236,3 +270,83 @@ def get_directions(dim):
         directions[:, 2] = np.repeat(common_direction, 9, axis=0).flatten()
 
     return directions
+
+def get_balanced_indices(weight, nproc, minsize=1):
+    """
+    Return the cut planes which split a direction in nproc
+    regions of the same weight.
+
+    Parameters
+    ----------
+
+    weight : ndarray
+      the weight of each discrete point of the direction
+    nproc : int
+      the number of regions
+    minsize : int
+      the minimal number of points of a region (default is 1)
+
+    Returns
+    -------
+
+    list
+        the first index of each region followed by the number of points
+
+    Examples
+    --------
+
+    >>> get_balanced_indices([1, 1, 1, 1, 0, 0, 0, 0], 2)
+    [0, 2, 8]
+    >>> get_balanced_indices([1, 1, 1, 1, 0, 0, 0, 0], 4, minsize=2)
+    [0, 2, 4, 6, 8]
+
+    """
+    weight = np.asarray(weight, dtype=np.double)
+    n, nproc = weight.size, int(nproc)
+    cumsum = np.concatenate(([0.], np.cumsum(weight)))
+    if cumsum[-1] > 0:
+        targets = cumsum[-1]*np.arange(1, nproc)/nproc
+        # the nearest cut plane of each target
+        upper = np.searchsorted(cumsum, targets)
+        lower = np.maximum(upper - 1, 0)
+        cuts = np.where(targets - cumsum[lower] < cumsum[upper] - targets, lower, upper)
+    else:
+        cuts = n*np.arange(1, nproc)//nproc
+    indices = [0] + [int(c) for c in cuts] + [n]
+
+    # each region has at least minsize points
+    for i in range(1, nproc):
+        indices[i] = max(indices[i], indices[i - 1] + minsize)
+    for i in range(nproc - 1, 0, -1):
+        indices[i] = min(indices[i], indices[i + 1] - minsize)
+    return indices
+
+def get_mpi_datatype(dtype):
+    """
+    Return the MPI datatype of a numpy floating type.
+
+    Parameters
+    ----------
+
+    dtype : numpy.dtype or str
+      the numpy type (float32 or float64)
+
+    Returns
+    -------
+
+    MPI.Datatype
+        the corresponding MPI datatype
+
+    Examples
+    --------
+
+    >>> get_mpi_datatype('float32') == mpi.FLOAT
+    True
+    >>> get_mpi_datatype(np.double) == mpi.DOUBLE
+    True
+
+    """
+    mpi_types = {np.dtype('float32'): mpi.FLOAT,
+                 np.dtype('float64'): mpi.DOUBLE,
+                }
+    return mpi_types[np.dtype(dtype)]
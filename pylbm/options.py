@@ -28,5 +28,8 @@ def options():
                      help="Set the number of processes in y direction")
     mpi.add_argument("-npz", dest="npz", default=1, type=int,
                      help="Set the number of processes in z direction")
+    openmp = parser.add_argument_group('openmp')
+    openmp.add_argument("--num-threads", dest="num_threads", default=None, type=int,
+                        help="Set the number of threads of the generated code (cython and numba)")
     args, _ = parser.parse_known_args()
     return args
@@ -0,0 +1,222 @@
+# Authors:
+#     Loic Gouarin <loic.gouarin@polytechnique.edu>
+#     Benjamin Graille <benjamin.graille@math.u-psud.fr>
+#
+# License: BSD 3 clause
+
+"""
+Module for the probes: global reductions and point values
+of expressions of the conserved moments
+"""
+
+import sys
+import logging
+import numpy as np
+import sympy as sp
+import mpi4py.MPI as mpi
+
+log = logging.getLogger(__name__) #pylint: disable=invalid-name
+
+
+#pylint: disable=too-many-instance-attributes
+class Probes:
+    """
+    Define the probes of a simulation.
+
+    The sums over the fluid points of the domain are accumulated
+    inside the generated one_time_step kernel (Cython generator) on
+    the time steps where the probes are computed. The values at a
+    point and the sums over a label only need the distribution
+    functions of a few points and are computed after the time step.
+    All the values are then reduced with a single MPI call.
+
+    Parameters
+    ----------
+
+    domain : pylbm.Domain
+        the simulation domain
+    scheme : pylbm.Scheme
+        the scheme of the simulation
+    container : container
+        the storage of the moments and of the distribution functions
+    backend : str
+        the generator used ('NUMPY', 'CYTHON', 'NUMBA' or 'LOOPY')
+    dico : dictionary
+        the key 'probes' describes the probes
+            - key is the name of the probe
+            - value is a SymPy expression of the conserved moments
+              (sum over the fluid points of the domain) or a dictionary with
+                + "expr" key that gives the expression
+                + "point" key that gives the coordinates of a point
+                  (value at the nearest point of the lattice)
+                + "label" key that gives a label of the boundary
+                  (sum over the fluid points linked to this label)
+
+    Attributes
+    ----------
+
+    names : list
+        the names of the probes
+    values : dictionary
+        the values of the probes computed at the last probe step
+        (one value per member if the simulation is an ensemble)
+    history : list
+        list of (nt, t, values) for each probe step
+    reductions : list
+        the expressions summed over the domain
+    in_kernel : bool
+        True if the sums over the domain are made by the generated code
+    reduction : ndarray
+        the array where the generated code stores the sums
+        (in double precision)
+
+    Examples
+    --------
+
+    >>> dico['probes'] = {'mass': rho,
+    ...                   'energy': (qx**2 + qy**2)/(2*rho),
+    ...                   'center': {'expr': qx, 'point': [0.5, 0.5]},
+    ...                   'lid': {'expr': qx, 'label': 1},
+    ...                  }
+    >>> sol = pylbm.Simulation(dico)
+    >>> sol.run(100, probe_every=10)
+    >>> sol.probes.values['mass']
+
+    """
+    def __init__(self, domain, scheme, container, backend, dico):
+        self.domain = domain
+        self.container = container
+        self.comm = domain.mpi_topo.cartcomm
+        self.consm = list(scheme.consm.keys())
+        self.rows = [int(scheme.consm[k]) for k in self.consm]
+        self.matrix = scheme.M.subs(scheme.param.items())
+
+        self.names = []
+        self.reductions = []
+        self.values = {}
+        self.history = []
+
+        self._kind = []
+        self._func = []
+        self._nodes = []
+
+        for name, probe in dico.get('probes', {}).items():
+            if isinstance(probe, dict):
+                expr = probe['expr']
+            else:
+                expr, probe = probe, {}
+            expr = sp.sympify(expr).subs(scheme.param.items())
+            if not expr.free_symbols <= set(self.consm):
+                log.error('Probes: the expression of %s must only depend on the conserved moments %s', name, self.consm)
+                sys.exit()
+
+            self.names.append(name)
+            self._func.append(sp.lambdify(self.consm, expr, 'numpy'))
+            if 'point' in probe:
+                self._kind.append('point')
+                self._nodes.append(self._get_point(probe['point']))
+            elif 'label' in probe:
+                self._kind.append('label')
+                self._nodes.append(self._get_label(probe['label']))
+            else:
+                self._kind.append('domain')
+                self._nodes.append(None)
+                self.reductions.append(expr)
+
+        self.in_kernel = backend in ['CYTHON', 'NUMBA']
+        self._batch_shape = () if container.nbatch is None else (container.nbatch,)
+        # the sums are accumulated in double precision whatever the storage
+        self.reduction = np.zeros(self._batch_shape + (max(len(self.reductions), 1),),
+                                  dtype=np.double)
+
+        # the fluid points of the interior domain
+        inner = tuple(slice(v, -v) for v in domain.stencil.vmax)
+        self._fluid = domain.in_or_out[inner] == domain.valin
+        self._f_matrix = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def _get_point(self, point):
+        """
+        Return the index (with the halo points) of the nearest point
+        if it is in the sub-domain of this process and None otherwise.
+        """
+        index = ()
+        for i, x in enumerate(point):
+            coords = self.domain.coords[i]
+            dx = self.domain.dx
+            if not coords[0] - .5*dx <= x < coords[-1] + .5*dx:
+                return None
+            ind = np.argmin(np.abs(coords - x)) + self.domain.stencil.vmax[i]
+            index += (np.array([ind]),)
+        return index
+
+    def _get_label(self, label):
+        """
+        Return the indices (with the halo points) of the fluid points
+        of this process which are linked to the label.
+        """
+        mask = np.any(self.domain.flag == label, axis=0)
+        for i, vmax in enumerate(self.domain.stencil.vmax):
+            ind = [slice(None)]*self.domain.dim
+            ind[i] = slice(0, vmax)
+            mask[tuple(ind)] = False
+            ind[i] = slice(-vmax, None)
+            mask[tuple(ind)] = False
+        return np.nonzero(mask)
+
+    def _moments_at(self, nodes):
+        """
+        Return the conserved moments at the given points
+        computed from the distribution functions.
+        """
+        if self._f_matrix is None:
+            try:
+                self._f_matrix = np.array(self.matrix.tolist(), dtype=np.double)[self.rows]
+            except TypeError:
+                log.error('Probes: the matrix M of the scheme must be numeric')
+                sys.exit()
+        f = self.container.F
+        f.sync_host()
+        return np.matmul(self._f_matrix, f._get((slice(None),) + tuple(nodes))) #pylint: disable=protected-access
+
+    def collect(self, simulation):
+        """
+        Compute the probes for the current state of the simulation
+        and reduce them over all the processes.
+
+        Parameters
+        ----------
+
+        simulation : Simulation
+            the simulation
+
+        """
+        local = np.zeros(self._batch_shape + (len(self),))
+        ireduction = 0
+        for i, kind in enumerate(self._kind):
+            func, nodes = self._func[i], self._nodes[i]
+            if kind == 'domain':
+                if self.in_kernel:
+                    local[..., i] = self.reduction[..., ireduction]
+                else:
+                    value = func(*[simulation.m[k] for k in self.consm])
+                    value = np.broadcast_to(value, self._batch_shape + self._fluid.shape)
+                    axis = tuple(range(-self._fluid.ndim, 0))
+                    local[..., i] = np.sum(value, axis=axis, where=self._fluid)
+                ireduction += 1
+            elif nodes is not None and nodes[0].size != 0:
+                simulation.natural_layout()
+                m = self._moments_at(nodes)
+                value = func(*[m[..., k, :] for k in range(len(self.consm))])
+                value = np.broadcast_to(value, self._batch_shape + (nodes[0].size,))
+                local[..., i] = np.sum(value, axis=-1)
+
+        result = np.empty_like(local)
+        self.comm.Allreduce(local, result, op=mpi.SUM)
+
+        self.values = {name: result[..., i].copy() if self._batch_shape else float(result[i])
+                       for i, name in enumerate(self.names)}
+        self.history.append((simulation.nt, simulation.t, self.values))
+        return self.values
@@ -0,0 +1,139 @@
+# Authors:
+#     Loic Gouarin <loic.gouarin@polytechnique.edu>
+#     Benjamin Graille <benjamin.graille@math.u-psud.fr>
+#
+# License: BSD 3 clause
+
+"""
+Module for the residual used to detect a steady state
+"""
+
+import sys
+import logging
+import numpy as np
+import mpi4py.MPI as mpi
+
+from .storage import Array
+
+log = logging.getLogger(__name__) #pylint: disable=invalid-name
+
+
+class Residual:
+    """
+    Relative variation of conserved moments between two calls.
+
+    The residual is
+
+    .. math::
+
+        \\frac{\\lVert m - m_{\\text{prev}} \\rVert_2}{\\lVert m \\rVert_2}
+
+    where the norms are computed over the fluid points of the domain
+    and over the selected conserved moments. Only the previous values of
+    these moments are kept. With the Cython generator, the moments and the
+    two sums are computed by a generated kernel directly from the
+    distribution functions. This kernel is compiled once by the algorithm
+    and bound once to the arrays of the residual. The sums are accumulated
+    in double precision and reduced with a single MPI call.
+
+    Parameters
+    ----------
+
+    simulation : Simulation
+        the simulation
+    moments : list
+        the conserved moments used to compute the residual
+
+    Attributes
+    ----------
+
+    rows : list
+        the indices of the moments
+    kernel : BoundKernel
+        the generated kernel bound to the arrays of the residual
+        (Cython and Numba generators)
+    value : float or ndarray
+        the last residual (one value per member if the simulation
+        is an ensemble)
+
+    """
+    def __init__(self, simulation, moments):
+        consm = simulation.scheme.consm
+        self.moments = list(moments)
+        for k in self.moments:
+            if k not in consm:
+                log.error('Residual: %s is not a conserved moment %s', k, list(consm.keys()))
+                sys.exit()
+        self.rows = [int(consm[k]) for k in self.moments]
+
+        container = simulation.container
+        self.comm = simulation.domain.mpi_topo.cartcomm
+        self._batch_shape = () if container.nbatch is None else (container.nbatch,)
+        # the sums are accumulated in double precision whatever the storage
+        self.residual = np.zeros(self._batch_shape + (2,), dtype=np.double)
+        self.value = np.inf
+
+        self.in_kernel = simulation.generator.backend in ['CYTHON', 'NUMBA']
+        if self.in_kernel:
+            # the kernel of the algorithm computes all the conserved moments:
+            # the weights select the moments of this residual
+            self.mprev = Array(len(consm), container.nspace, container.vmax,
+                               container.sorder, container.mpi_topo, container.dtype,
+                               nbatch=container.nbatch)
+            self.weights = np.zeros(len(consm), dtype=np.double)
+            self.weights[self.rows] = 1
+            self.kernel = simulation.algo.bind_residual(simulation, self.mprev.array,
+                                                        self.residual, self.weights)
+        else:
+            self.mprev = None
+            domain = simulation.domain
+            in_or_out = domain.in_or_out
+            if hasattr(in_or_out, 'get'):
+                in_or_out = in_or_out.get()
+            inner = tuple(slice(v, -v) for v in domain.stencil.vmax)
+            self._fluid = in_or_out[inner] == domain.valin
+
+    def _local_sums(self, simulation):
+        """
+        Compute the sums of this process and update the previous moments.
+        """
+        if self.in_kernel:
+            simulation.natural_layout()
+            self.residual[...] = 0
+            # F and Fnew are swapped by the time steps
+            self.kernel.set('f', simulation.container.F.array)
+            self.kernel()
+            return self.residual.copy()
+
+        m = [simulation.m[k] for k in self.moments]
+        axis = tuple(range(-self._fluid.ndim, 0))
+        if self.mprev is None:
+            self.mprev = [np.zeros(mk.shape) for mk in m]
+        local = np.zeros(self._batch_shape + (2,))
+        for mk, mprev in zip(m, self.mprev):
+            mk = mk.astype(np.double)
+            local[..., 0] += np.sum((mk - mprev)**2, axis=axis, where=self._fluid)
+            local[..., 1] += np.sum(mk**2, axis=axis, where=self._fluid)
+            mprev[...] = mk
+        return local
+
+    def __call__(self, simulation):
+        """
+        Return the residual between the current state of the simulation
+        and the state of the previous call (the maximum over the members
+        if the simulation is an ensemble).
+
+        Parameters
+        ----------
+
+        simulation : Simulation
+            the simulation
+
+        """
+        local = self._local_sums(simulation)
+        result = np.empty_like(local)
+        self.comm.Allreduce(local, result, op=mpi.SUM)
+
+        norm = np.where(result[..., 1] > 0, result[..., 1], 1.)
+        self.value = np.sqrt(result[..., 0]/norm)
+        return float(np.max(self.value))
@@ -13,12 +13,16 @@ import sys
 import logging
 import types
 import numpy as np
+import sympy as sp
+import h5py
 from sympy.parsing.sympy_parser import parse_expr
 import mpi4py.MPI as mpi
 
 from .domain import Domain
 from .scheme import Scheme
 from .boundary import Boundary
+from .probes import Probes
+from .residual import Residual
 from . import utils
 from .validator import validate
 from .context import set_queue
@@ -26,6 +30,8 @@ from .generator import Generator
 from .container import NumpyContainer, CythonContainer, LoopyContainer
 from .algorithm import PullAlgorithm
 from .monitoring import Monitor, monitor
+from .options import options
+from .autotune import load_tuning, tuning_key
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
@@ -40,14 +46,27 @@ class Simulation:
     dico : dictionary
     domain : object of class :py:class:`Domain<pylbm.domain.Domain>`, optional
     scheme : object of class :py:class:`Scheme<pylbm.scheme.Scheme>`, optional
-    type :   optional argument (default value is 'float64')
+    dtype : optional argument (default value is 'float64')
+      the type used to store the moments and the distribution functions
+      ('float32' or 'float64')
+    compute_dtype : optional argument (default value is None)
+      the type used for the local computations of the generated kernels
+      (collision, equilibrium, ...). If it is None, dtype is used.
+      The mixed precision is obtained with dtype='float32' and
+      compute_dtype='float64' (it is ignored by the numpy and numba
+      generators)
+    restart : optional argument (default value is None)
+      the directory of a checkpoint written by
+      :py:meth:`checkpoint<pylbm.simulation.Simulation.checkpoint>`.
+      If it is given, the initialization step is replaced by
+      :py:meth:`restore<pylbm.simulation.Simulation.restore>`
 
     Attributes
     ----------
 
     dim : int
       spatial dimension
-    type : float64
+    dtype : numpy.dtype
       the type of the values
     domain : :py:class:`Domain<pylbm.domain.Domain>`
       the domain given in argument
@@ -63,6 +82,52 @@ class Simulation:
     F_halo : numpy array
       a numpy array that contains the values of the distribution functions
       in each point
+    probes : :py:class:`Probes<pylbm.probes.Probes>`
+      the probes defined by the key 'probes' of the dictionary.
+      They are computed every probe_every time steps of
+      :py:meth:`run<pylbm.simulation.Simulation.run>`
+    nbatch : int
+      the number of members of the ensemble given by the key 'ensemble'
+      of the dictionary (None if there is no ensemble).
+      All the members share the same scheme and domain and are
+      advanced by the same kernel calls; the arrays m and F have then
+      a leading axis which indexes the members.
+    num_threads : int
+      the number of OpenMP threads of the generated kernels given by
+      the key 'num_threads' of the dictionary or by the command line
+      option --num-threads (None if the kernels are serial). Only the
+      Cython and Numba generators use threads: the outermost space loop
+      of the time step and the loops of the boundary conditions are
+      parallel. The Numba kernels always use the threads of numba:
+      the number of threads of numba is set to num_threads during
+      each call (all the cores if num_threads is None) and must not
+      exceed NUMBA_NUM_THREADS.
+    aosoa : int
+      the number of points of the blocks of the array of structures
+      of arrays (AoSoA) storage of the distribution functions given by
+      the key 'aosoa' of the dictionary (None if the storage is given
+      by sorder). The last space axis is split in blocks (typically
+      of 4, 8 or 16 points, the width of the SIMD registers) and the
+      values of all the velocities of a block are contiguous. Only the
+      Cython and Numba generators with a pull algorithm support it and
+      the accesses to F return copies.
+    overlap : bool
+      True if the setting 'overlap' of 'lbm_algorithm' is set: the
+      exchange of the halo points is posted with non-blocking messages
+      (the faces, the edges and the corners at once) and the interior
+      of the domain is computed while the messages are in flight. The
+      boundary conditions near the interfaces and the shell of the
+      domain are computed after the exchange. Only the Cython and
+      Numba generators with a pull algorithm support it.
+
+    Notes on autotuning
+    -------------------
+
+    If the key 'autotune' of the dictionary is True, the storage order
+    and the algorithm settings saved by
+    :py:func:`pylbm.autotune` for this host, stencil,
+    grid size and generator are used (the arguments sorder and the
+    settings of 'lbm_algorithm' given by the user have the priority).
 
     Examples
     --------
@@ -87,20 +152,38 @@ class Simulation:
     # pylint: disable=too-many-branches, too-many-statements, too-many-locals
     def __init__(self, dico,
                  sorder=None, dtype='float64',
-                 check_inverse=False
+                 check_inverse=False,
+                 restart=None,
+                 compute_dtype=None
                  ):
         validate(dico, __class__.__name__) #pylint: disable=undefined-variable
 
         self.domain = Domain(dico, need_validation=False)
+        self.nbatch = dico.get('ensemble', None)
         domain_size = mpi.COMM_WORLD.allreduce(sendobj=np.prod(self.domain.shape_in))
-        Monitor.set_size(domain_size)
+        Monitor.set_size(domain_size*(self.nbatch or 1))
 
         self.scheme = Scheme(dico, check_inverse=check_inverse, need_validation=False)
         if self.domain.dim != self.scheme.dim:
             log.error('Solution: the dimension of the domain and of the scheme are not the same\n')
             sys.exit()
 
+        # configuration found by pylbm.autotune
+        self._tuned_settings = {}
+        if dico.get('autotune', False):
+            tuned = load_tuning(tuning_key(self.domain, self.scheme, dico, dtype))
+            if tuned is None:
+                log.warning('Simulation: no tuned configuration found, run pylbm.autotune first')
+            else:
+                if sorder is None:
+                    sorder = tuned['sorder']
+                self._tuned_settings = tuned['settings']
+
         self._update_m = True
+        self._m_valid = None
+        self._residuals = {}
+        # phase of the layout of F (None is the natural layout)
+        self._phase = None
         self.t = 0.
         self.nt = 0
         self.dt = self.domain.dx/self.scheme.la
@@ -110,14 +193,54 @@ class Simulation:
         if codegen_dir:
             codegen_dir = os.path.realpath(codegen_dir)
 
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in [np.float32, np.float64]:
+            log.error('Simulation: the type %s is not supported (float32 or float64)', dtype)
+            sys.exit()
+
+        self.num_threads = dico.get('num_threads', options().num_threads)
+        if self.num_threads is not None and self.num_threads < 1:
+            log.error('Simulation: the number of threads must be positive')
+            sys.exit()
+
         self.generator = Generator(dico.get('generator', "CYTHON").upper(),
                                    codegen_dir,
-                                   dico.get('show_code', False))
+                                   dico.get('show_code', False),
+                                   self.dtype, compute_dtype,
+                                   self.num_threads)
+        if self.generator.backend == 'NUMBA' and self.num_threads is not None:
+            import numba
+            if self.num_threads > numba.config.NUMBA_NUM_THREADS:
+                log.error('Simulation: the number of threads must not exceed %d for the numba generator (NUMBA_NUM_THREADS)',
+                          numba.config.NUMBA_NUM_THREADS)
+                sys.exit()
+        if self.generator.backend in ['NUMPY', 'NUMBA'] and self.generator.compute_dtype != self.dtype:
+            log.warning('Simulation: compute_dtype is ignored by the %s generator, the computations use %s',
+                        self.generator.backend.lower(), self.dtype)
+
+        if self.nbatch is not None and self.generator.backend == 'LOOPY':
+            log.error('Simulation: the ensemble is not implemented for the loopy generator')
+            sys.exit()
+
+        in_place = dico.get('lbm_algorithm', {}).get('name', PullAlgorithm).in_place
+        if in_place and self.generator.backend == 'LOOPY':
+            log.error('Simulation: the in-place algorithms are not implemented for the loopy generator')
+            sys.exit()
+
+        self.aosoa = dico.get('aosoa', None)
+        if self.aosoa is not None and (self.generator.backend not in ['CYTHON', 'NUMBA'] or in_place):
+            log.error('Simulation: the AoSoA storage is only implemented for the pull algorithms of the cython and numba generators')
+            sys.exit()
 
         # FIXME remove that !!
         set_queue(self.generator.backend)
 
-        self.container = self._get_container(sorder)
+        self.container = self._get_container(sorder, in_place)
+        self._m_valid = np.zeros(self.container.nv, dtype=bool)
+        self.probes = Probes(self.domain, self.scheme, self.container,
+                             self.generator.backend, dico)
+        # in_or_out is an argument of the generated kernels
+        self.domain.in_or_out = self.domain.in_or_out.astype(self.dtype, copy=False)
         if self.container.gpu_support:
             self.domain.in_or_out = self.container.move2gpu(self.domain.in_or_out)
             self.container.F.generate(self.generator)
@@ -126,37 +249,73 @@ class Simulation:
 
         # Generate the numerical code for the LBM and for the boundary conditions
         self.algo = self._get_algorithm(dico, sorder)
+        self.overlap = self.algo.settings.get('overlap', False)
+        if self.overlap and (self.generator.backend not in ['CYTHON', 'NUMBA']
+                             or not self.algo.box_time_step or self.nbatch is not None):
+            log.error('Simulation: the overlap of the halo exchange is only implemented for the pull algorithms of the cython and numba generators without ensemble')
+            sys.exit()
+        if self.probes.in_kernel:
+            self.algo.reductions = self.probes.reductions
         self.algo.generate()
+        self._exchange_shifts = [self.algo.slot_shifts(phase) for phase in range(self.algo.nphases)]
 
         self.bc = Boundary(self.domain, self.generator, dico)
         for method in self.bc.methods:
             method.set_iload()
-            method.generate(self.container.sorder)
+        sorder = self.container.sorder
+        if self.algo.compact:
+            # the distribution functions are only stored on the points
+            # used by the time step and by the boundary conditions
+            indices = [index[1:] for method in self.bc.methods for index in [method.istore] + method.iload]
+            self.container.set_compact(self.algo.compact_points(self.domain, indices))
+            sorder = self.container.F.sorder
+            for method in self.bc.methods:
+                method.set_compact(self.container.F.compact_index)
+        for method in self.bc.methods:
+            method.generate(sorder)
+        if self.overlap:
+            self._set_overlap()
+        self._driver = self._add_driver()
 
         self.generator.compile()
 
         # Initialize the solution and the rhs of boundary conditions
-        self.initialization(dico)
+        if restart is None:
+            self.initialization(dico)
+        self.bc.prepare_rhs(self)
         for method in self.bc.methods:
-            method.prepare_rhs(self)
             method.fix_iload()
+            method.set_layouts([self.algo.layout(phase) for phase in range(self.algo.nphases)])
             method.set_rhs()
             method.move2gpu()
+        # the conserved moments are read by the probes and the monitoring:
+        # their kernel is bound once
+        if 'f2m_consm' in self.generator.routines:
+            self.algo.bind(self, 'f2m_consm')
+
+        if restart is not None:
+            self.restore(restart)
 
         log.info(self.__str__())
 
-    def _get_container(self, sorder):
+    def _get_container(self, sorder, in_place=False):
         container_type = {'NUMPY': NumpyContainer,
                           'CYTHON': CythonContainer,
+                          'NUMBA': CythonContainer,
                           'LOOPY': LoopyContainer
         }
-        return container_type[self.generator.backend](self.domain, self.scheme, sorder)
+        kwargs = {'block': self.aosoa} if self.aosoa is not None else {}
+        return container_type[self.generator.backend](self.domain, self.scheme, sorder,
+                                                      nbatch=self.nbatch, dtype=self.dtype,
+                                                      in_place=in_place, **kwargs)
 
     def _get_default_algo_settings(self):
+        ensemble = self.nbatch is not None
         if self.generator.backend == 'NUMPY':
-            return {'m_local': False, 'split': False, 'check_isfluid': False}
+            return {'m_local': False, 'split': False, 'check_isfluid': False, 'ensemble': ensemble}
         else:
-            return {'m_local': True, 'split': False, 'check_isfluid': False}
+            return {'m_local': True, 'split': False, 'check_isfluid': False, 'ensemble': ensemble,
+                    'aosoa': self.aosoa}
 
     def _get_algorithm(self, dico, sorder):
         algo_method = PullAlgorithm
@@ -166,6 +325,7 @@ class Simulation:
             algo_method = dummy.get('name', PullAlgorithm)
             user_settings = dummy.get('settings', {})
         algo_settings = self._get_default_algo_settings()
+        algo_settings.update(self._tuned_settings)
         algo_settings.update(user_settings)
 
         return algo_method(self.scheme, sorder, self.generator, algo_settings)
@@ -174,38 +334,107 @@ class Simulation:
     def m_halo(self, i):
         """
         get the moment i on the whole domain with halo points.
+
+        The interfaces between the processes only exchange the
+        distribution functions read by the transport, the moments
+        are therefore not valid in the halo points of the interfaces.
         """
         if self._update_m:
-            self._update_m = False
-            self.f2m()
+            self._full_f2m()
         return self.container.m[i]
 
     @m_halo.setter
     def m_halo(self, i, value):
         self._update_m = False
+        self._m_valid[:] = True
         self.container.m[i] = value
 
     @utils.itemproperty
     def m(self, i):
         """
         get the moment i in the interior domain.
+
+        Only the requested moment is computed from the distribution
+        functions if it is not up to date.
         """
         if self._update_m:
-            self._update_m = False
-            self.f2m()
+            self._update_moments([i])
 
         return self.container.m._in(i) #pylint: disable=protected-access
 
+    def _full_f2m(self):
+        self.natural_layout()
+        self._update_m = False
+        self._m_valid[:] = True
+        self.f2m()
+
+    def _invalidate_moments(self):
+        self._update_m = True
+        self._m_valid[:] = False
+
+    def _moment_index(self, i):
+        if isinstance(i, (sp.Symbol, sp.IndexedBase)):
+            return self.container.m.consm[i]
+        if isinstance(i, (int, np.integer)):
+            return i
+        return None
+
+    def _update_moments(self, moments):
+        """
+        compute the moments that are not up to date
+        in the interior domain.
+
+        Parameters
+        ----------
+
+        moments : list
+            the moments (sympy symbols or indices)
+
+        """
+        rows = [self._moment_index(i) for i in moments]
+        if None in rows:
+            self._full_f2m()
+            return
+
+        rows = [k for k in rows if not self._m_valid[k]]
+        if not rows:
+            return
+
+        self.natural_layout()
+
+        nconsm = len(self.scheme.consm)
+        if max(rows) < nconsm and 'f2m_consm' in self.generator.routines:
+            self.algo.call_function('f2m_consm', self)
+            self._m_valid[:nconsm] = True
+            return
+
+        f2m = None
+        if not self.container.gpu_support:
+            f2m = self.algo.restricted_f2m(rows)
+
+        if f2m is None:
+            self._full_f2m()
+        else:
+            f = [self.container.F._in(k) for k in range(self.container.nv)] #pylint: disable=protected-access
+            m = {k: self.container.m._in(k) for k in rows} #pylint: disable=protected-access
+            f2m(f, m)
+            self._m_valid[rows] = True
+
     @utils.itemproperty
     def F_halo(self, i):
         """
         get the distribution function i on the whole domain with halo points.
+
+        The halo points of the interfaces between the processes only
+        receive the distribution functions whose velocity points inside.
         """
+        self.natural_layout()
         return self.container.F[i]
 
     @F_halo.setter
     def F_halo(self, i, value):
-        self._update_m = True
+        self.natural_layout()
+        self._invalidate_moments()
         self.container.F[i] = value
 
     @utils.itemproperty
@@ -213,8 +442,34 @@ class Simulation:
         """
         get the distribution function i in the interior domain.
         """
+        self.natural_layout()
         return self.container.F._in(i) #pylint: disable=protected-access
 
+    def natural_layout(self):
+        """
+        put the distribution functions in the natural layout.
+
+        The in-place algorithms store the distribution functions
+        with a layout which depends on the phase of the time step.
+        This method is called before each access to the distribution
+        functions and does nothing for the other algorithms.
+        """
+        self._set_layout(None)
+
+    def _set_layout(self, phase):
+        """
+        put the distribution functions in the layout read by the time step
+        of the phase (None is the natural layout).
+        """
+        if self._phase == phase:
+            return
+        f = self.container.F
+        if self._phase is not None:
+            self.algo.to_natural(f, self._phase)
+        if phase is not None:
+            self.algo.from_natural(f, phase)
+        self._phase = phase
+
     def __str__(self):
         from .utils import header_string
         from .jinja_env import env
@@ -286,13 +541,18 @@ class Simulation:
         elif inittype == 'distributions':
             self.f2m()
 
+        self.container.F.sync_device()
         self.container.Fnew.array[:] = self.container.F.array[:]
+        self.container.Fnew.modified_on_device()
 
     def transport(self, **kwargs):
         """
         compute the transport phase on distribution functions
         (the array _F is modified)
         """
+        if self.algo.in_place:
+            log.error('Simulation.transport: the transport alone is not available with an in-place algorithm\n')
+            sys.exit()
         self.algo.call_function('transport', self, **kwargs)
 
     def relaxation(self, **kwargs):
@@ -315,6 +575,7 @@ class Simulation:
         compute the moments from the distribution functions
         (the array _m is modified)
         """
+        self.natural_layout()
         self.algo.call_function('f2m', self, **kwargs)
 
     @monitor
@@ -324,6 +585,8 @@ class Simulation:
         (the array _F is modified)
         """
         self.algo.call_function('m2f', self, m_user, f_user, **kwargs)
+        if f_user is None:
+            self._phase = None
 
     @monitor
     def equilibrium(self, m_user=None, **kwargs):
@@ -350,19 +613,135 @@ class Simulation:
         The array _F is modified in the phantom array (outer points)
         according to the specified boundary conditions.
         """
+        phase = self.nt % self.algo.nphases
+        self._set_layout(phase)
+        self._boundary_condition(phase, **kwargs)
+
+    def _add_driver(self):
+        """
+        Add to the generated code the loop over the time steps which
+        calls the kernels of the boundary conditions and of the time step.
+
+        Return the description of the loop (None if the loop can't be
+        generated: generators loo.py and numba, in-place algorithms,
+        overlap of the exchanges and boundary methods without routine name).
+        """
+        if self.generator.backend not in ['CYTHON', 'NUMPY'] or self.algo.nphases > 1 or self.overlap:
+            return None
+        calls = []
+        for method in self.bc.methods:
+            name = getattr(method, 'name', None)
+            if name not in self.generator.routines:
+                return None
+            calls.append((name, {'f': 'f', 'fcopy': 'copy'}))
+        calls.append((self.algo.kernel_name('one_time_step', 0), {'f': 'f', 'fnew': 'fnew', 't': 't'}))
+        self.generator.add_driver('run_steps', calls)
+        return self.generator.drivers[-1]
+
+    def _boundary_condition(self, phase=0, **kwargs):
         f = self.container.F
-        f.update()
+        f.update(self._exchange_shifts[phase])
 
+        self.bc.update_feq(self)
         for method in self.bc.methods:
-            method.update_feq(self)
-            method.set_rhs()
-            method.update(f, **kwargs)
+            method.update(f, phase, **kwargs)
+        f.modified_on_device()
+
+    #pylint: disable=too-many-locals
+    def _set_overlap(self):
+        """
+        Prepare the time step which computes the interior of the domain
+        during the exchange of the halo points (setting 'overlap').
+
+        The boundary conditions which read or write a point received or
+        sent by the exchange wait for it. The interior is the box of the
+        points which read neither a received point nor a point written by
+        these conditions. The shell (the other points) is split in boxes
+        computed after the exchange.
+        """
+        f = self.container.F
+        nspace, vmax = f.nspace, f.vmax
+        mpi_side = [neighbor != mpi.PROC_NULL for neighbor in f.neighbors]
+
+        near = np.zeros(nspace, dtype=bool)
+        for d in range(self.dim):
+            index = [slice(None)]*self.dim
+            if mpi_side[2*d]:
+                index[d] = slice(0, 2*vmax[d])
+                near[tuple(index)] = True
+            if mpi_side[2*d + 1]:
+                index[d] = slice(nspace[d] - 2*vmax[d], None)
+                near[tuple(index)] = True
+        written = [method.split_conditions(near) for method in self.bc.methods]
+
+        inner = [(v, n - v) for n, v in zip(nspace, vmax)]
+        lower = [v*(1 + mpi_side[2*d]) for d, v in enumerate(vmax[:self.dim])]
+        upper = [n - v*(1 + mpi_side[2*d + 1]) for d, (n, v) in enumerate(zip(nspace, vmax))]
+        if written:
+            for point in np.concatenate(written, axis=1).T:
+                if all(lower[d] - vmax[d] <= point[d] < upper[d] + vmax[d] for d in range(self.dim)):
+                    # remove the point from the points read with the smallest shrink
+                    shrinks = [(point[d] + vmax[d] + 1 - lower[d], d, 0) for d in range(self.dim)]
+                    shrinks += [(upper[d] - point[d] + vmax[d], d, 1) for d in range(self.dim)]
+                    _, d, side = min(shrinks)
+                    if side == 0:
+                        lower[d] = point[d] + vmax[d] + 1
+                    else:
+                        upper[d] = point[d] - vmax[d]
+
+        def bounds(box):
+            args = {}
+            for d, (start, stop) in enumerate(box):
+                args['i{}min'.format('xyz'[d])] = start
+                args['i{}max'.format('xyz'[d])] = stop
+            return args
+
+        if any(lower[d] >= upper[d] for d in range(self.dim)):
+            self._boxes = ([], [bounds(inner)])
+            return
+
+        shell = []
+        box = list(inner)
+        for d in range(self.dim):
+            if lower[d] > box[d][0]:
+                shell.append(bounds(box[:d] + [(box[d][0], lower[d])] + box[d + 1:]))
+            if upper[d] < box[d][1]:
+                shell.append(bounds(box[:d] + [(upper[d], box[d][1])] + box[d + 1:]))
+            box[d] = (lower[d], upper[d])
+        self._boxes = ([bounds(box)], shell)
+
+    def _overlapped_time_step(self, name, **kwargs):
+        """
+        compute the interior of the domain during the exchange
+        of the halo points and then the shell.
+        """
+        f = self.container.F
+        requests = f.start_update()
+
+        self.bc.update_feq(self)
+        for method in self.bc.methods:
+            method.update(f, part='local', **kwargs)
+        interior, shell = self._boxes
+        for box in interior:
+            self.algo.call_function(name, self, **box, **kwargs)
+
+        f.finish_update(requests)
+        for method in self.bc.methods:
+            method.update(f, part='halo', **kwargs)
+        for box in shell:
+            self.algo.call_function(name, self, **box, **kwargs)
 
     @monitor
-    def one_time_step(self, **kwargs):
+    def one_time_step(self, probe=False, **kwargs):
         """
         compute one time step
 
+        Parameters
+        ----------
+
+        probe : bool, optional
+            compute the probes during this time step (default is False)
+
         Notes
         -----
 
@@ -375,12 +754,310 @@ class Simulation:
         - relaxation
         - m2f
         """
-        self._update_m = True # we recompute f so m will be not correct
+        self._one_time_step(probe, **kwargs)
 
-        self.boundary_condition(**kwargs)
+    def _one_time_step(self, probe=False, **kwargs):
+        self._invalidate_moments() # we recompute f so m will be not correct
 
-        self.algo.call_function('one_time_step', self, **kwargs)
+        phase = self.nt % self.algo.nphases
+        self._set_layout(phase)
+
+        name = 'one_time_step'
+        if probe and self.probes.in_kernel and self.probes.reductions:
+            self.probes.reduction[...] = 0
+            name = 'one_time_step_reduce'
+        if self.overlap:
+            self._overlapped_time_step(name + '_box', **kwargs)
+        else:
+            self._boundary_condition(phase, **kwargs)
+            self.algo.call_function(self.algo.kernel_name(name, phase), self, **kwargs)
         self.container.F, self.container.Fnew = self.container.Fnew, self.container.F
+        self.algo.swap(self.container.F.array, self.container.Fnew.array)
+        self._phase = (phase + 1) % self.algo.nphases
 
         self.t += self.dt
         self.nt += 1
+
+        if probe and self.probes:
+            self.probes.collect(self)
+
+    @monitor
+    def run(self, n_steps, callback=None, callback_every=None, probe_every=None, **kwargs):
+        """
+        compute n_steps time steps
+
+        Parameters
+        ----------
+
+        n_steps : int
+            the number of time steps
+        callback : function, optional
+            function called as callback(simulation)
+            every callback_every time steps (default is None)
+        callback_every : int, optional
+            the number of time steps between two calls of callback
+            (default is n_steps)
+        probe_every : int, optional
+            the probes are computed when the iteration number nt
+            is a multiple of probe_every (default is None: no probe)
+
+        Notes
+        -----
+
+        The result is the same as n_steps calls of
+        :py:meth:`one_time_step<pylbm.simulation.Simulation.one_time_step>`.
+        With the Cython and NumPy generators, the time steps between two
+        callbacks (or two probes) are made by a loop generated with the
+        kernels: it calls the exchange of the halo points, the kernels of
+        the boundary conditions and the kernel of the time step and swaps
+        F and Fnew without going back to the simulation (the kernels are
+        called as C functions with Cython). The time steps are made one
+        by one for the other generators, the in-place algorithms, the
+        overlap of the exchanges, the boundary values which depend on the
+        time, the monitoring and the additional arguments of the kernels.
+        """
+        if n_steps < 0:
+            log.error('Simulation.run: the number of time steps must be positive\n')
+            sys.exit()
+
+        if callback_every is None:
+            callback_every = max(n_steps, 1)
+        elif callback_every <= 0:
+            log.error('Simulation.run: callback_every must be a positive integer\n')
+            sys.exit()
+
+        if probe_every is not None and probe_every <= 0:
+            log.error('Simulation.run: probe_every must be a positive integer\n')
+            sys.exit()
+
+        step = 0
+        while step < n_steps:
+            # the time steps until the next callback or the next probe
+            n = min(n_steps - step, callback_every - step % callback_every)
+            probe = False
+            if probe_every is not None and probe_every - self.nt % probe_every <= n:
+                n, probe = probe_every - self.nt % probe_every, True
+            self._steps(n - probe, **kwargs)
+            if probe:
+                self._one_time_step(probe, **kwargs)
+            step += n
+            if callback is not None and step % callback_every == 0:
+                callback(self)
+
+    def _steps(self, n_steps, **kwargs):
+        """
+        compute n_steps time steps without probe with the
+        generated loop if possible (see run)
+        """
+        if (self._driver is None or kwargs or self.bc.workspace is not None
+                or options().monitoring):
+            for _ in range(n_steps):
+                self._one_time_step(**kwargs)
+            return
+        if n_steps == 0:
+            return
+
+        self._invalidate_moments()
+        self._set_layout(0)
+        container = self.container
+        kernels = []
+        for method in self.bc.methods:
+            if method.kernel is None:
+                method.bind(container.F)
+                method._set_layout_indices(0) #pylint: disable=protected-access
+            kernels.append(method.kernel)
+        name = self.algo.kernel_name('one_time_step', 0)
+        kernels.append(self.algo.kernels.get(name, None) or self.algo.bind(self, name))
+
+        args = {'f': container.F.array, 'fnew': container.Fnew.array}
+        for i, kernel in enumerate(kernels):
+            names = self._driver.arguments(i, kernel.names)
+            for arg, value in zip(names, kernel.values):
+                if arg not in ['f', 'fnew', 't']:
+                    args[arg] = value
+
+        exchange = None
+        if any(neighbor != mpi.PROC_NULL for neighbor in container.F.neighbors):
+            arrays, shifts = (container.F, container.Fnew), self._exchange_shifts[0]
+            exchange = lambda parity: arrays[parity].update(shifts)
+
+        driver = getattr(self.generator.module, self._driver.name)
+        self.t = driver(n_steps, exchange, self.t, self.dt, **args)
+        self.nt += n_steps
+        if n_steps % 2:
+            container.F, container.Fnew = container.Fnew, container.F
+            self.algo.swap(container.F.array, container.Fnew.array)
+
+    @monitor
+    def run_until_steady(self, tol, check_every=100, moments=None, max_steps=None, **kwargs):
+        """
+        compute time steps until a steady state is reached
+
+        Every check_every time steps, the residual
+
+        .. math::
+
+            \\frac{\\lVert m - m_{\\text{prev}} \\rVert_2}{\\lVert m \\rVert_2}
+
+        is computed over the fluid points for the selected conserved moments
+        where m_prev is the value of the previous check. The simulation stops
+        as soon as the residual is lower than tol.
+
+        Parameters
+        ----------
+
+        tol : float
+            the tolerance on the residual
+        check_every : int, optional
+            the number of time steps between two checks (default is 100)
+        moments : list, optional
+            the conserved moments used in the residual
+            (default is None: all the conserved moments)
+        max_steps : int, optional
+            the maximum number of time steps (default is None: no limit)
+
+        Returns
+        -------
+
+        float
+            the last residual (the maximum over the members
+            if the simulation is an ensemble)
+
+        """
+        if tol <= 0:
+            log.error('Simulation.run_until_steady: the tolerance must be positive\n')
+            sys.exit()
+
+        if check_every <= 0:
+            log.error('Simulation.run_until_steady: check_every must be a positive integer\n')
+            sys.exit()
+
+        if moments is None:
+            moments = list(self.scheme.consm.keys())
+        key = tuple(moments)
+        if key not in self._residuals:
+            self._residuals[key] = Residual(self, moments)
+        residual = self._residuals[key]
+
+        # store the moments of the initial state
+        value = residual(self)
+        step = 0
+        while max_steps is None or step < max_steps:
+            n = check_every if max_steps is None else min(check_every, max_steps - step)
+            self._steps(n, **kwargs)
+            step += n
+            if step % check_every == 0:
+                value = residual(self)
+                if value < tol:
+                    log.info('Simulation.run_until_steady: steady state reached at nt=%d (residual %e)', self.nt, value)
+                    return value
+
+        log.warning('Simulation.run_until_steady: steady state not reached after %d time steps (residual %e)', step, value)
+        return value
+
+    @staticmethod
+    def _checkpoint_filename(path):
+        rank = mpi.COMM_WORLD.Get_rank()
+        return os.path.join(path, 'checkpoint_{}.h5'.format(rank))
+
+    @monitor
+    def checkpoint(self, path, compression=None):
+        """
+        save the state of the simulation to restart it later
+
+        Each process writes its raw array of distribution functions
+        (halo points included) with the time t and the iteration nt
+        in its own hdf5 file.
+
+        Parameters
+        ----------
+
+        path : string
+            the directory where the files are written
+        compression : string, optional
+            the hdf5 compression filter ('gzip', 'lzf', ...).
+            The array is then written by chunks.
+            Default is None: the array is stored in a contiguous way
+            and is memory-mapped by
+            :py:meth:`restore<pylbm.simulation.Simulation.restore>`.
+
+        """
+        os.makedirs(path, exist_ok=True)
+
+        self.natural_layout()
+        f = self.container.F
+        f.sync_host()
+
+        with h5py.File(self._checkpoint_filename(path), 'w') as h5file:
+            if compression is None:
+                h5file.create_dataset('F', data=f.array_cpu)
+            else:
+                h5file.create_dataset('F', data=f.array_cpu, chunks=True,
+                                      compression=compression)
+            h5file.attrs['t'] = self.t
+            h5file.attrs['nt'] = self.nt
+            h5file.attrs['size'] = mpi.COMM_WORLD.Get_size()
+            h5file.attrs['global_size'] = self.domain.global_size
+            h5file.attrs['decomposition'] = self.domain.decomposition
+            h5file.attrs['sorder'] = self.container.sorder
+            h5file.attrs['aosoa'] = self.aosoa or 0
+
+        mpi.COMM_WORLD.Barrier()
+
+    @monitor
+    def restore(self, path):
+        """
+        restore the state of the simulation saved by
+        :py:meth:`checkpoint<pylbm.simulation.Simulation.checkpoint>`
+
+        The distribution functions are read back in place
+        (memory-mapped when the checkpoint is not compressed) and
+        the time dependent boundary conditions are computed at the
+        restored time.
+
+        Parameters
+        ----------
+
+        path : string
+            the directory where the files have been written
+
+        """
+        filename = self._checkpoint_filename(path)
+        if not os.path.exists(filename):
+            log.error('Simulation.restore: the file %s does not exist\n', filename)
+            sys.exit()
+
+        f = self.container.F
+        with h5py.File(filename, 'r') as h5file:
+            dset = h5file['F']
+            # the same array shape can be obtained with other global sizes
+            # or other regions owned by the processes
+            if h5file.attrs['size'] != mpi.COMM_WORLD.Get_size() or \
+               list(h5file.attrs['global_size']) != list(self.domain.global_size) or \
+               h5file.attrs.get('decomposition', 'uniform') != self.domain.decomposition or \
+               list(h5file.attrs['sorder']) != list(self.container.sorder) or \
+               h5file.attrs.get('aosoa', 0) != (self.aosoa or 0) or \
+               dset.shape != f.array_cpu.shape or dset.dtype != f.array_cpu.dtype:
+                log.error('Simulation.restore: the checkpoint %s is not compatible with this simulation\n', path)
+                sys.exit()
+
+            offset = dset.id.get_offset()
+            if offset is None:
+                dset.read_direct(f.array_cpu)
+            else:
+                f.array_cpu[...] = np.memmap(filename, dtype=dset.dtype, mode='r',
+                                             offset=offset, shape=dset.shape)
+            self.t = float(h5file.attrs['t'])
+            self.nt = int(h5file.attrs['nt'])
+
+        f.modified_on_host()
+        if self.container.Fnew is not f:
+            f.sync_device()
+            self.container.Fnew.array[...] = f.array
+            self.container.Fnew.modified_on_device()
+
+        self._phase = None
+        self._invalidate_moments()
+        self.bc.update_feq(self)
+        for method in self.bc.methods:
+            method.set_rhs()
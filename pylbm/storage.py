@@ -18,6 +18,7 @@ import mpi4py.MPI as mpi
 
 from .generator import For
 from .monitoring import monitor
+from .mpi_topology import get_directions, get_mpi_datatype
 
 log = logging.getLogger(__name__) # pylint: disable=invalid-name
 
@@ -45,7 +46,27 @@ class Array:
     dtype: type
         the type of the array. Default is numpy.double
     gpu_support : bool
-        true if GPU is needed
+        true if GPU is needed. The host and the device copies are then
+        synchronized lazily: the accesses only transfer the velocities
+        which are stale on one side
+    nbatch : int
+        the number of members of an ensemble. If it is defined,
+        a leading axis of size nbatch is added to the array and
+        the accesses return all the members at once.
+        Default is None (no ensemble)
+    block : int
+        the number of points of the blocks of an array of structures
+        of arrays (AoSoA). If it is defined, the last space axis given
+        by sorder is split in blocks of block points and the values of
+        all the velocities of a block are contiguous. The accesses then
+        return copies in the order [nv, nx, ny, nz].
+        Default is None (the storage is given by sorder)
+    velocities : ndarray
+        the velocities of the distribution functions stored in the array.
+        If it is defined, the interfaces between the processes only
+        exchange the distribution functions read by the transport: a ghost
+        point only receives the velocities which point inside the
+        subdomain. Default is None (all the velocities are exchanged)
 
     Attributes
     ----------
@@ -58,14 +79,23 @@ class Array:
     """
     #pylint: disable=too-many-locals
     def __init__(self, nv, gspace_size, vmax, sorder=None,
-                 mpi_topo=None, dtype=np.double, gpu_support=False):
+                 mpi_topo=None, dtype=np.double, gpu_support=False,
+                 nbatch=None, block=None, velocities=None):
         self.comm = mpi.COMM_WORLD
         self.sorder = sorder
+        self.dtype = np.dtype(dtype)
+        self.nbatch = nbatch
+        self.block = block
+        self._batch = [] if nbatch is None else [slice(None)]
 
         self.gspace_size = gspace_size
         self.dim = len(gspace_size)
         self.consm = {}
         self.gpu_support = gpu_support
+        self.update_kernels = None
+        self.velocities = None
+        if velocities is not None:
+            self.velocities = np.asarray(velocities, dtype=int).reshape(nv, self.dim)
 
         if mpi_topo is not None:
             self.mpi_topo = mpi_topo
@@ -93,6 +123,14 @@ class Array:
         shape = [0]*len(tmpshape)
         for i in range(self.dim + 1):
             shape[ind[i]] = int(tmpshape[i])
+        if block is not None:
+            # the space axes in the order of sorder, the last one is split in blocks
+            self._nv = int(nv)
+            self._nspace = tuple(int(n) for n in self.region_size)
+            space = [self._nspace[i] for i in self._space_axes()]
+            shape = space[:-1] + [-(-space[-1]//block), nv, block]
+        if nbatch is not None:
+            shape = [nbatch] + shape
         self.array_cpu = np.zeros((shape), dtype=dtype)
         self.array = self.array_cpu
 
@@ -104,8 +142,17 @@ class Array:
             except ImportError:
                 raise ImportError("Please install loo.py")
             self.array = cl.array.to_device(queue, self.array_cpu)
-
-        self.swaparray = np.transpose(self.array_cpu, self.index)
+        # the velocities whose values are stale on the host (resp. on the device)
+        self._host_stale = np.zeros(nv, dtype=bool)
+        self._device_stale = np.zeros(nv, dtype=bool)
+
+        batch_axes = [0] if nbatch is not None else []
+        if block is None:
+            self.swaparray = np.transpose(self.array_cpu,
+                                          batch_axes + [i + len(batch_axes) for i in self.index])
+        else:
+            # the storage by blocks can't be seen as a permutation of [nv, nx, ny, nz]
+            self.swaparray = None
 
         if mpi_topo is not None:
             self._set_subarray()
@@ -113,26 +160,78 @@ class Array:
         # if self.gpu_support:
         #     self.generate()
 
+    def _key(self, key):
+        """
+        the index in swaparray of the key
+        (all the members of an ensemble are selected).
+        """
+        if isinstance(key, (sp.Symbol, sp.IndexedBase)):
+            key = self.consm[key]
+        if not isinstance(key, tuple):
+            key = (key,)
+        return tuple(self._batch) + key
+
+    def _space_axes(self):
+        """
+        the space axis stored at each position (order given by sorder).
+        """
+        return [int(i) for i in np.argsort(self.index[1:])]
+
+    def _get_velocity(self, k):
+        """
+        return a copy of the values of the velocity k
+        in the order [nx, ny, nz] (storage by blocks).
+        """
+        nbatch = len(self._batch)
+        values = self.array_cpu[tuple(self._batch) + (Ellipsis, k, slice(None))]
+        values = values.reshape(values.shape[:-2] + (-1,))
+        values = values[..., :self._nspace[self._space_axes()[-1]]]
+        return values.transpose(list(range(nbatch)) +
+                                [nbatch + int(i) for i in np.argsort(self._space_axes())])
+
+    def _set_velocity(self, k, values):
+        """
+        set the values of the velocity k given
+        in the order [nx, ny, nz] (storage by blocks).
+        """
+        nbatch = len(self._batch)
+        natural = np.empty(self.array_cpu.shape[:nbatch] + self._nspace, dtype=self.dtype)
+        natural[...] = values
+        natural = natural.transpose(list(range(nbatch)) + [nbatch + i for i in self._space_axes()])
+        target = self.array_cpu[tuple(self._batch) + (Ellipsis, k, slice(None))]
+        padded = np.zeros(target.shape[:-2] + (target.shape[-2]*self.block,), dtype=self.dtype)
+        padded[..., :natural.shape[-1]] = natural
+        target[...] = padded.reshape(target.shape)
+
+    def _get(self, key):
+        """
+        return the values of key in the order [nv, nx, ny, nz].
+        """
+        key = self._key(key)
+        if self.block is None:
+            return self.swaparray[key]
+        nbatch = len(self._batch)
+        if len(key) == nbatch + 1 and isinstance(key[-1], (int, np.integer)):
+            return self._get_velocity(key[-1])
+        natural = np.stack([self._get_velocity(k) for k in range(self._nv)], axis=nbatch)
+        return natural[key]
+
     def __getitem__(self, key):
-        if self.gpu_support:
-            self.array_cpu[...] = self.array.get()
-        if isinstance(key, sp.Symbol):
-            return self.swaparray[self.consm[key]]
-        return self.swaparray[key]
+        self.sync_host(key)
+        return self._get(key)
 
     def __setitem__(self, key, values):
-        if isinstance(key, sp.Symbol):
-            self.swaparray[self.consm[key]] = values
+        # the values which are not assigned must be up to date on the host
+        self.sync_host(key if self.block is None else None)
+        if self.block is None:
+            self.swaparray[self._key(key)] = values
         else:
-            self.swaparray[key] = values
-        if self.gpu_support:
-            try:
-                import pyopencl as cl
-                import pyopencl.array #pylint: disable=unused-variable
-                from .context import queue
-            except ImportError:
-                raise ImportError("Please install loo.py")
-            self.array = cl.array.to_device(queue, self.array_cpu)
+            nbatch = len(self._batch)
+            natural = np.stack([self._get_velocity(k) for k in range(self._nv)], axis=nbatch)
+            natural[self._key(key)] = values
+            for k in range(self._nv):
+                self._set_velocity(k, natural[tuple(self._batch) + (k,)])
+        self.modified_on_host(key)
 
     def _in(self, key):
         ind = []
@@ -140,12 +239,106 @@ class Array:
             ind.append(slice(vmax, -vmax))
         ind = np.asarray(ind)
 
+        self.sync_host(key)
+        return self._get(key)[tuple(self._batch + list(ind))]
+
+    def _velocities(self, key=None):
+        """
+        the mask of the velocities selected by key (all if key is None).
+        """
+        mask = np.zeros(self._host_stale.size, dtype=bool)
+        key = () if key is None else self._key(key)[len(self._batch):]
+        if not key or key[0] is Ellipsis:
+            mask[:] = True
+        else:
+            mask[key[0]] = True
+        return mask
+
+    def _velocity_axis(self):
+        """
+        the axis of the velocities in the storage.
+        """
+        if self.block is not None:
+            return self.array_cpu.ndim - 2
+        return len(self._batch) + self.index[0]
+
+    def _runs(self, mask):
+        """
+        the slices of the consecutive velocities of mask.
+        """
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+        return [slice(start, stop) for start, stop in zip(edges[::2], edges[1::2])]
+
+    def sync_host(self, key=None):
+        """
+        transfer from the device the velocities selected by key
+        which are stale on the host.
+
+        When the velocities are the first axis of the storage, only
+        the touched velocities are transferred. Otherwise the whole
+        device array is read and the stale velocities are copied.
+
+        Parameters
+        ----------
+        key : optional
+            the key of the access (default is None: all the velocities)
+
+        """
+        if not self.gpu_support:
+            return
+        mask = self._velocities(key) & self._host_stale
+        if not mask.any():
+            return
+        axis = self._velocity_axis()
+        if axis == 0:
+            for run in self._runs(mask):
+                self.array_cpu[run] = self.array[run].get()
+        else:
+            values = self.array.get()
+            np.moveaxis(self.array_cpu, axis, 0)[mask] = np.moveaxis(values, axis, 0)[mask]
+        self._host_stale[mask] = False
+
+    def sync_device(self):
+        """
+        transfer to the device the velocities modified on the host.
+
+        The transfers are made in place to keep the references
+        of the bound kernels valid.
+        """
+        if not self.gpu_support:
+            return
+        mask = self._device_stale
+        if not mask.any():
+            return
+        if self._velocity_axis() == 0:
+            for run in self._runs(mask):
+                self.array[run].set(self.array_cpu[run])
+        else:
+            # the whole array is written: the host must be up to date
+            self.sync_host()
+            self.array.set(self.array_cpu)
+        self._device_stale[:] = False
+
+    def modified_on_host(self, key=None):
+        """
+        mark the velocities selected by key as modified on the host.
+
+        Parameters
+        ----------
+        key : optional
+            the key of the access (default is None: all the velocities)
+
+        """
         if self.gpu_support:
-            self.array_cpu[...] = self.array.get()
-        if isinstance(key, (sp.Symbol, sp.IndexedBase)):
-            return self.swaparray[self.consm[key]][tuple(ind)]
-        return self.swaparray[key][tuple(ind)]
+            self._device_stale |= self._velocities(key)
 
+    def modified_on_device(self):
+        """
+        mark the whole array as modified on the device
+        (called after the kernels which write the array).
+        """
+        if self.gpu_support:
+            self._host_stale[:] = True
 
     def set_conserved_moments(self, consm):
         """
@@ -169,19 +362,48 @@ class Array:
         for k, v in consm.items():
             self.consm[k] = v
 
+    def sub_array(self, start, stop):
+        """
+        Return an Array which shares the memory of the points
+        start to stop of the first space axis.
+
+        The sub array is always on the host: the data of a GPU array
+        must be transferred by the owner of the whole array.
+
+        Parameters
+        ----------
+        start : int
+            the first point
+        stop : int
+            the last point (excluded)
+
+        """
+        sub = copy.copy(self)
+        axis = [slice(None)]*self.array_cpu.ndim
+        axis[len(self._batch) + self.index[1]] = slice(start, stop)
+        sub.array_cpu = self.array_cpu[tuple(axis)]
+        sub.array = sub.array_cpu
+        sub.swaparray = self.swaparray[tuple(self._batch) + (slice(None), slice(start, stop))]
+        sub.gpu_support = False
+        return sub
+
     @property
     def nspace(self):
         """
         the space size.
         """
-        return self.swaparray.shape[1:]
+        if self.block is not None:
+            return self._nspace
+        return self.swaparray.shape[len(self._batch) + 1:]
 
     @property
     def nv(self):
         """
         the number of velocities.
         """
-        return self.swaparray.shape[0]
+        if self.block is not None:
+            return self._nv
+        return self.swaparray.shape[len(self._batch)]
 
     @property
     def shape(self):
@@ -197,25 +419,118 @@ class Array:
         """
         return self.array.size
 
+    def _storage_index(self, array_in, batch=0):
+        """
+        reorder a list given in the order (velocity, space) with the storage
+        order (the size or the start of the batch axis is prepended for an
+        ensemble).
+        """
+        array_out = [0]*(self.dim+1)
+        for i in range(self.dim+1):
+            array_out[self.index[i]] = array_in[i]
+        if self.nbatch is not None:
+            # the whole ensemble is exchanged at once
+            return [batch] + array_out
+        return array_out
+
+    def _inward(self, direction):
+        """
+        Return the indices of the velocities read by the transport
+        in the ghost points of the given direction: each nonzero
+        component of the velocity points inside the subdomain.
+        Return None if all the velocities are exchanged.
+
+        Parameters
+        ----------
+
+        direction : list
+            the side of the ghost points in each dimension (-1, 0 or 1)
+
+        """
+        if self.velocities is None:
+            return None
+        inward = np.ones(self.nv, dtype=bool)
+        for d, side in enumerate(direction): #pylint: disable=invalid-name
+            if side != 0:
+                inward &= self.velocities[:, d]*side < 0
+        return np.nonzero(inward)[0]
+
+    def _subarray(self, mpi_type, sizes, subsizes, starts, velocities=None):
+        """
+        Return the MPI datatype of a block of the array given
+        in the order of _storage_index.
+
+        The storage by blocks (AoSoA) uses an indexed datatype
+        which lists the elements of the block in the order
+        [nv, nx, ny, nz] on both sides of the exchange.
+
+        If velocities is defined, only these velocities of the block
+        are taken (the runs of consecutive velocities are gathered
+        in a struct of subarrays). Return None if it is empty.
+        """
+        nbatch = len(self._batch)
+        vaxis = nbatch + self.index[0]
+        if velocities is not None:
+            velocities = np.asarray(velocities, dtype=int)
+            if velocities.size == 0:
+                return None
+            if velocities.size == subsizes[vaxis]:
+                velocities = None
+
+        if self.block is None:
+            if velocities is None:
+                return mpi_type.Create_subarray(sizes, subsizes, starts)
+            types = []
+            for run in self._runs(np.isin(np.arange(self.nv), velocities)):
+                run_subsizes, run_starts = list(subsizes), list(starts)
+                run_subsizes[vaxis] = int(run.stop - run.start)
+                run_starts[vaxis] = int(run.start)
+                types.append(mpi_type.Create_subarray(sizes, run_subsizes, run_starts))
+            datatype = mpi.Datatype.Create_struct([1]*len(types), [0]*len(types), types)
+            for run_type in types:
+                run_type.Free()
+            return datatype
+
+        ranges = [np.arange(starts[nbatch + i], starts[nbatch + i] + subsizes[nbatch + i])
+                  for i in self.index]
+        if velocities is not None:
+            ranges[0] = velocities
+        natural = np.meshgrid(*ranges, indexing='ij')
+        space = [natural[1 + i] for i in self._space_axes()]
+        index = space[:-1] + [space[-1]//self.block, natural[0], space[-1] % self.block]
+        shape = self.array_cpu.shape[nbatch:]
+        offsets = np.ravel_multi_index(index, shape).ravel()
+        if self.nbatch is not None:
+            # the whole ensemble is exchanged at once
+            offsets = (np.arange(self.nbatch)[:, np.newaxis]*int(np.prod(shape)) + offsets).ravel()
+        # the extent is the whole array as for a subarray
+        indexed = mpi_type.Create_indexed_block(1, offsets.tolist())
+        datatype = indexed.Create_resized(0, self.array_cpu.nbytes)
+        indexed.Free()
+        return datatype
+
     #pylint: disable=too-many-locals
     def _set_subarray(self):
         """
         Create the neigbors and the subarrays to update interfaces
         between each processes.
 
+        If the velocities are defined, a face only sends the velocities
+        which point inside the neighbor: the velocities with a negative
+        (resp. positive) component are sent to the left (resp. right)
+        neighbor. The faces also contain the ghost points of the previous
+        dimensions, so the corners receive the velocities which point
+        inside in each dimension.
+
         """
         nspace = list(self.nspace)
         nv = self.nv
         dim = self.dim
         vmax = self.vmax
+        mpi_type = get_mpi_datatype(self.dtype)
+        swap = self._storage_index
 
-        def swap(array_in):
-            array_out = [0]*(dim+1)
-            for i in range(dim+1):
-                array_out[self.index[i]] = array_in[i]
-            return array_out
-
-        sizes = swap([nv] + nspace)
+        sizes = swap([nv] + nspace, self.nbatch)
 
         rank = self.mpi_topo.cartcomm.Get_rank()
         coords = self.mpi_topo.cartcomm.Get_coords(rank)
@@ -239,15 +554,22 @@ class Array:
         for d in range(dim): #pylint: disable=invalid-name
             subsizes = [nv] + nspace
             subsizes[d+1] = vmax[d]
-            subsizes = swap(subsizes)
+            subsizes = swap(subsizes, self.nbatch)
+
+            # the velocities read in the left and in the right ghost points
+            side = [0]*dim
+            side[d] = -1
+            left = self._inward(side)
+            side[d] = 1
+            right = self._inward(side)
 
             sstart = [0]*(dim+1)
             sstart[d+1] = vmax[d]
             sstart = swap(sstart)
-            rstart = [0]*(dim+1)
+            rstart = swap([0]*(dim+1))
 
-            self.send_type.append(mpi.DOUBLE.Create_subarray(sizes, subsizes, sstart))
-            self.recv_type.append(mpi.DOUBLE.Create_subarray(sizes, subsizes, rstart))
+            self.send_type.append(self._subarray(mpi_type, sizes, subsizes, sstart, right))
+            self.recv_type.append(self._subarray(mpi_type, sizes, subsizes, rstart, left))
 
             log.info("[%d] send to %d with tag %d subarray:%s", rank, self.neighbors[2*d], self.send_tag[2*d], (sizes, subsizes, sstart))
             log.info("[%d] recv from %d with tag %d subarray:%s", rank, self.neighbors[2*d], self.recv_tag[2*d], (sizes, subsizes, rstart))
@@ -259,55 +581,270 @@ class Array:
             rstart[d+1] = nspace[d] - vmax[d]
             rstart = swap(rstart)
 
-            self.send_type.append(mpi.DOUBLE.Create_subarray(sizes, subsizes, sstart))
-            self.recv_type.append(mpi.DOUBLE.Create_subarray(sizes, subsizes, rstart))
+            self.send_type.append(self._subarray(mpi_type, sizes, subsizes, sstart, left))
+            self.recv_type.append(self._subarray(mpi_type, sizes, subsizes, rstart, right))
 
             log.info("[%d] send to %d with tag %d subarray:%s", rank, self.neighbors[2*d+1], self.send_tag[2*d+1], (sizes, subsizes, sstart))
             log.info("[%d] recv from %d with tag %d subarray:%s", rank, self.neighbors[2*d+1], self.recv_tag[2*d+1], (sizes, subsizes, rstart))
 
-        for send, recv in zip(self.send_type, self.recv_type):
-            send.Commit()
-            recv.Commit()
+        for datatype in self.send_type + self.recv_type:
+            # no message if no velocity crosses the face
+            if datatype is not None:
+                datatype.Commit()
+
+        self._layout_types = {}
+        self._requests = {}
+        self._halo_requests = None
+
+    #pylint: disable=too-many-locals
+    def _set_halo_types(self):
+        """
+        Create the neighbors and the subarrays to update the interfaces
+        with all the messages at once: the faces, the edges and the
+        corners are exchanged with their own neighbor.
+
+        The messages of update are sent one dimension after the other
+        to fill the corners. Here no message depends on another one
+        and the exchange can be made during a computation
+        (see start_update). The persistent requests of the exchange
+        are created once. As in _set_subarray, only the velocities
+        which point inside the neighbor are sent and there is no
+        message for a direction without such a velocity.
+        """
+        nspace = list(self.nspace)
+        nv = self.nv
+        dim = self.dim
+        vmax = self.vmax
+        mpi_type = get_mpi_datatype(self.dtype)
+        swap = self._storage_index
+
+        sizes = swap([nv] + nspace, self.nbatch)
+
+        cartcomm = self.mpi_topo.cartcomm
+        split, periods, coords = cartcomm.Get_topo()
+        directions = [tuple(int(c) for c in direction)
+                      for direction in get_directions(dim) if any(direction)]
+        tags = {direction: tag for tag, direction in enumerate(directions)}
+
+        recv_req, send_req = [], []
+        for direction in directions:
+            neighbor = [coords[d] + direction[d] for d in range(dim)]
+            if all(periods[d] or 0 <= neighbor[d] < split[d] for d in range(dim)):
+                neighbor = cartcomm.Get_cart_rank([neighbor[d] % split[d] for d in range(dim)])
+            else:
+                neighbor = mpi.PROC_NULL
+
+            subsizes, sstart, rstart = [nv], [0], [0]
+            for d in range(dim): #pylint: disable=invalid-name
+                if direction[d] == 0:
+                    subsizes.append(nspace[d] - 2*vmax[d])
+                    sstart.append(vmax[d])
+                    rstart.append(vmax[d])
+                elif direction[d] < 0:
+                    subsizes.append(vmax[d])
+                    sstart.append(vmax[d])
+                    rstart.append(0)
+                else:
+                    subsizes.append(vmax[d])
+                    sstart.append(nspace[d] - 2*vmax[d])
+                    rstart.append(nspace[d] - vmax[d])
+            subsizes = swap(subsizes, self.nbatch)
+
+            opposite = tuple(-c for c in direction)
+            send_type = self._subarray(mpi_type, sizes, subsizes, swap(sstart), self._inward(opposite))
+            recv_type = self._subarray(mpi_type, sizes, subsizes, swap(rstart), self._inward(direction))
+            if recv_type is not None:
+                recv_type.Commit()
+                recv_req.append(self.comm.Recv_init([self.array, recv_type], source=neighbor, tag=tags[opposite]))
+            if send_type is not None:
+                send_type.Commit()
+                send_req.append(self.comm.Send_init([self.array, send_type], dest=neighbor, tag=tags[direction]))
+        self._halo_requests = recv_req + send_req
+
+    def _get_requests(self, shifts=None):
+        """
+        Return the persistent requests of update for the layout
+        given by shifts: one list of requests for each dimension.
+
+        The requests are created once for each layout and are
+        only started by update.
+
+        Parameters
+        ----------
+
+        shifts : ndarray, optional
+            the shift of each slot if the distribution functions are stored
+            with a layout of an in-place algorithm (default is None)
+
+        """
+        key = None if shifts is None else tuple(map(tuple, shifts))
+        if key in self._requests:
+            return self._requests[key]
+
+        send_type, recv_type = self.send_type, self.recv_type
+        if shifts is not None:
+            send_type, recv_type = self._get_layout_types(shifts)
+
+        requests = []
+        for d in range(self.dim): #pylint: disable=invalid-name
+            req = []
+            for i in [2*d, 2*d + 1]:
+                if recv_type[i] is not None:
+                    req.append(self.comm.Recv_init([self.array, recv_type[i]], source=self.neighbors[i], tag=self.recv_tag[i]))
+            for i in [2*d, 2*d + 1]:
+                if send_type[i] is not None:
+                    req.append(self.comm.Send_init([self.array, send_type[i]], dest=self.neighbors[i], tag=self.send_tag[i]))
+            requests.append(req)
+
+        self._requests[key] = requests
+        return requests
+
+    #pylint: disable=too-many-locals
+    def _get_layout_types(self, shifts):
+        """
+        Return the subarrays to update the interfaces when the
+        distribution functions are stored with a layout of an
+        in-place algorithm.
+
+        The slot s of the point x contains a distribution function
+        of the point x - shifts[s]. If shifts[s] is zero in the direction d,
+        the interface is updated as usual. Otherwise, the values stored
+        in the ghost points by the last time step are sent to
+        the inner points of the neighbor.
+
+        Parameters
+        ----------
+
+        shifts : ndarray
+            the shift of each slot
+
+        """
+        key = tuple(map(tuple, shifts))
+        if key in self._layout_types:
+            return self._layout_types[key]
+
+        nspace = list(self.nspace)
+        mpi_type = get_mpi_datatype(self.dtype)
+        sizes = self._storage_index([self.nv] + nspace, self.nbatch)
+
+        def subarray(slot, d, start, width):
+            subsizes = [1] + nspace
+            subsizes[d+1] = width
+            starts = [slot] + [0]*self.dim
+            starts[d+1] = start
+            return mpi_type.Create_subarray(sizes,
+                                            self._storage_index(subsizes, self.nbatch),
+                                            self._storage_index(starts))
+
+        def struct(types):
+            return mpi.Datatype.Create_struct([1]*len(types), [0]*len(types), types)
+
+        send_type, recv_type = [], []
+        for d in range(self.dim): #pylint: disable=invalid-name
+            vmax, n = self.vmax[d], nspace[d]
+            # to the left neighbor and to the right neighbor
+            send = ([], [])
+            recv = ([], [])
+            for slot, shift in enumerate(shifts):
+                shift = int(shift[d])
+                if shift == 0:
+                    send[0].append(subarray(slot, d, vmax, vmax))
+                    recv[0].append(subarray(slot, d, n - vmax, vmax))
+                    send[1].append(subarray(slot, d, n - 2*vmax, vmax))
+                    recv[1].append(subarray(slot, d, 0, vmax))
+                elif shift < 0:
+                    send[0].append(subarray(slot, d, vmax + shift, -shift))
+                    recv[0].append(subarray(slot, d, n - vmax + shift, -shift))
+                else:
+                    send[1].append(subarray(slot, d, n - vmax, shift))
+                    recv[1].append(subarray(slot, d, vmax, shift))
+            send_type += [struct(send[0]), struct(send[1])]
+            recv_type += [struct(recv[1]), struct(recv[0])]
+
+        for datatype in send_type + recv_type:
+            datatype.Commit()
+
+        self._layout_types[key] = (send_type, recv_type)
+        return send_type, recv_type
 
     #pylint: disable=possibly-unused-variable
     @monitor
-    def update(self):
+    def update(self, shifts=None):
         """
         update ghost points on the interface with the datas of the neighbors.
+
+        Parameters
+        ----------
+
+        shifts : ndarray, optional
+            the shift of each slot if the distribution functions are stored
+            with a layout of an in-place algorithm (default is None)
+
         """
         if self.gpu_support:
             # FIXME: move the generated code outside for loopy
-            from .symbolic import call_genfunction
+            if self.update_kernels is None:
+                self._bind_update_kernels()
+            self.sync_device()
+            for kernel in self.update_kernels:
+                kernel()
+            self.modified_on_device()
 
-            dim = len(self.nspace)
-            nx = self.nspace[0]
-            if dim > 1:
-                ny = self.nspace[1]
-            if dim > 2:
-                nz = self.nspace[2]
-            nv = self.nv
+        else:
+            # the dimensions are exchanged one after the other to fill the corners
+            for req in self._get_requests(shifts):
+                mpi.Prequest.Startall(req)
+                mpi.Request.Waitall(req)
 
-            f = self.array
+    @monitor
+    def start_update(self):
+        """
+        post the exchange of the ghost points with all the neighbors
+        without waiting for the messages.
 
-            args = locals()
-            call_genfunction(self.generator.module.update_x, args)
+        The array must not be modified near the interfaces until
+        finish_update is called with the returned requests.
 
-            if dim > 1:
-                call_genfunction(self.generator.module.update_y, args)
-            if dim > 2:
-                call_genfunction(self.generator.module.update_z, args)
+        Returns
+        -------
 
-        else:
-            for d in range(self.dim): #pylint: disable=invalid-name
-                req = []
+        list
+            the MPI requests of the exchange
 
-                req.append(self.comm.Irecv([self.array, self.recv_type[2*d]], source=self.neighbors[2*d], tag=self.recv_tag[2*d]))
-                req.append(self.comm.Irecv([self.array, self.recv_type[2*d + 1]], source=self.neighbors[2*d + 1], tag=self.recv_tag[2*d + 1]))
+        """
+        if self._halo_requests is None:
+            self._set_halo_types()
+        mpi.Prequest.Startall(self._halo_requests)
+        return self._halo_requests
 
-                req.append(self.comm.Isend([self.array, self.send_type[2*d]], dest=self.neighbors[2*d], tag=self.send_tag[2*d]))
-                req.append(self.comm.Isend([self.array, self.send_type[2*d + 1]], dest=self.neighbors[2*d + 1], tag=self.send_tag[2*d + 1]))
+    @monitor
+    def finish_update(self, requests): #pylint: disable=no-self-use
+        """
+        wait for the exchange posted by start_update.
 
-                mpi.Request.Waitall(req)
+        Parameters
+        ----------
+
+        requests : list
+            the MPI requests returned by start_update
+
+        """
+        mpi.Request.Waitall(requests)
+
+    def _bind_update_kernels(self):
+        """
+        bind the generated periodic conditions functions
+        to the array (loo.py backend).
+        """
+        from .symbolic import BoundKernel
+
+        args = {'f': self.array, 'nv': self.nv}
+        for i, nspace in enumerate(self.nspace):
+            args['n' + 'xyz'[i]] = nspace
+
+        self.update_kernels = []
+        for name in ['update_x', 'update_y', 'update_z'][:self.dim]:
+            self.update_kernels.append(BoundKernel(getattr(self.generator.module, name), args))
 
     #pylint: disable=too-many-locals
     def generate(self, generator):
@@ -349,6 +886,240 @@ class Array:
             iloop = set_order([s, i, j, k], remove_index=3)
             generator.add_routine(('update_z', For(iloop, sp.Eq(f_store, f_load))))
 
+class CompactArray(Array):
+    """
+    This class defines a storage of the distribution functions
+    on a list of points of the grid (the other points are not stored).
+
+    The point p of the storage is the point points[p] of the grid and
+    the array has the shape [nv, npoints] (or [npoints, nv], following
+    the position of the velocities in sorder). The accesses use the
+    order [nv, nx, ny, nz] of the whole grid: they return copies where
+    the points which are not stored are set to zero and the assigned
+    values of these points are lost.
+
+    The interfaces between the processes are exchanged with all the
+    neighbors at once (faces, edges and corners) through buffers
+    which contain all the points of each face: a point which is not
+    stored by the sender is sent as zero and a point which is not
+    stored by the receiver is dropped.
+
+    Parameters
+    ----------
+    nv: int
+        number of velocities
+    nspace: list
+        number of points of the grid in each direction
+        (halo points included)
+    vmax: list
+        the size of the fictitious points in each direction
+    points: ndarray
+        the indices (with the halo points) of the stored points,
+        array of shape (npoints, dim)
+    sorder: list
+        the order of nv, nx, ny and nz of the whole grid.
+        Default is None which mean [nv, nx, ny, nz]
+    mpi_topo: MpiTopology
+        the mpi topology. Default is None (no exchange)
+    dtype: type
+        the type of the array. Default is numpy.double
+    nbatch: int
+        the number of members of an ensemble. Default is None
+    velocities: ndarray
+        the velocities of the distribution functions which restrict
+        the exchanges at the interfaces. Default is None
+
+    Attributes
+    ----------
+    array
+    nspace
+    nv
+    shape
+    size
+    points
+    compact_index
+
+    """
+    #pylint: disable=too-many-arguments
+    def __init__(self, nv, nspace, vmax, points, sorder=None,
+                 mpi_topo=None, dtype=np.double, nbatch=None, velocities=None):
+        self.points = np.ascontiguousarray(points, dtype=np.int32)
+        Array.__init__(self, nv, [self.points.shape[0]], [0],
+                       self.storage_order(sorder), None, dtype, nbatch=nbatch)
+        self.dim = len(nspace)
+        self.vmax = vmax
+        self.dense_size = tuple(int(n) for n in nspace)
+        if velocities is not None:
+            self.velocities = np.asarray(velocities, dtype=int).reshape(nv, self.dim)
+
+        # the index in the storage of each point of the grid (-1 if not stored)
+        self.compact_index = -np.ones(self.dense_size, dtype=np.int32)
+        self.compact_index[tuple(self.points.T)] = np.arange(self.points.shape[0], dtype=np.int32)
+
+        self.neighbors = [mpi.PROC_NULL]*(2*self.dim)
+        self._exchanges = []
+        self._pending = []
+        if mpi_topo is not None:
+            self.mpi_topo = mpi_topo
+            self._set_exchanges()
+
+    @staticmethod
+    def storage_order(sorder):
+        """
+        Return the order of the velocities and of the points in the
+        storage: the velocities are first if they are first in sorder.
+
+        Parameters
+        ----------
+        sorder: list
+            the order of nv, nx, ny and nz of the whole grid
+        """
+        if sorder is None or sorder[0] == 0:
+            return [0, 1]
+        return [1, 0]
+
+    def _dense(self):
+        """
+        return the values on the whole grid in the order [nv, nx, ny, nz]
+        (the points which are not stored are set to zero).
+        """
+        nbatch = len(self._batch)
+        dense = np.zeros(self.swaparray.shape[:nbatch + 1] + self.dense_size, dtype=self.dtype)
+        dense[(Ellipsis,) + tuple(self.points.T)] = self.swaparray
+        return dense
+
+    def _get(self, key):
+        key = self._key(key)
+        nbatch = len(self._batch)
+        space = key[nbatch + 1:]
+        if len(space) == self.dim and all(isinstance(i, np.ndarray) for i in space):
+            # the values of a list of points are read directly
+            index = self.compact_index[space]
+            values = self.swaparray[key[:nbatch + 1] + (index,)]
+            return np.where(index < 0, 0, values)
+        return self._dense()[key]
+
+    def __setitem__(self, key, values):
+        dense = self._dense()
+        dense[self._key(key)] = values
+        self.swaparray[...] = dense[(Ellipsis,) + tuple(self.points.T)]
+
+    #pylint: disable=too-many-locals
+    def _set_exchanges(self):
+        """
+        Create the description of the messages exchanged with
+        each neighbor: the velocities sent and received (only the
+        velocities which point inside the receiver) and the positions
+        in the buffers of the stored points of the faces.
+        """
+        dim = self.dim
+        nspace, vmax = self.dense_size, self.vmax
+
+        cartcomm = self.mpi_topo.cartcomm
+        split, periods, coords = cartcomm.Get_topo()
+
+        for i in range(dim):
+            for side in [-1, 1]:
+                direction = list(coords)
+                direction[i] += side
+                self.neighbors[2*i + (side > 0)] = cartcomm.Get_cart_rank(direction)
+
+        directions = [tuple(int(c) for c in direction)
+                      for direction in get_directions(dim) if any(direction)]
+        tags = {direction: tag for tag, direction in enumerate(directions)}
+
+        def face(ranges, velocities):
+            if velocities is None:
+                velocities = np.arange(self.nv)
+            index = self.compact_index[np.ix_(*ranges)].ravel()
+            stored = np.nonzero(index >= 0)[0]
+            return velocities, stored, index[stored], index.size
+
+        for direction in directions:
+            neighbor = [coords[d] + direction[d] for d in range(dim)]
+            if not all(periods[d] or 0 <= neighbor[d] < split[d] for d in range(dim)):
+                continue
+            neighbor = cartcomm.Get_cart_rank([neighbor[d] % split[d] for d in range(dim)])
+
+            send, recv = [], []
+            for d in range(dim): #pylint: disable=invalid-name
+                if direction[d] == 0:
+                    send.append(np.arange(vmax[d], nspace[d] - vmax[d]))
+                    recv.append(send[-1])
+                elif direction[d] < 0:
+                    send.append(np.arange(vmax[d], 2*vmax[d]))
+                    recv.append(np.arange(0, vmax[d]))
+                else:
+                    send.append(np.arange(nspace[d] - 2*vmax[d], nspace[d] - vmax[d]))
+                    recv.append(np.arange(nspace[d] - vmax[d], nspace[d]))
+
+            opposite = tuple(-c for c in direction)
+            self._exchanges.append((neighbor, tags[direction], tags[opposite],
+                                    face(send, self._inward(opposite)),
+                                    face(recv, self._inward(direction))))
+
+    @monitor
+    def update(self, shifts=None): #pylint: disable=unused-argument
+        """
+        update ghost points on the interface with the datas of the neighbors.
+
+        Parameters
+        ----------
+
+        shifts : ndarray, optional
+            not used: the compact storage has the natural layout
+
+        """
+        self.finish_update(self.start_update())
+
+    @monitor
+    def start_update(self):
+        """
+        post the exchange of the ghost points with all the neighbors
+        without waiting for the messages.
+
+        Returns
+        -------
+
+        list
+            the MPI requests of the exchange
+
+        """
+        batch = self.swaparray.shape[:len(self._batch)]
+        requests = []
+        self._pending = []
+        for neighbor, send_tag, recv_tag, send, recv in self._exchanges:
+            velocities, stored, index, size = recv
+            if velocities.size != 0:
+                buf = np.empty(batch + (velocities.size, size), dtype=self.dtype)
+                requests.append(self.comm.Irecv(buf, source=neighbor, tag=recv_tag))
+                self._pending.append((buf, recv))
+        for neighbor, send_tag, recv_tag, send, recv in self._exchanges:
+            velocities, stored, index, size = send
+            if velocities.size != 0:
+                buf = np.zeros(batch + (velocities.size, size), dtype=self.dtype)
+                buf[..., stored] = self.swaparray[(Ellipsis,) + np.ix_(velocities, index)]
+                requests.append(self.comm.Isend(buf, dest=neighbor, tag=send_tag))
+        return requests
+
+    @monitor
+    def finish_update(self, requests):
+        """
+        wait for the exchange posted by start_update and
+        store the received values.
+
+        Parameters
+        ----------
+
+        requests : list
+            the MPI requests returned by start_update
+
+        """
+        mpi.Request.Waitall(requests)
+        for buf, (velocities, stored, index, _) in self._pending:
+            self.swaparray[(Ellipsis,) + np.ix_(velocities, index)] = buf[..., stored]
+        self._pending = []
+
 class SOA(Array):
     """
     This class defines a structure of arrays to store the
@@ -368,6 +1139,11 @@ class SOA(Array):
         the type of the array. Default is numpy.double
     gpu_support: bool
         True if GPU is needed
+    nbatch: int
+        the number of members of an ensemble. Default is None
+    velocities: ndarray
+        the velocities of the distribution functions which restrict
+        the exchanges at the interfaces. Default is None
 
     Attributes
     ----------
@@ -378,9 +1154,9 @@ class SOA(Array):
     size
 
     """
-    def __init__(self, nv, gspace_size, vmax, mpi_topo, dtype=np.double, gpu_support=False):
+    def __init__(self, nv, gspace_size, vmax, mpi_topo, dtype=np.double, gpu_support=False, nbatch=None, velocities=None):
         sorder = [i for i in range(len(gspace_size) + 1)]
-        Array.__init__(self, nv, gspace_size, vmax, sorder, mpi_topo, dtype, gpu_support=gpu_support)
+        Array.__init__(self, nv, gspace_size, vmax, sorder, mpi_topo, dtype, gpu_support=gpu_support, nbatch=nbatch, velocities=velocities)
 
     def reshape(self):
         """
@@ -407,6 +1183,11 @@ class AOS(Array):
         the type of the array. Default is numpy.double
     gpu_support: bool
         True if GPU is needed
+    nbatch: int
+        the number of members of an ensemble. Default is None
+    velocities: ndarray
+        the velocities of the distribution functions which restrict
+        the exchanges at the interfaces. Default is None
 
     Attributes
     ----------
@@ -417,9 +1198,9 @@ class AOS(Array):
     size
 
     """
-    def __init__(self, nv, gspace_size, vmax, mpi_topo, dtype=np.double, gpu_support=False):
+    def __init__(self, nv, gspace_size, vmax, mpi_topo, dtype=np.double, gpu_support=False, nbatch=None, velocities=None):
         sorder = [len(gspace_size)] + [i for i in range(len(gspace_size))]
-        Array.__init__(self, nv, gspace_size, vmax, sorder, mpi_topo, dtype, gpu_support=gpu_support)
+        Array.__init__(self, nv, gspace_size, vmax, sorder, mpi_topo, dtype, gpu_support=gpu_support, nbatch=nbatch, velocities=velocities)
 
     def reshape(self):
         """
@@ -19,6 +19,8 @@ nx, ny, nz, nv = sp.symbols("nx, ny, nz, nv", integer=True) #pylint: disable=inv
 ix, iy, iz, iv = sp.symbols("ix, iy, iz, iv", integer=True) #pylint: disable=invalid-name
 ix_, iy_, iz_, iv_ = sp.symbols("ix_, iy_, iz_, iv_", integer=True) #pylint: disable=invalid-name
 rel_ux, rel_uy, rel_uz = sp.symbols('rel_ux, rel_uy, rel_uz', real=True) #pylint: disable=invalid-name
+nb, ib_ = sp.symbols("nb, ib_", integer=True) #pylint: disable=invalid-name
+ixmin, ixmax, iymin, iymax, izmin, izmax = sp.symbols("ixmin, ixmax, iymin, iymax, izmin, izmax", integer=True) #pylint: disable=invalid-name
 
 class SymbolicVector(sp.Matrix):
     @classmethod
@@ -111,7 +113,7 @@ def set_order(array, priority=None):
 
 
 def indexed(name, shape, index=[iv, ix, iy, iz], velocities=None,
-            velocities_index=None, priority=None):
+            velocities_index=None, priority=None, batch=None, block=None):
     """
     Return a SymPy matrix or an expression of indexed
     objects.
@@ -141,6 +143,18 @@ def indexed(name, shape, index=[iv, ix, iy, iz], velocities=None,
         define how to reorder the indeices (lower to greater)
         (default is None)
 
+    batch : sympy.Idx
+        index of the ensemble members. If it is defined, a leading
+        axis of size nb is added to the shape and batch is always
+        the first index (default is None)
+
+    block : int
+        size of the blocks of an AoSoA storage. If it is defined,
+        the last space axis (given by priority) is split in blocks
+        and the first index (the velocity) is stored between the
+        number of the block and the position inside the block
+        (default is None)
+
     Return
     ------
 
@@ -180,14 +194,47 @@ def indexed(name, shape, index=[iv, ix, iy, iz], velocities=None,
     [    m[1, j + 1, k]],
     [m[2, j - 1, k - 1]]])
 
+    >>> b = sp.Idx('b', (0, 4))
+    >>> m = indexed("m", [10, 100, 200], [i, j, k], velocities_index=range(2), batch=b)
+    >>> m
+    Matrix([
+    [m[b, 0, j, k]],
+    [m[b, 1, j, k]]])
+    >>> m[0].base.shape
+    (nb, 10, 100, 200)
+
+    >>> m = indexed("m", [10, 100, 200], [i, j, k], velocities_index=range(2), block=8)
+    >>> m
+    Matrix([
+    [m[j, BlockNumber(k, 8), 0, BlockLane(k, 8)]],
+    [m[j, BlockNumber(k, 8), 1, BlockLane(k, 8)]]])
+
     """
     if velocities_index and velocities:
         raise ValueError("velocities and velocities_index can't be defined together.")
 
-    output = sp.IndexedBase(name, set_order(shape, priority))
+    if batch is None:
+        prefix = []
+    else:
+        prefix = [batch]
+
+    if block is None:
+        storage = lambda x: prefix + set_order(x, priority)
+        shape = set_order(shape, priority)
+    else:
+        from .generator import BlockNumber, BlockLane
+        space_priority = priority[1:] if priority else None
+        def storage(x):
+            space = set_order(list(x[1:]), space_priority)
+            return prefix + space[:-1] + [BlockNumber(space[-1], block), x[0], BlockLane(space[-1], block)]
+        # the size of the blocked axis is given as the number of points
+        space = set_order(list(shape[1:len(index)]), space_priority)
+        shape = space + [shape[0], block]
+
+    output = sp.IndexedBase(name, [nb]*len(prefix) + shape)
 
     if velocities_index:
-        ind = [set_order([k] + list(index[1:]), priority) for k in velocities_index]
+        ind = [storage([k] + list(index[1:])) for k in velocities_index]
         return SymbolicVector([output[i] for i in ind])
     elif velocities is not None:
         ind = []
@@ -196,10 +243,29 @@ def indexed(name, shape, index=[iv, ix, iy, iz], velocities=None,
             tmp_ind = []
             for ik, k in enumerate(v): #pylint: disable=invalid-name
                 tmp_ind.append(indices[ik] + int(k))
-            ind.append(set_order([iv] + tmp_ind, priority))
+            ind.append(storage([iv] + tmp_ind))
         return SymbolicVector([output[i] for i in ind])
     else:
-        return output[set_order(index, priority)]
+        return output[storage(index)]
+
+
+def batch_idx():
+    """
+    Return the SymPy Idx which runs over the members of an ensemble.
+
+        ib_ -> [0, nb[
+
+    Examples
+    --------
+
+    >>> b = batch_idx()
+    >>> b
+    ib_
+    >>> b.lower, b.upper
+    (0, nb)
+
+    """
+    return sp.Idx(ib_, (0, nb))
 
 
 def space_idx(ranges, priority=None):
@@ -249,6 +315,61 @@ def space_idx(ranges, priority=None):
     else:
         return idx
 
+def tile_idx(space_index, sizes):
+    """
+    Split the loops over the space indices in tiles.
+
+    Each index with a tile size is replaced by a loop over the first
+    points of the tiles (a range with a step) and by a loop inside the
+    tile. The loops over the tiles are the outermost ones.
+
+    Parameters
+    ----------
+
+    space_index : list
+        list of SymPy Idx corresponding to space variables
+
+    sizes : list
+        the size of the tiles in each direction (x, y, z);
+        None or 0 if the direction is not split
+
+    Return
+    ------
+
+    list
+        the loop indices: the ranges over the tiles followed by the
+        indices inside the tiles
+    dict
+        the substitution of the space indices by the indices inside
+        the tiles (to apply on the body of the loop)
+
+    Examples
+    --------
+
+    >>> loop = space_idx([(1, nx - 1), (1, ny - 1)])
+    >>> target, subs = tile_idx(loop, [16])
+    >>> target
+    [IdxRange(ixt_, 1, nx - 1, 16), ix_, iy_]
+    >>> subs[loop[0]].lower, subs[loop[0]].upper
+    (ixt_, Min(nx - 1, ixt_ + 16))
+
+    """
+    from .generator.ast import IdxRange
+
+    indices = [ix_, iy_, iz_]
+    tiles, inner, subs = [], [], {}
+    for i in space_index:
+        dim = indices.index(i.label)
+        size = sizes[dim] if dim < len(sizes) else None
+        if size:
+            first = sp.Idx('%st_'%str(i.label)[:-1])
+            tiles.append(IdxRange(first, i.lower, i.upper, int(size)))
+            subs[i] = sp.Idx(i.label, (first, sp.Min(first + int(size), i.upper)))
+            inner.append(subs[i])
+        else:
+            inner.append(i)
+    return tiles + inner, subs
+
 def alltogether(M, nsimplify=False):
     """
     Simplify all the elements of sympy matrix M
@@ -310,14 +431,106 @@ if PY3:
 else:
     getargspec = getargspec_permissive #pylint: disable=invalid-name
 
-def call_genfunction(function, args):
-    from .monitoring import monitor
-    from .context import queue
-    try:
-        func_args = function.arg_dict.keys()
-        d = {k:args[k] for k in func_args} #pylint: disable=invalid-name
-        d['queue'] = queue
-    except: #pylint: disable=bare-except
-        func_args = getargspec(function).args
-        d = {k:args[k] for k in func_args} #pylint: disable=invalid-name
-    monitor(function)(**d)
+class BoundKernel:
+    """
+    Generated function with its arguments resolved once.
+
+    The order of the arguments is found when the kernel is created and
+    the values are kept as direct references to the arrays. A call is then
+    only the call of the generated function.
+
+    Parameters
+    ----------
+
+    function : function
+        the generated function
+    args : dict
+        the values of the arguments (must contain at least
+        all the arguments of function)
+    nodes : tuple, optional
+        the names of the arguments and the function which give the number
+        of lattice nodes visited by a call (see Routine.nodes); it is
+        recorded at each call when the monitoring is enabled
+    num_threads : int, optional
+        the number of threads of numba during the call (the setting of
+        numba is global to the process, it is set before the call and
+        restored after)
+
+    Attributes
+    ----------
+
+    names : list
+        the names of the arguments of the generated function
+    values : list
+        the values of the arguments in the same order
+
+    """
+    def __init__(self, function, args, nodes=None, num_threads=None):
+        from .monitoring import monitor
+        from .options import options
+        from .context import queue
+        try:
+            self.names = list(function.arg_dict.keys())
+            self.queue = queue
+        except AttributeError:
+            # the numba dispatchers keep the python function in py_func
+            self.names = getargspec(getattr(function, 'py_func', function)).args
+            self.queue = None
+        self.values = [args[k] for k in self.names]
+        self._position = {k: i for i, k in enumerate(self.names)}
+        self.function = monitor(function) if options().monitoring else function
+        # only the numba dispatchers use the threads of numba
+        self._num_threads = num_threads if hasattr(function, 'py_func') else None
+        self._nodes = None
+        if options().monitoring and nodes is not None:
+            names, count = nodes
+            if all(name in self._position for name in names):
+                self._nodes = (function, [self._position[name] for name in names], count)
+
+    def set(self, name, value):
+        """
+        set the value of the argument name if the function uses it.
+        """
+        i = self._position.get(name, None)
+        if i is not None:
+            self.values[i] = value
+
+    def swap(self, first, second):
+        """
+        exchange the references to the arrays first and second.
+        """
+        for i, value in enumerate(self.values):
+            if value is first:
+                self.values[i] = second
+            elif value is second:
+                self.values[i] = first
+
+    def __call__(self, **kwargs):
+        values = self.values
+        if kwargs:
+            values = [kwargs.get(k, v) for k, v in zip(self.names, values)]
+        if self._nodes is not None:
+            # the lattice nodes visited by this call (roofline of the monitoring)
+            from .monitoring import Monitor
+            function, position, count = self._nodes
+            Monitor.register(function)
+            Monitor.add_nodes(function, count(*[values[i] for i in position]))
+        if self._num_threads is not None:
+            import numba
+            num_threads = numba.get_num_threads()
+            numba.set_num_threads(self._num_threads)
+            try:
+                return self.function(*values)
+            finally:
+                numba.set_num_threads(num_threads)
+        if self.queue is None:
+            return self.function(*values)
+        args = dict(zip(self.names, values))
+        args['queue'] = self.queue
+        return self.function(**args)
+
+def call_genfunction(function, args, num_threads=None):
+    """
+    call the generated function with the arguments found in args.
+    """
+    BoundKernel(function, args, num_threads=num_threads)()
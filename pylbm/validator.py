@@ -235,6 +235,11 @@ def validate(dico, name):
                            }
                }
 
+    probe = {'expr': {'type': 'expr', 'required': True},
+             'point': {'type': 'list', 'schema': {'type': 'number'}},
+             'label': {'type': 'integer'}
+            }
+
     simulation = {'dim': {'type': 'integer',
                           'allowed': [1, 2, 3],
                           'excludes': 'box',
@@ -268,6 +273,9 @@ def validate(dico, name):
                   'elements': {'type': 'list',
                                'schema': {'type': 'element'}
                               },
+                  'decomposition': {'type': 'string',
+                                    'allowed': ['uniform', 'fluid']
+                                   },
                   'space_step': {'type': 'number',
                                  'min': 0,
                                  'required': name in ['Domain', 'Simulation']
@@ -304,7 +312,7 @@ def validate(dico, name):
                                         'schema': {'anyof_type': ['number', 'expr']}
                                        },
                   'generator': {'type': 'string',
-                                'allowed':['numpy', 'cython', 'loopy']
+                                'allowed':['numpy', 'cython', 'numba', 'loopy']
                                },
                   'codegen_dir':{'type': 'string'},
                   'lbm_algorithm': {'type': 'dict',
@@ -312,7 +320,17 @@ def validate(dico, name):
                                                'settings': {'type': 'dict'}
                                               }
                                    },
-                  'show_code': {'type': 'boolean'}
+                  'show_code': {'type': 'boolean'},
+                  'ensemble': {'type': 'integer', 'min': 1},
+                  'aosoa': {'type': 'integer', 'min': 1},
+                  'num_threads': {'type': 'integer', 'min': 1},
+                  'autotune': {'type': 'boolean'},
+                  'probes': {'type': 'dict',
+                             'keyschema': {'type': 'string'},
+                             'valueschema': {'anyof': [{'type': 'expr'},
+                                                       {'type': 'dict',
+                                                        'schema': probe}]}
+                            }
                  }
 
     v = MyValidator(simulation)
@@ -66,6 +66,7 @@ setup(
                         "jinja2",
                       ],
     extras_require={
-        'gpu': ['pyopencl', 'loo.py==2017.2']
+        'gpu': ['pyopencl', 'loo.py==2017.2'],
+        'numba': ['numba'],
     }
 )
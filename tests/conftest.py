@@ -8,6 +8,7 @@ import tempfile
 import pylbm
 import mpi4py.MPI as mpi
 import numpy as np
+import sympy as sp
 import warnings
 
 def setup_function(function):
@@ -78,6 +79,77 @@ def schemes(request):
     request.scheme = request.param[1]
     return request
 
+X, Y = sp.symbols('X, Y')
+RHO, QX, QY = sp.symbols('rho, qx, qy')
+LA = sp.symbols('lambda', constants=True)
+
+def bc_up(f, m, x, y, driven_velocity):
+    m[RHO] = 1.
+    m[QX] = driven_velocity
+    m[QY] = 0.
+
+def lid_driven_cavity(generator='numpy', **kwargs):
+    """
+    dictionary of a lid driven cavity with a D2Q9 scheme on 16x16 points,
+    the other keys of the dictionary are given by kwargs
+    """
+    dico = {
+        'parameters': {LA: 1.},
+        'box': {'x': [0., 1.], 'y': [0., 1.], 'label': [0, 0, 0, 1]},
+        'space_step': 1./16,
+        'scheme_velocity': LA,
+        'schemes': [
+            {
+                'velocities': list(range(9)),
+                'polynomials': [1, X, Y,
+                                3*(X**2+Y**2)-4*LA**2,
+                                0.5*(9*(X**2+Y**2)**2-21*(X**2+Y**2)*LA**2+8*LA**4),
+                                3*X*(X**2+Y**2)-5*X*LA**2, 3*Y*(X**2+Y**2)-5*Y*LA**2,
+                                X**2-Y**2, X*Y],
+                'relaxation_parameters': [0., 0., 0., 1.5, 1.5, 1.5, 1.5, 1.8, 1.8],
+                'equilibrium': [RHO, QX, QY,
+                                -2*RHO*LA**2 + 3*(QX**2+QY**2),
+                                RHO*LA**2 - 3*(QX**2+QY**2),
+                                -QX*LA**2, -QY*LA**2,
+                                QX**2 - QY**2, QX*QY],
+                'conserved_moments': [RHO, QX, QY],
+            },
+        ],
+        'init': {RHO: 1., QX: 0., QY: 0.},
+        'boundary_conditions': {
+            0: {'method': {0: pylbm.bc.BouzidiBounceBack}},
+            1: {'method': {0: pylbm.bc.BouzidiBounceBack},
+                'value': (bc_up, (0.05,))},
+        },
+        'generator': generator,
+    }
+    dico.update(kwargs)
+    return dico
+
+@pytest.fixture(scope='session')
+def cavity():
+    return lid_driven_cavity
+
+@pytest.fixture(scope='session')
+def reference():
+    sol = pylbm.Simulation(lid_driven_cavity())
+    for _ in range(20):
+        sol.one_time_step()
+    return sol
+
+@pytest.fixture(scope='session')
+def assert_as_reference(reference):
+    def check(sol, nsteps=20, **kwargs):
+        """
+        run the simulation up to the time of the reference
+        and compare the conserved moments.
+        """
+        sol.run(nsteps - sol.nt)
+        assert sol.nt == reference.nt
+        for moment in [RHO, QX, QY]:
+            assert np.allclose(sol.m[moment], reference.m[moment], **kwargs)
+    return check
+
 def pytest_addoption(parser):
     group = parser.getgroup("h5 file comparison")
     group.addoption('--h5diff', action='store_true',
@@ -0,0 +1,148 @@
+"""
+test the lattice Boltzmann algorithms
+"""
+
+import numpy as np
+import sympy as sp
+import pytest
+import pylbm
+
+X, Y = sp.symbols('X, Y')
+RHO, QX, QY = sp.symbols('rho, qx, qy')
+LA = sp.symbols('lambda', constants=True)
+
+
+def test_bound_kernels(cavity, assert_as_reference, monkeypatch):
+    def get_args(*args, **kwargs):
+        raise AssertionError('the arguments must be resolved once')
+
+    sol = pylbm.Simulation(cavity())
+    sol.run(1)
+    kernel = sol.algo.kernels['one_time_step']
+    monkeypatch.setattr(sol.algo, '_get_args', get_args)
+    assert_as_reference(sol)
+    assert sol.algo.kernels['one_time_step'] is kernel
+    # the references follow the swaps of F and Fnew
+    values = dict(zip(kernel.names, kernel.values))
+    assert values['f'] is sol.container.F.array
+    assert values['fnew'] is sol.container.Fnew.array
+
+
+def advection(generator='numpy', source=False, **settings):
+    """
+    a D2Q4 scheme with an equilibrium affine in the moments
+    """
+    scheme = {
+        'velocities': list(range(1, 5)),
+        'polynomials': [1, X, Y, X**2 - Y**2],
+        'relaxation_parameters': [0., 1.5, 1.5, 1.2],
+        'equilibrium': [RHO, 0.1*RHO, 0.2*RHO, 0.],
+        'conserved_moments': RHO,
+    }
+    if source:
+        scheme['source_terms'] = {RHO: -0.1*RHO}
+    return {
+        'parameters': {LA: 1.},
+        'box': {'x': [0., 1.], 'y': [0., 1.], 'label': -1},
+        'space_step': 1./16,
+        'scheme_velocity': LA,
+        'schemes': [scheme],
+        'init': {RHO: (lambda x, y: 1. + (x < 0.5)*(y < 0.5), ())},
+        'generator': generator,
+        'lbm_algorithm': {'name': settings.pop('name', pylbm.algorithm.PullAlgorithm),
+                          'settings': settings},
+    }
+
+
+def stokes(generator='numpy', **settings):
+    """
+    a D2Q9 scheme with an equilibrium affine in the moments
+    (linearized Navier-Stokes)
+    """
+    return {
+        'parameters': {LA: 1.},
+        'box': {'x': [0., 1.], 'y': [0., 1.], 'label': -1},
+        'space_step': 1./16,
+        'scheme_velocity': LA,
+        'schemes': [
+            {
+                'velocities': list(range(9)),
+                'polynomials': [1, X, Y, 3*(X**2 + Y**2) - 4,
+                                (9*(X**2 + Y**2)**2 - 21*(X**2 + Y**2) + 8)/2,
+                                3*X*(X**2 + Y**2) - 5*X, 3*Y*(X**2 + Y**2) - 5*Y,
+                                X**2 - Y**2, X*Y],
+                'relaxation_parameters': [0., 0., 0., 1.1, 1.1, 1.2, 1.2, 1.5, 1.5],
+                'equilibrium': [RHO, QX, QY, -2*RHO, RHO, -QX, -QY, 0., 0.],
+                'conserved_moments': [RHO, QX, QY],
+            },
+        ],
+        'init': {RHO: (lambda x, y: 1. + 0.1*(x < 0.5)*(y < 0.5), ()),
+                 QX: 0.01, QY: 0.},
+        'generator': generator,
+        'lbm_algorithm': {'name': settings.pop('name', pylbm.algorithm.PullAlgorithm),
+                          'settings': settings},
+    }
+
+
+@pytest.mark.parametrize('algorithm', ['PullAlgorithm', 'SparsePullAlgorithm'])
+@pytest.mark.parametrize('case', [advection, stokes])
+def test_collision_matrix(case, algorithm):
+    name = getattr(pylbm.algorithm, algorithm)
+    # the collision matrix is opt-in
+    assert not pylbm.Simulation(case('cython', name=name)).algo._use_collision_matrix()
+
+    sol = pylbm.Simulation(case('cython', name=name, collision_matrix=True))
+    assert sol.algo._use_collision_matrix()
+    # fnew is computed from f without copy
+    routine = sol.generator.routines['one_time_step']
+    assert 'm' not in [str(arg.name) for arg in routine.arguments]
+    assert not [node for statement in routine.statements
+                for node in sp.preorder_traversal(statement)
+                if isinstance(node, sp.MatrixSymbol) and node.name == 'm']
+    sol.run(20)
+
+    reference = pylbm.Simulation(case('cython', name=name))
+    reference.run(20)
+    for moment in sol.scheme.consm:
+        assert np.allclose(sol.m[moment], reference.m[moment])
+
+
+@pytest.mark.parametrize('algorithm', ['AAPatternAlgorithm', 'EsotericTwistAlgorithm'])
+def test_collision_matrix_in_place(algorithm):
+    name = getattr(pylbm.algorithm, algorithm)
+    # the distribution functions of a point are copied in the local moments
+    sol = pylbm.Simulation(advection('cython', name=name, collision_matrix=True))
+    assert sol.algo._use_collision_matrix()
+    sol.run(20)
+    reference = pylbm.Simulation(advection('cython', name=name))
+    reference.run(20)
+    assert np.allclose(sol.m[RHO], reference.m[RHO])
+
+    # but not in the moments of the simulation
+    sol = pylbm.Simulation(advection('cython', name=name, collision_matrix='auto', m_local=False))
+    assert not sol.algo._use_collision_matrix()
+    with pytest.raises(SystemExit):
+        pylbm.Simulation(advection('cython', name=name, collision_matrix=True, m_local=False))
+
+
+def test_collision_matrix_numpy():
+    # f and fnew share their memory and the moments are not local
+    sol = pylbm.Simulation(advection(collision_matrix='auto'))
+    assert sol.algo.collision_matrix() is not None
+    assert not sol.algo._use_collision_matrix()
+    with pytest.raises(SystemExit):
+        pylbm.Simulation(advection(collision_matrix=True))
+
+
+def test_collision_matrix_source_term():
+    sol = pylbm.Simulation(advection('cython', source=True, collision_matrix='auto'))
+    assert sol.algo.collision_matrix() is None
+    assert not sol.algo._use_collision_matrix()
+    with pytest.raises(SystemExit):
+        pylbm.Simulation(advection('cython', source=True, collision_matrix=True))
+
+
+def test_collision_matrix_auto():
+    # fewer operations than the moments for the D2Q4 scheme
+    sol = pylbm.Simulation(advection('cython', collision_matrix='auto'))
+    assert sol.algo._use_collision_matrix()
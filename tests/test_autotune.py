@@ -0,0 +1,56 @@
+"""
+test the autotuning of the storage order and of the algorithm settings
+"""
+
+import json
+import pytest
+import pylbm
+from pylbm.monitoring import Monitor
+
+CANDIDATES = [{'sorder': [0, 1, 2], 'settings': {'matrix_product': False}},
+              {'sorder': [2, 0, 1], 'settings': {'matrix_product': True}},
+              {'sorder': [0, 1, 2], 'settings': {'matrix_product': True}}]
+
+
+@pytest.fixture
+def cache(tmpdir, monkeypatch):
+    filename = str(tmpdir.join('autotune.json'))
+    monkeypatch.setenv('PYLBM_AUTOTUNE_CACHE', filename)
+    return filename
+
+
+def test_autotune(cavity, cache, monkeypatch):
+    times = iter([0.3, 0.1, 0.2])
+    monkeypatch.setattr(Monitor, 'last_time', lambda f: next(times))
+    best = pylbm.autotune(cavity(), candidates=CANDIDATES, steps=2)
+    # the fastest candidate is kept and saved with its timing
+    assert best == dict(CANDIDATES[1], time=0.1)
+    with open(cache) as cache_file:
+        saved = json.load(cache_file)
+    assert list(saved.values()) == [best]
+
+
+def test_autotune_cache(cavity, cache, monkeypatch):
+    times = iter([0.3, 0.1, 0.2])
+    monkeypatch.setattr(Monitor, 'last_time', lambda f: next(times))
+    pylbm.autotune(cavity(), candidates=CANDIDATES, steps=2)
+
+    def timing(f):
+        raise AssertionError('the tuned configuration must be read from the cache')
+
+    monkeypatch.setattr(Monitor, 'last_time', timing)
+    sol = pylbm.Simulation(cavity(autotune=True))
+    # the saved storage order and settings are applied
+    assert list(sol.container.sorder) == [2, 0, 1]
+    assert sol.algo.settings['matrix_product']
+    arguments = sol.generator.routines['one_time_step'].arguments
+    assert 'f2m_matrix' in [str(arg.name) for arg in arguments]
+    # the settings of the dictionary override the tuned ones
+    lbm_algorithm = {'name': pylbm.algorithm.PullAlgorithm, 'settings': {'matrix_product': False}}
+    sol = pylbm.Simulation(cavity(autotune=True, lbm_algorithm=lbm_algorithm))
+    assert not sol.algo.settings['matrix_product']
+
+
+def test_autotune_without_cache(cavity, cache):
+    sol = pylbm.Simulation(cavity(autotune=True))
+    assert list(sol.container.sorder) == [0, 1, 2]
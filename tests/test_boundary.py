@@ -0,0 +1,48 @@
+"""
+test the boundary conditions
+"""
+
+import importlib
+import os
+import sys
+import numpy as np
+import pytest
+import pylbm
+
+path = os.path.abspath(os.path.dirname(__file__) + '/../demo/2D')
+
+
+@pytest.fixture
+def air_conditioning():
+    sys.path.append(path)
+    yield importlib.import_module('air_conditioning')
+    sys.path.pop()
+
+
+def test_threaded_boundary_conditions(air_conditioning, monkeypatch):
+    """
+    the Bouzidi and Neumann conditions of air_conditioning give
+    the same result with and without OpenMP threads, and the same
+    result as numpy
+    """
+    dx, Tf = 1./32, 0.25
+    serial = air_conditioning.run(dx, Tf, generator='cython', with_plot=False)
+    monkeypatch.setattr(sys, 'argv', ['pylbm', '--num-threads', '4'])
+    threaded = air_conditioning.run(dx, Tf, generator='cython', with_plot=False)
+    assert threaded.generator.num_threads == 4
+
+    # the conditions which load values stored by another condition
+    # read a copy of f or stay serial
+    routines = threaded.generator.routines
+    bouzidi = routines['Bouzidi_anti_bounce_back']
+    assert bouzidi.settings.get('parallel', False)
+    assert 'fcopy' in [str(arg.name) for arg in bouzidi.arguments]
+    assert 'f' in [str(arg.name) for arg in bouzidi.arguments]
+    assert not routines['neumannx'].settings.get('parallel', False)
+
+    assert threaded.nt == serial.nt
+    assert np.array_equal(threaded.container.F.array, serial.container.F.array)
+    # numpy loads all the values before storing them
+    reference = air_conditioning.run(dx, Tf, generator='numpy', with_plot=False)
+    for moment in reference.scheme.consm:
+        assert np.allclose(threaded.m[moment], reference.m[moment])
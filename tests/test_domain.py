@@ -118,3 +118,23 @@ def test_domain_visualize(case):  # pylint: disable=redefined-outer-name
         view_bound=True
     )
     return views.fig
+
+
+def test_fluid_decomposition():
+    """
+    test the fluid weights used to balance the decomposition
+    """
+    dom = pylbm.Domain({
+        'box': {'x': [0, 2], 'y': [0, 1], 'label': 0},
+        'elements': [
+            pylbm.Parallelogram((0., 0.), (1., 0.), (0., 1.), label=1)
+        ],
+        'space_step': 0.1,
+        'schemes': [{'velocities': list(range(9))}],
+        'decomposition': 'fluid',
+    })
+    weights = dom.get_fluid_weights()
+    assert list(weights[0]) == [0]*10 + [10]*10
+    assert list(weights[1]) == [10]*10
+    indices = pylbm.mpi_topology.get_balanced_indices(weights[0], 4)
+    assert indices == [0, 13, 15, 18, 20]
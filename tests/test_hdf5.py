@@ -0,0 +1,69 @@
+"""
+test the hdf5 output
+"""
+
+import threading
+import numpy as np
+import sympy as sp
+import pytest
+import h5py
+import pylbm
+
+RHO, QX, QY = sp.symbols('rho, qx, qy')
+
+
+def test_output_queue(cavity, tmpdir):
+    sol = pylbm.Simulation(cavity())
+    output = pylbm.H5OutputQueue(sol, 'cavity', {'rho': RHO, 'qx': QX}, str(tmpdir))
+    writer, write = output._writer, output._write
+    threads = []
+
+    def threaded_write(slot, timestep):
+        threads.append(threading.current_thread())
+        write(slot, timestep)
+
+    output._write = threaded_write
+    expected = {}
+    for _ in range(3):
+        sol.run(5)
+        expected[sol.nt] = sol.m[QX].copy()
+        output.write(sol.nt)
+    output.flush()
+    output.close()
+    # the files are written by the background thread
+    assert threads == [writer]*3
+    for nt, qx in expected.items():
+        with h5py.File(str(tmpdir.join('cavity_{}.h5'.format(nt))), 'r') as h5:
+            assert np.allclose(h5['qx'][...].T, qx)
+
+
+def test_output_queue_error(cavity, tmpdir, monkeypatch):
+    def save(self):
+        raise OSError('disk full')
+
+    sol = pylbm.Simulation(cavity())
+    monkeypatch.setattr(pylbm.hdf5.H5File, 'save', save)
+    output = pylbm.H5OutputQueue(sol, 'cavity', {'qx': QX}, str(tmpdir), nbuffers=1)
+    # the error of the writer is raised by flush, write and close
+    output.write(1)
+    with pytest.raises(OSError):
+        output.flush()
+    output.write(2)
+    with pytest.raises(OSError):
+        output.write(3)
+    output.write(4)
+    with pytest.raises(OSError):
+        output.close()
+    assert not output._writer
+
+
+def test_output_queue_ensemble(cavity, tmpdir):
+    sol = pylbm.Simulation(cavity(ensemble=2))
+    sol.run(5)
+    output = pylbm.H5OutputQueue(sol, 'cavity', {'qx': QX}, str(tmpdir))
+    output.write(sol.nt)
+    output.close()
+    with h5py.File(str(tmpdir.join('cavity_5.h5')), 'r') as h5:
+        assert sorted(key for key in h5 if key.startswith('qx')) == ['qx_0', 'qx_1']
+        for i in range(2):
+            assert np.allclose(h5['qx_{}'.format(i)][...].T, sol.m[QX][i])
@@ -0,0 +1,457 @@
+import sys
+import numpy as np
+import sympy as sp
+import pytest
+import pylbm
+
+X, Y = sp.symbols('X, Y')
+RHO, QX, QY = sp.symbols('rho, qx, qy')
+LA = sp.symbols('lambda', constants=True)
+
+
+def test_run_same_as_one_time_step(cavity, assert_as_reference, reference, monkeypatch):
+    sol = pylbm.Simulation(cavity())
+    calls = []
+    for method in sol.bc.methods:
+        monkeypatch.setattr(method, 'set_rhs', lambda: calls.append(1))
+    assert_as_reference(sol)
+    # no boundary value depends on the time
+    assert not calls
+    assert sol.t == pytest.approx(reference.t)
+
+
+def test_run_callback(cavity):
+    sol = pylbm.Simulation(cavity())
+    steps = []
+    sol.run(10, callback=lambda s: steps.append(s.nt), callback_every=3)
+    assert steps == [3, 6, 9]
+    assert sol.nt == 10
+
+
+@pytest.mark.parametrize('generator', ['numpy', 'cython'])
+def test_run_generated_loop(cavity, assert_as_reference, tmpdir, monkeypatch, generator):
+    sol = pylbm.Simulation(cavity(generator, codegen_dir=str(tmpdir)))
+    extension = {'numpy': 'py', 'cython': 'pyx'}[generator]
+    code = ''.join(source.read() for source in tmpdir.listdir('*.' + extension))
+    assert 'def run_steps(nsteps, exchange, t, dt' in code.replace('int ', '').replace('double ', '')
+    if generator == 'cython':
+        # the kernels are called as C functions
+        assert 'cdef void _one_time_step(' in code
+        assert '_one_time_step(f, fnew' in code
+    kernel = sol.algo.bind(sol, 'one_time_step')
+
+    def one_time_step(*args, **kwargs):
+        raise AssertionError('the time steps must be made by the generated loop')
+
+    monkeypatch.setattr(sol, '_one_time_step', one_time_step)
+    steps = []
+    sol.run(7, callback=lambda s: steps.append(s.nt), callback_every=3)
+    assert steps == [3, 6]
+    assert sol.nt == 7
+    # F and Fnew are swapped an odd number of times
+    assert sol.algo.kernels['one_time_step'] is kernel
+    values = dict(zip(kernel.names, kernel.values))
+    assert values['f'] is sol.container.F.array
+    assert_as_reference(sol)
+
+
+def test_run_time_dependent_values(cavity, assert_as_reference, monkeypatch):
+    def bc_up_time(f, m, t, x, y, driven_velocity):
+        m[RHO] = 1.
+        m[QX] = driven_velocity
+        m[QY] = 0.
+
+    dico = cavity('cython')
+    dico['boundary_conditions'][1]['value'] = (bc_up_time, (0.05,))
+    dico['boundary_conditions'][1]['time_bc'] = True
+    sol = pylbm.Simulation(dico)
+    # the values on the border are computed by python at each time step
+    steps = []
+    one_time_step = sol._one_time_step
+
+    def counted_time_step(*args, **kwargs):
+        steps.append(1)
+        one_time_step(*args, **kwargs)
+
+    monkeypatch.setattr(sol, '_one_time_step', counted_time_step)
+    assert_as_reference(sol)
+    assert len(steps) == 20
+
+
+def test_lazy_moment(cavity, reference):
+    sol = pylbm.Simulation(cavity())
+    sol.run(20)
+    rho = sol.m[RHO].copy()
+    # the conserved moments are computed by the generated kernel
+    assert 'f2m_consm' in sol.generator.routines
+    assert np.count_nonzero(sol._m_valid) == 3
+    assert np.allclose(rho, reference.m[RHO])
+    sol.f2m()
+    assert np.allclose(rho, sol.container.m._in(RHO))
+
+
+def test_lazy_moment_not_conserved(cavity):
+    sol = pylbm.Simulation(cavity())
+    sol.run(20)
+    values = [sol.m[k].copy() for k in range(3, 9)]
+    assert np.count_nonzero(sol._m_valid) == 6
+    f2m = sol.algo.restricted_f2m(range(3, 9))
+    assert sol.algo.restricted_f2m(range(3, 9)) is f2m
+    sol.f2m()
+    for k, value in zip(range(3, 9), values):
+        assert np.allclose(value, sol.container.m._in(k))
+
+
+@pytest.mark.parametrize('compute_dtype', [None, 'float64'])
+def test_single_precision(cavity, assert_as_reference, compute_dtype):
+    sol = pylbm.Simulation(cavity('cython'), dtype='float32', compute_dtype=compute_dtype)
+    assert sol.generator.compute_dtype == np.dtype(compute_dtype or 'float32')
+    assert sol.container.F.array.dtype == np.float32
+    assert_as_reference(sol, atol=1e-6)
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_checkpoint_restart(cavity, assert_as_reference, tmpdir, compression):
+    sol = pylbm.Simulation(cavity())
+    sol.run(10)
+    sol.checkpoint(str(tmpdir), compression=compression)
+
+    restart = pylbm.Simulation(cavity(), restart=str(tmpdir))
+    assert restart.nt == 10
+    assert restart.t == sol.t
+    assert_as_reference(restart)
+
+
+@pytest.mark.parametrize('attribute', [('global_size', [32, 32]), ('decomposition', 'fluid')])
+def test_checkpoint_not_compatible(cavity, tmpdir, attribute):
+    import h5py
+    sol = pylbm.Simulation(cavity())
+    sol.run(2)
+    sol.checkpoint(str(tmpdir))
+    with h5py.File(sol._checkpoint_filename(str(tmpdir)), 'a') as h5file:
+        h5file.attrs[attribute[0]] = attribute[1]
+    with pytest.raises(SystemExit):
+        pylbm.Simulation(cavity(), restart=str(tmpdir))
+
+
+@pytest.mark.parametrize('generator', ['numpy', 'cython'])
+def test_probes(cavity, generator):
+    probes = {'mass': RHO,
+              'energy': (QX**2 + QY**2)/(2*RHO),
+              'center': {'expr': QX, 'point': [0.53, 0.53]},
+              'lid': {'expr': QX, 'label': 1}}
+    sol = pylbm.Simulation(cavity(generator, probes=probes))
+    assert sol.probes.in_kernel == (generator == 'cython')
+    sol.run(20, probe_every=10)
+    assert [h[0] for h in sol.probes.history] == [10, 20]
+    if sol.probes.in_kernel:
+        # the sums over the domain are computed by the time step
+        assert sol.probes.reduction[0] == pytest.approx(sol.probes.values['mass'])
+    rho, qx, qy = sol.m[RHO], sol.m[QX], sol.m[QY]
+    values = sol.probes.values
+    assert values['mass'] == pytest.approx(np.sum(rho))
+    assert values['energy'] == pytest.approx(np.sum((qx**2 + qy**2)/(2*rho)))
+    assert values['center'] == pytest.approx(qx[8, 8])
+    assert values['lid'] == pytest.approx(np.sum(qx[:, -1]))
+
+
+def test_single_precision_probes(cavity):
+    sol = pylbm.Simulation(cavity('cython', probes={'mass': RHO}), dtype='float32')
+    # the sums are accumulated in double precision by the time step
+    assert sol.probes.reduction.dtype == np.float64
+    routine = sol.generator.routines['one_time_step_reduce']
+    datatypes = {str(arg.name): arg.datatype for arg in routine.arguments}
+    assert datatypes['reduction'] == 'double'
+    assert datatypes['f'] != 'double'
+    sol.run(20, probe_every=10)
+    assert sol.probes.values['mass'] == pytest.approx(np.sum(sol.m[RHO], dtype=np.float64))
+
+
+@pytest.mark.parametrize('generator', ['numpy', 'cython'])
+def test_run_until_steady(cavity, generator):
+    sol = pylbm.Simulation(cavity(generator))
+    residual = sol.run_until_steady(1e-4, check_every=50, moments=[QX, QY])
+    assert residual < 1e-4
+    assert sol.nt % 50 == 0
+    # the residual is built once and keeps the moments of the last check
+    check = sol._residuals[(QX, QY)]
+    assert check.in_kernel == (generator == 'cython')
+    assert check.residual.dtype == np.float64
+    qx = sol.m[QX].copy()
+    mprev = check.mprev._in(check.rows[0]) if check.in_kernel else check.mprev[0]
+    assert np.allclose(mprev, qx)
+    kernel = getattr(check, 'kernel', None)
+    assert sol.run_until_steady(1e-4, check_every=50, moments=[QX, QY]) < 1e-4
+    assert list(sol._residuals) == [(QX, QY)]
+    if check.in_kernel:
+        # the kernel is bound once and the module is shared by the residuals
+        assert check.kernel is kernel
+        assert list(check.weights) == [0, 1, 1]
+        sol.run_until_steady(1e-4, check_every=50, moments=[QX])
+        assert sol._residuals[(QX,)].kernel.function is kernel.function
+    sol.run(50)
+    assert np.linalg.norm(sol.m[QX] - qx) < 1e-3*np.linalg.norm(qx)
+
+
+@pytest.mark.parametrize('algorithm', ['AAPatternAlgorithm', 'EsotericTwistAlgorithm'])
+def test_in_place_algorithm(cavity, assert_as_reference, algorithm):
+    lbm_algorithm = {'name': getattr(pylbm.algorithm, algorithm)}
+    sol = pylbm.Simulation(cavity(lbm_algorithm=lbm_algorithm))
+    sol.run(19)
+    sol.one_time_step()
+    assert sol.container.F.array is sol.container.Fnew.array
+    assert_as_reference(sol)
+
+
+def test_openmp_threads(cavity, assert_as_reference, tmpdir):
+    sol = pylbm.Simulation(cavity('cython', num_threads=2, codegen_dir=str(tmpdir)))
+    assert sol.generator.num_threads == 2
+    code = ''.join(source.read() for source in tmpdir.listdir('*.pyx'))
+    assert 'prange(' in code and 'num_threads=2' in code
+    assert '-fopenmp' in ''.join(build.read() for build in tmpdir.listdir('*.pyxbld'))
+    assert_as_reference(sol)
+
+
+def test_tiled_loops(cavity, assert_as_reference, tmpdir):
+    lbm_algorithm = {'name': pylbm.algorithm.PullAlgorithm, 'settings': {'tiles': [5, 3]}}
+    sol = pylbm.Simulation(cavity('cython', lbm_algorithm=lbm_algorithm, codegen_dir=str(tmpdir)))
+    code = ''.join(source.read() for source in tmpdir.listdir('*.pyx'))
+    # the tiles of the time step and the loops inside the tiles
+    assert 'for ixt_ in range(1, nx - 1, 5):' in code
+    assert 'for iyt_ in range(1, ny - 1, 3):' in code
+    assert 'for iy_ in range(iyt_, min(ny - 1, iyt_ + 3)):' in code
+    assert_as_reference(sol)
+
+
+def d3q19_cavity(**kwargs):
+    """
+    dictionary of a lid driven cavity with a D3Q19 scheme on 12x12x12 points,
+    the other keys of the dictionary are given by kwargs
+    """
+    Z = sp.symbols('Z')
+    QZ = sp.symbols('qz')
+
+    def bc_lid(f, m, x, y, z):
+        m[QX] = 0.05
+
+    s = 1.5
+    dico = {
+        'parameters': {LA: 1.},
+        'box': {'x': [0., 1.], 'y': [0., 1.], 'z': [0., 1.],
+                'label': [0, 0, 0, 0, 0, 1]},
+        'space_step': 1./12,
+        'scheme_velocity': LA,
+        'schemes': [
+            {
+                'velocities': list(range(19)),
+                'conserved_moments': [RHO, QX, QY, QZ],
+                'polynomials': [1, X, Y, Z,
+                                X**2, Y**2, Z**2, X*Y, Y*Z, Z*X,
+                                X**2*Y, X**2*Z, Y**2*X, Y**2*Z, Z**2*X, Z**2*Y,
+                                X**2*Y**2, Y**2*Z**2, Z**2*X**2],
+                'relaxation_parameters': [0, 0, 0, 0] + [s]*15,
+                'equilibrium': [RHO, QX, QY, QZ,
+                                RHO/3 + QX**2, RHO/3 + QY**2, RHO/3 + QZ**2,
+                                QX*QY, QY*QZ, QZ*QX,
+                                QY/3, QZ/3, QX/3, QZ/3, QX/3, QY/3,
+                                RHO/9, RHO/9, RHO/9],
+            },
+        ],
+        'init': {RHO: 1., QX: 0., QY: 0., QZ: 0.},
+        'boundary_conditions': {
+            0: {'method': {0: pylbm.bc.BounceBack}},
+            1: {'method': {0: pylbm.bc.BounceBack}, 'value': bc_lid},
+        },
+        'generator': 'cython',
+    }
+    dico.update(kwargs)
+    return dico
+
+
+@pytest.mark.parametrize('tiles', [[8, 4, 0], [8, 4, None]])
+def test_tiled_loops_3d(tmpdir, tiles):
+    reference = pylbm.Simulation(d3q19_cavity())
+    lbm_algorithm = {'name': pylbm.algorithm.PullAlgorithm, 'settings': {'tiles': tiles}}
+    sol = pylbm.Simulation(d3q19_cavity(lbm_algorithm=lbm_algorithm, codegen_dir=str(tmpdir)))
+    code = ''.join(source.read() for source in tmpdir.listdir('*.pyx'))
+    # x and y are split in tiles, z is not split
+    assert 'for ixt_ in range(1, nx - 1, 8):' in code
+    assert 'for ix_ in range(ixt_, min(nx - 1, ixt_ + 8)):' in code
+    assert 'for iyt_ in range(1, ny - 1, 4):' in code
+    assert 'for iy_ in range(iyt_, min(ny - 1, iyt_ + 4)):' in code
+    assert 'izt_' not in code
+    assert 'for iz_ in range(1, nz - 1):' in code
+    reference.run(10)
+    sol.run(10)
+    assert np.array_equal(sol.container.F.array, reference.container.F.array)
+
+
+@pytest.mark.parametrize('sorder', [None, [2, 0, 1]])
+def test_matrix_product(cavity, assert_as_reference, sorder):
+    lbm_algorithm = {'name': pylbm.algorithm.PullAlgorithm, 'settings': {'matrix_product': True}}
+    sol = pylbm.Simulation(cavity(lbm_algorithm=lbm_algorithm), sorder=sorder)
+    # one product for f2m and one for m2f in the time step
+    products = {name: [node for statement in routine.statements
+                       for node in sp.preorder_traversal(statement)
+                       if isinstance(node, pylbm.generator.MatrixProduct)]
+                for name, routine in sol.generator.routines.items()}
+    assert len(products['one_time_step']) == 2
+    assert len(products['f2m']) == len(products['m2f']) == 1
+    assert_as_reference(sol)
+    kernel = sol.algo.kernels['one_time_step']
+    values = dict(zip(kernel.names, kernel.values))
+    assert np.allclose(values['f2m_matrix'], np.array(sol.algo.M.tolist(), dtype=float))
+
+
+def test_numba_generator(cavity, assert_as_reference, tmpdir):
+    pytest.importorskip('numba')
+    sol = pylbm.Simulation(cavity('numba', codegen_dir=str(tmpdir)))
+    # a python module is written: there is no C extension to build
+    assert len(tmpdir.listdir('*.py')) == 1 and not tmpdir.listdir('*.so')
+    assert_as_reference(sol)
+    for name in sol.generator.routines:
+        function = getattr(sol.generator.module, name)
+        assert function.targetoptions['nopython']
+    assert sol.generator.module.one_time_step.signatures
+
+
+def test_numba_threads(cavity, assert_as_reference, tmpdir, monkeypatch):
+    numba = pytest.importorskip('numba')
+    sol = pylbm.Simulation(cavity('numba', codegen_dir=str(tmpdir), num_threads=1))
+    # the setting of numba is global: it is not changed by the module
+    code = tmpdir.listdir('*.py')[0].read()
+    assert 'set_num_threads' not in code
+    threads = numba.get_num_threads()
+    calls = []
+    set_num_threads = numba.set_num_threads
+    monkeypatch.setattr(numba, 'set_num_threads',
+                        lambda n: calls.append(n) or set_num_threads(n))
+    assert_as_reference(sol)
+    # the number of threads is set around each call and restored after
+    assert calls[:2] == [1, threads]
+    assert numba.get_num_threads() == threads
+
+    with pytest.raises(SystemExit):
+        pylbm.Simulation(cavity('numba', num_threads=numba.config.NUMBA_NUM_THREADS + 1))
+
+
+def test_aosoa_storage(cavity, assert_as_reference, reference):
+    sol = pylbm.Simulation(cavity('cython', aosoa=4))
+    # blocks of 4 points with the 9 velocities inside
+    assert sol.container.F.array.shape[-2:] == (9, 4)
+    assert_as_reference(sol)
+    assert np.allclose(sol.F[3], reference.F[3])
+
+
+def test_kernel_cost(cavity):
+    sol = pylbm.Simulation(cavity())
+    flops, nbytes = sol.algo.generator.cost('one_time_step')
+    # f and fnew, and the moments which are an array with numpy
+    assert nbytes == 4*9*8
+    assert flops > 0
+
+    monitoring = pylbm.monitoring.Monitoring()
+    monitoring.set_size(100)
+    kernel = sol.algo.generator.module.one_time_step
+    monitoring.set_cost(kernel, flops, nbytes)
+    monitoring.start_timing(kernel)
+    monitoring.stop_timing(kernel)
+    report = list(monitoring.roofline().values())
+    assert len(report) == 1
+    assert report[0]['flops'] == flops
+    assert report[0]['intensity'] == pytest.approx(flops/nbytes)
+
+
+def test_kernel_nodes(cavity, monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['pylbm', '--monitoring'])
+    lbm_algorithm = {'name': pylbm.algorithm.PullAlgorithm, 'settings': {'overlap': True}}
+    sol = pylbm.Simulation(cavity('cython', lbm_algorithm=lbm_algorithm))
+    monitor = pylbm.monitoring.Monitor
+    module = sol.algo.generator.module
+    for name in ['one_time_step_box', 'f2m']:
+        monitor.register(getattr(module, name))
+    box_nodes, f2m_nodes = monitor.nodes(module.one_time_step_box), monitor.nodes(module.f2m)
+
+    # the kernel is called on two boxes of 4x2 and 12x2 nodes
+    kernel = sol.algo.bind(sol, 'one_time_step_box')
+    kernel(ixmin=1, ixmax=5, iymin=1, iymax=3)
+    kernel(ixmin=5, ixmax=17, iymin=1, iymax=3)
+    assert monitor.nodes(module.one_time_step_box) == box_nodes + 32
+    report = monitor.roofline()[monitor.information(module.one_time_step_box)]
+    assert report['GB/s'] == pytest.approx(report['nodes']*report['bytes']/report['time']/1e9)
+
+    # f2m also runs over the halo points
+    sol.algo.call_function('f2m', sol)
+    assert monitor.nodes(module.f2m) == f2m_nodes + 18*18
+
+
+def test_boundary_workspace(cavity, assert_as_reference, monkeypatch):
+    def bc_up_time(f, m, t, x, y, driven_velocity):
+        m[RHO] = 1.
+        m[QX] = driven_velocity
+        m[QY] = 0.
+
+    def unbound_call(function, args):
+        raise AssertionError('the kernels of the workspace must be bound once')
+
+    dico = cavity()
+    dico['boundary_conditions'][1]['value'] = (bc_up_time, (0.05,))
+    dico['boundary_conditions'][1]['time_bc'] = True
+    sol = pylbm.Simulation(dico)
+    # the time dependent points of all the methods are packed together
+    npoints = sum(np.count_nonzero(method.ilabel == 1) for method in sol.bc.methods)
+    assert sol.bc.workspace.m.nspace[0] == npoints
+    monkeypatch.setattr(pylbm.symbolic, 'call_genfunction', unbound_call)
+    assert_as_reference(sol)
+
+
+def test_sparse_fluid_list(cavity, assert_as_reference):
+    lbm_algorithm = {'name': pylbm.algorithm.SparsePullAlgorithm}
+    sol = pylbm.Simulation(cavity(lbm_algorithm=lbm_algorithm))
+    assert sol.algo.fluid_nodes(sol.domain).shape == (16*16, 2)
+    assert_as_reference(sol)
+
+
+def test_sparse_porous(cavity):
+    def porous(lbm_algorithm):
+        dico = cavity('cython', lbm_algorithm=lbm_algorithm)
+        dico['elements'] = [pylbm.Circle([0.5, 0.5], 0.2, label=0),
+                            pylbm.Circle([0.2, 0.2], 0.1, label=0)]
+        return dico
+
+    sol = pylbm.Simulation(porous({'name': pylbm.algorithm.SparsePullAlgorithm}))
+    nfluid = sol.algo.fluid_nodes(sol.domain).shape[0]
+    assert nfluid < 16*16
+    # F is only stored on the fluid points and on the ghost points
+    npoints = sol.container.F.points.shape[0]
+    assert nfluid < npoints < 18*18
+    assert sol.container.F.array.shape == (npoints, 9)
+    neighbors = sol.algo.neighbor_nodes(sol.domain)
+    assert neighbors.shape == (9, nfluid)
+    assert 0 <= neighbors.min() and neighbors.max() < npoints
+
+    lbm_algorithm = {'name': pylbm.algorithm.PullAlgorithm, 'settings': {'check_isfluid': True}}
+    reference = pylbm.Simulation(porous(lbm_algorithm))
+    sol.run(20)
+    reference.run(20)
+    fluid = sol.domain.in_or_out[1:-1, 1:-1] == sol.domain.valin
+    for k in range(9):
+        assert np.allclose(sol.m[k], reference.m[k])
+        assert np.allclose(sol.F[k][fluid], reference.F[k][fluid])
+
+
+@pytest.mark.parametrize('generator', ['cython', 'numba'])
+def test_overlap(cavity, assert_as_reference, generator):
+    pytest.importorskip(generator)
+    lbm_algorithm = {'name': pylbm.algorithm.PullAlgorithm, 'settings': {'overlap': True}}
+    sol = pylbm.Simulation(cavity(generator, lbm_algorithm=lbm_algorithm))
+    # the interior box and the shell cover the 16x16 points once
+    interior, shell = sol._boxes
+    covered = np.zeros((18, 18), dtype=int)
+    for box in interior + shell:
+        covered[box['ixmin']:box['ixmax'], box['iymin']:box['iymax']] += 1
+    assert np.all(covered[1:-1, 1:-1] == 1) and covered.sum() == 16*16
+    assert interior == [{'ixmin': 2, 'ixmax': 16, 'iymin': 2, 'iymax': 16}]
+    assert_as_reference(sol)
+    assert 'one_time_step_box' in sol.algo.kernels
+    assert 'one_time_step' not in sol.algo.kernels
@@ -0,0 +1,201 @@
+"""
+test the storage of the distribution functions and of the moments
+"""
+
+import numpy as np
+import sympy as sp
+import pytest
+import mpi4py.MPI as mpi
+import pylbm
+from pylbm.storage import Array, CompactArray
+from pylbm.mpi_topology import MpiTopology
+
+RHO, QX, QY = sp.symbols('rho, qx, qy')
+
+
+@pytest.fixture
+def d2q9():
+    stencil = pylbm.Stencil({'dim': 2, 'schemes': [{'velocities': list(range(9))}]})
+    return stencil.get_all_velocities()
+
+
+def periodic_array(velocities=None, nbatch=None):
+    """
+    a 16x16 array of the 9 velocities on one periodic process
+    filled with random values in the inner points.
+    """
+    array = Array(9, [16, 16], [1, 1], mpi_topo=MpiTopology(2, [True, True]),
+                  velocities=velocities, nbatch=nbatch)
+    inner = array.array[..., 1:-1, 1:-1]
+    inner[...] = np.random.rand(*inner.shape)
+    return array
+
+
+def test_persistent_requests(d2q9):
+    array = periodic_array(d2q9)
+    array.update()
+    requests = array._get_requests()
+    assert all(isinstance(req, mpi.Prequest) for reqs in requests for req in reqs)
+    array.update()
+    # the requests are created once and started at each update
+    assert array._get_requests() is requests
+    assert list(array._requests) == [None]
+    halo_requests = array.start_update()
+    array.finish_update(halo_requests)
+    assert array.start_update() is halo_requests
+    array.finish_update(halo_requests)
+
+
+def test_filtered_exchange(d2q9):
+    array = periodic_array(d2q9)
+    full = periodic_array()
+    itemsize = array.array.itemsize
+    for send, recv, full_send in zip(array.send_type, array.recv_type, full.send_type):
+        # one line of 18 points and only 3 of the 9 velocities cross a face
+        assert send.Get_size() == recv.Get_size() == 3*18*itemsize
+        assert full_send.Get_size() == 9*18*itemsize
+
+    array.update()
+    inner = array.array[:, 1:-1, 1:-1]
+    # the left ghost points only receive the velocities going to the right
+    right = d2q9[:, 0] > 0
+    assert np.all(array.array[right, 0, 1:-1] == inner[right, -1, :])
+    assert np.all(array.array[~right, 0, 1:-1] == 0)
+    # the upper ghost points only receive the velocities going down
+    down = d2q9[:, 1] < 0
+    assert np.all(array.array[down, 1:-1, -1] == inner[down, :, 0])
+    assert np.all(array.array[~down, 1:-1, -1] == 0)
+    # without the velocities all of them are exchanged
+    full.update()
+    assert np.all(full.array[:, 0, 1:-1] == full.array[:, -2, 1:-1])
+
+
+def test_compact_exchange(d2q9):
+    dense = periodic_array(d2q9)
+    # the points of a disk are not stored
+    x, y = np.meshgrid(np.arange(18), np.arange(18), indexing='ij')
+    stored = (x - 8)**2 + (y - 8)**2 > 16
+    compact = CompactArray(9, [18, 18], [1, 1], np.argwhere(stored),
+                           mpi_topo=MpiTopology(2, [True, True]), velocities=d2q9)
+    assert compact.array.shape == (9, np.count_nonzero(stored))
+    compact[:] = dense[:]
+    assert np.array_equal(compact[:], np.where(stored, dense[:], 0))
+
+    # the same values as the exchange of the whole grid
+    dense.update()
+    compact.update()
+    assert np.array_equal(compact[:], np.where(stored, dense[:], 0))
+    nodes = np.nonzero(stored)
+    assert np.array_equal(compact[(slice(None),) + nodes], dense[(slice(None),) + nodes])
+
+
+def test_ensemble(cavity):
+    velocities = np.array([0.02, 0.05])
+
+    def bc_up_ensemble(f, m, x, y):
+        m[RHO] = 1.
+        m[QX] = velocities[:, np.newaxis, np.newaxis]
+        m[QY] = 0.
+
+    dico = cavity(ensemble=velocities.size)
+    dico['boundary_conditions'][1]['value'] = bc_up_ensemble
+    sol = pylbm.Simulation(dico)
+    # the members are the slowest dimension of the storage
+    assert sol.container.nbatch == 2
+    assert sol.container.F.array.shape == (2, 9, 18, 18)
+    assert sol.m[RHO].shape == (2, 16, 16)
+    sol.run(20)
+    for i, velocity in enumerate(velocities):
+        dico = cavity()
+        bc_up, _ = dico['boundary_conditions'][1]['value']
+        dico['boundary_conditions'][1]['value'] = (bc_up, (velocity,))
+        member = pylbm.Simulation(dico)
+        member.run(20)
+        for moment in [RHO, QX, QY]:
+            assert np.allclose(sol.m[moment][i], member.m[moment])
+
+
+def test_ensemble_exchange(d2q9):
+    array = periodic_array(d2q9, nbatch=2)
+    assert array.array.shape == (2, 9, 18, 18)
+    array.update()
+    # all the members are exchanged by the same messages
+    right = d2q9[:, 0] > 0
+    assert np.all(array.array[:, right, 0, 1:-1] == array.array[:, right, -2, 1:-1])
+    assert not np.array_equal(array.array[0, right, 0], array.array[1, right, 0])
+
+
+class DeviceArray:
+    """
+    a device array which records the transfers
+    """
+    def __init__(self, values, transfers):
+        self.values = values
+        self.transfers = transfers
+
+    def __getitem__(self, key):
+        return DeviceArray(self.values[key], self.transfers)
+
+    def get(self):
+        self.transfers.append(('get', self.values.shape))
+        return self.values.copy()
+
+    def set(self, values):
+        self.transfers.append(('set', self.values.shape))
+        self.values[...] = values
+
+
+def device_array(sorder=None):
+    array = Array(9, [16, 16], [1, 1], sorder=sorder, mpi_topo=MpiTopology(2, [True, True]))
+    array.gpu_support = True
+    transfers = []
+    array.array = DeviceArray(np.random.rand(*array.array_cpu.shape), transfers)
+    return array, transfers
+
+
+def test_lazy_device_sync():
+    array, transfers = device_array()
+    assert array._velocity_axis() == 0
+    device = array.array.values
+    array.modified_on_device()
+    assert array._host_stale.all()
+    # only the velocity read is transferred to the host
+    assert np.array_equal(array[2], device[2])
+    assert transfers == [('get', (1, 18, 18))]
+    assert np.flatnonzero(~array._host_stale).tolist() == [2]
+    array[2]
+    assert len(transfers) == 1
+
+    # only the velocity written is transferred to the device
+    array[4] = 1.
+    assert transfers[1:] == [('get', (1, 18, 18))]
+    assert np.flatnonzero(array._device_stale).tolist() == [4]
+    array.sync_device()
+    assert transfers[2:] == [('set', (1, 18, 18))]
+    assert np.all(device[4] == 1.) and not array._device_stale.any()
+    array.sync_device()
+    assert len(transfers) == 3
+
+
+def test_lazy_device_sync_interleaved():
+    array, transfers = device_array(sorder=[2, 0, 1])
+    assert array._velocity_axis() != 0
+    device = array.array.values
+    array.array_cpu[...] = -1
+    array.modified_on_device()
+    array._host_stale[[0, 1]] = False
+    # the whole array is read but only the stale velocities are copied
+    array.sync_host()
+    assert transfers == [('get', device.shape)]
+    assert np.all(array[0] == -1)
+    assert np.array_equal(array[5], np.transpose(device, array.index)[5])
+    assert not array._host_stale.any()
+
+
+def test_lazy_device_sync_loopy(cavity, assert_as_reference):
+    pytest.importorskip('loopy')
+    sol = pylbm.Simulation(cavity('loopy'))
+    assert_as_reference(sol)
+    # only the moments read above have been transferred to the host
+    stale = sol.container.m._host_stale
+    assert not stale[:3].any() and stale[3:].all()